@@ -0,0 +1,162 @@
+import glob
+import logging
+import os
+import zipfile
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from binance.sorted_book import SortedOrderBook
+
+INT64_MAX = np.iinfo(np.int64).max
+
+
+class SymbolSnapshotBuffer:
+    """Preallocated arrays holding one hour of top-of-book samples for one symbol."""
+
+    def __init__(self, depth: int, capacity: int, price_decimals: int = 8, quantity_decimals: int = 8):
+        self.timestamps = np.zeros(capacity, dtype=np.int64)  # epoch milliseconds
+        self.bid_prices = np.zeros((capacity, depth), dtype=np.int64)
+        self.bid_quantities = np.zeros((capacity, depth), dtype=np.int64)
+        self.ask_prices = np.zeros((capacity, depth), dtype=np.int64)
+        self.ask_quantities = np.zeros((capacity, depth), dtype=np.int64)
+        self.rows = 0
+        self.hour: Optional[datetime] = None
+        # Precision of the book the samples came from, needed to scale the integers back
+        self.price_decimals = price_decimals
+        self.quantity_decimals = quantity_decimals
+
+    @property
+    def full(self) -> bool:
+        return self.rows == len(self.timestamps)
+
+
+class L2SnapshotRecorder:
+    """
+    Samples the top N levels of order books into NumPy arrays of integer price
+    ticks and quantity units, and writes one compressed .npz file per symbol per
+    hour under directory/SYMBOL/. Missing levels are stored as zeros.
+    """
+
+    def __init__(self, directory: str, depth: int = 20, interval: float = 1.0):
+        self.directory = directory
+        self.depth = depth
+        self.interval = interval
+        self.capacity = int(3600 / interval) + 1
+        self.buffers: Dict[str, SymbolSnapshotBuffer] = {}
+
+    def record(self, symbol: str, book: SortedOrderBook, now: float) -> Optional[SymbolSnapshotBuffer]:
+        """
+        Append one sample of a book.
+
+        Returns:
+            SymbolSnapshotBuffer: A finished buffer that should be passed to write(), if the hour rolled over
+        """
+        hour = datetime.fromtimestamp(now - now % 3600, tz=timezone.utc)
+        buffer = self.buffers.get(symbol)
+        finished = None
+        if (buffer is None or buffer.hour != hour or buffer.full
+                or (buffer.price_decimals, buffer.quantity_decimals) != (book.price_decimals, book.quantity_decimals)):
+            if buffer is not None and buffer.rows:
+                finished = buffer
+            buffer = SymbolSnapshotBuffer(self.depth, self.capacity, book.price_decimals, book.quantity_decimals)
+            buffer.hour = hour
+            self.buffers[symbol] = buffer
+
+        row = buffer.rows
+        buffer.timestamps[row] = int(now * 1000)
+        bids = book.bids.prices[:-self.depth - 1:-1]
+        asks = book.asks.prices[:self.depth]
+        for i, price in enumerate(bids):
+            buffer.bid_prices[row, i] = price
+            buffer.bid_quantities[row, i] = min(book.bids.quantities[price], INT64_MAX)
+        for i, price in enumerate(asks):
+            buffer.ask_prices[row, i] = price
+            buffer.ask_quantities[row, i] = min(book.asks.quantities[price], INT64_MAX)
+        buffer.rows += 1
+        return finished
+
+    def write(self, symbol: str, buffer: SymbolSnapshotBuffer) -> str:
+        """Write a buffer to its hourly file, adding a part suffix if the hour already has one."""
+        symbol_dir = os.path.join(self.directory, symbol)
+        os.makedirs(symbol_dir, exist_ok=True)
+        base = f"{symbol}_{buffer.hour.strftime('%Y-%m-%d_%H')}"
+        part = 0
+        path = os.path.join(symbol_dir, f"{base}.npz")
+        while os.path.exists(path):
+            part += 1
+            path = os.path.join(symbol_dir, f"{base}.{part}.npz")
+
+        rows = buffer.rows
+        np.savez_compressed(
+            path,
+            timestamps=buffer.timestamps[:rows],
+            bid_prices=buffer.bid_prices[:rows],
+            bid_quantities=buffer.bid_quantities[:rows],
+            ask_prices=buffer.ask_prices[:rows],
+            ask_quantities=buffer.ask_quantities[:rows],
+            price_decimals=np.int64(buffer.price_decimals),
+            quantity_decimals=np.int64(buffer.quantity_decimals),
+        )
+        logging.info(f"Wrote {rows} L2 samples to {path}")
+        return path
+
+    def flush(self, now: float) -> List:
+        """Detach the buffers of every hour that has ended, including those of symbols no longer sampled."""
+        hour = datetime.fromtimestamp(now - now % 3600, tz=timezone.utc)
+        finished = [(symbol, buffer) for symbol, buffer in self.buffers.items() if buffer.hour < hour]
+        for symbol, _ in finished:
+            del self.buffers[symbol]
+        return [(symbol, buffer) for symbol, buffer in finished if buffer.rows]
+
+    def drain(self) -> List:
+        """Detach every partially filled buffer, e.g. on shutdown."""
+        buffers = [(symbol, buffer) for symbol, buffer in self.buffers.items() if buffer.rows]
+        self.buffers = {}
+        return buffers
+
+
+def _memory_map_npz(path: str) -> Dict[str, np.ndarray]:
+    """Extract an .npz once into a sibling directory of .npy files and memory-map them."""
+    cache_dir = path[:-len('.npz')] + '.npy.d'
+    if not os.path.isdir(cache_dir):
+        tmp_dir = cache_dir + '.tmp'
+        os.makedirs(tmp_dir, exist_ok=True)
+        with zipfile.ZipFile(path) as archive:
+            archive.extractall(tmp_dir)
+        os.replace(tmp_dir, cache_dir)
+    return {
+        name[:-len('.npy')]: np.load(os.path.join(cache_dir, name), mmap_mode='r')
+        for name in os.listdir(cache_dir) if name.endswith('.npy')
+    }
+
+
+def load_l2_snapshots(directory: str, symbol: str, start: datetime = None, end: datetime = None,
+                      mmap: bool = True) -> List[Dict[str, np.ndarray]]:
+    """
+    Load the hourly L2 sample files of a symbol, oldest first.
+
+    Args:
+        directory: Root directory the recorder wrote to
+        symbol: Symbol, e.g. BTCUSDT
+        start: Only include hours starting at or after this time (UTC)
+        end: Only include hours starting before this time (UTC)
+        mmap: Memory-map the arrays (decompressing each file once to a cache) instead of loading them into RAM
+
+    Returns:
+        List[Dict]: One dict of arrays per file with timestamps, bid/ask prices and
+        quantities (rows x depth) and the decimals needed to scale them
+    """
+    results = []
+    for path in sorted(glob.glob(os.path.join(directory, symbol, f"{symbol}_*.npz"))):
+        hour_str = os.path.basename(path)[len(symbol) + 1:].split('.')[0]
+        hour = datetime.strptime(hour_str, '%Y-%m-%d_%H').replace(tzinfo=timezone.utc)
+        if (start and hour < start.replace(minute=0, second=0, microsecond=0)) or (end and hour >= end):
+            continue
+        if mmap:
+            results.append(_memory_map_npz(path))
+        else:
+            with np.load(path) as data:
+                results.append({name: data[name] for name in data.files})
+    return results
@@ -0,0 +1,363 @@
+import asyncio
+import json
+import logging
+import time
+import datetime
+from collections import deque
+from pprint import pformat
+from typing import Dict, List, Optional
+
+import aiohttp
+import websockets
+from prometheus_client import start_http_server, Counter, Histogram
+from pymongo import UpdateOne
+
+from binance.sorted_book import SortedOrderBook
+from binance.l2_snapshots import L2SnapshotRecorder
+from service.async_mongo import AsyncMongoDBHelper
+from service.rate_limiter import RateLimiter, SHARED_LIMITER
+
+BINANCE_REST_URL = "https://api.binance.com"
+BINANCE_STREAM_URL = "wss://stream.binance.com:9443/stream"
+DEPTH_LIMIT = 1000
+DEPTH_WEIGHT = 50  # request weight of /api/v3/depth for limits 501-1000
+DIFF_BUFFER_SIZE = 5000
+ORDER_BOOK_STATS = "order_book_stats"
+
+# Liquidity bands as percent of mid, with the suffix used in stats field names
+DEPTH_BANDS = ((0.1, "0_1pct"), (0.5, "0_5pct"), (1.0, "1pct"), (2.0, "2pct"))
+
+# Prometheus metrics
+RESYNCS_TOTAL = Counter('binance_order_book_resyncs_total', 'Order book resyncs after a depth gap', ['symbol'])
+RESYNC_SECONDS = Histogram('binance_order_book_resync_seconds', 'Time to resync an order book', ['symbol'])
+
+
+class MinuteBookStats:
+    """
+    Time-weighted per-minute aggregates of one order book.
+
+    The book is sampled after every applied diff; each sample is weighted by how
+    long it stayed current. Finished minutes queue up in `completed` until written.
+    """
+
+    def __init__(self, symbol: str):
+        self.symbol = symbol
+        self.minute_start: Optional[float] = None
+        self.sampled_at: Optional[float] = None
+        self.state: Optional[Dict[str, float]] = None
+        self.completed: List[Dict] = []
+        self._reset_sums()
+
+    def _reset_sums(self) -> None:
+        self.weighted: Dict[str, float] = {}
+        self.weight = 0.0
+        self.max_spread: Optional[float] = self.state['spread'] if self.state else None
+
+    def _accumulate(self, now: float) -> None:
+        if self.state is not None and self.sampled_at is not None and now > self.sampled_at:
+            elapsed = now - self.sampled_at
+            for key, value in self.state.items():
+                self.weighted[key] = self.weighted.get(key, 0.0) + value * elapsed
+            self.weight += elapsed
+        self.sampled_at = now
+
+    def roll(self, now: float) -> None:
+        """Close every minute that ended before now."""
+        if self.minute_start is None:
+            self.minute_start = now - now % 60
+            return
+        while now >= self.minute_start + 60:
+            minute_end = self.minute_start + 60
+            self._accumulate(minute_end)
+            if self.weight > 0:
+                self.completed.append(self._finish_minute())
+            self.minute_start = minute_end
+            self._reset_sums()
+
+    def _finish_minute(self) -> Dict:
+        averages = {key: value / self.weight for key, value in self.weighted.items()}
+        document = {
+            'symbol': self.symbol,
+            'time': datetime.datetime.fromtimestamp(self.minute_start, tz=datetime.timezone.utc),
+            'avg_spread': averages['spread'],
+            'max_spread': self.max_spread,
+            'avg_mid': averages['mid'],
+            'last_mid': self.state['mid'] if self.state else None,
+            'covered_seconds': self.weight,
+        }
+        for _, suffix in DEPTH_BANDS:
+            bid_volume = averages[f'bid_volume_{suffix}']
+            ask_volume = averages[f'ask_volume_{suffix}']
+            document[f'bid_volume_{suffix}'] = bid_volume
+            document[f'ask_volume_{suffix}'] = ask_volume
+            document[f'imbalance_{suffix}'] = averages[f'imbalance_{suffix}']
+        return document
+
+    def sample(self, book: SortedOrderBook, now: float) -> None:
+        """Record the book state that is current from now on."""
+        self.roll(now)
+        self._accumulate(now)
+        best_bid, best_ask = book.best_bid, book.best_ask
+        if best_bid is None or best_ask is None:
+            self.state = None
+            return
+
+        spread = best_ask - best_bid
+        state = {'spread': spread, 'mid': (best_bid + best_ask) / 2}
+        for band_pct, suffix in DEPTH_BANDS:
+            bid_volume, ask_volume = book.band_volumes(band_pct)
+            total = bid_volume + ask_volume
+            state[f'bid_volume_{suffix}'] = bid_volume
+            state[f'ask_volume_{suffix}'] = ask_volume
+            state[f'imbalance_{suffix}'] = (bid_volume - ask_volume) / total if total else 0.0
+        self.state = state
+        if self.max_spread is None or spread > self.max_spread:
+            self.max_spread = spread
+
+    def invalidate(self, now: float) -> None:
+        """Stop weighting the last state, e.g. while the book resyncs."""
+        self.roll(now)
+        self._accumulate(now)
+        self.state = None
+
+
+class SymbolBook:
+    """
+    Order book and sync state for one symbol, following Binance's documented
+    procedure: buffer diffs from connect, load a snapshot, drop stale diffs and
+    apply the rest, and start over whenever a diff does not continue the book.
+    """
+
+    def __init__(self, symbol: str):
+        self.symbol = symbol
+        self.book = SortedOrderBook()
+        self.last_update_id: Optional[int] = None
+        self.buffer = deque(maxlen=DIFF_BUFFER_SIZE)
+        self.minute_stats = MinuteBookStats(symbol)
+
+    @property
+    def synced(self) -> bool:
+        return self.last_update_id is not None
+
+    def reset(self) -> None:
+        self.book = SortedOrderBook()
+        self.last_update_id = None
+        self.buffer.clear()
+        self.minute_stats.invalidate(time.time())
+
+    def on_diff(self, update: Dict) -> bool:
+        """
+        Apply a diff, or buffer it while no snapshot is loaded.
+
+        Returns:
+            bool: False if the diff left a gap and the book needs a new snapshot
+        """
+        if self.last_update_id is None:
+            self.buffer.append(update)
+            return True
+        if update['u'] <= self.last_update_id:
+            return True  # already contained in the snapshot
+        if update['U'] > self.last_update_id + 1:
+            logging.warning(f"{self.symbol} depth gap: expected {self.last_update_id + 1}, got {update['U']}")
+            self.reset()
+            self.buffer.append(update)
+            return False
+
+        self.book.apply_update(update)
+        self.last_update_id = update['u']
+        return True
+
+    def load_snapshot(self, snapshot: Dict) -> bool:
+        """
+        Load a REST snapshot and replay the buffered diffs on top of it.
+
+        Returns:
+            bool: False if the snapshot is older than the buffered diffs or the
+            buffer has a gap, so a new snapshot is needed
+        """
+        last_update_id = snapshot['lastUpdateId']
+        if self.buffer and self.buffer[0]['U'] > last_update_id + 1:
+            return False
+
+        self.book.load_snapshot(snapshot)
+        self.last_update_id = last_update_id
+        buffered, self.buffer = self.buffer, deque(maxlen=DIFF_BUFFER_SIZE)
+        synced = True
+        for update in buffered:
+            # A gap resets the book like one in the live stream; the remaining diffs buffer again
+            if not self.on_diff(update):
+                RESYNCS_TOTAL.labels(symbol=self.symbol).inc()
+                synced = False
+        return synced
+
+
+class MultiOrderBookManager:
+    """
+    Tracks many Binance order books in one process.
+
+    Symbols are sharded across combined @depth@100ms stream connections, and all
+    REST snapshots share one HTTP session and the api.binance.com request weight budget.
+    """
+
+    def __init__(self, symbols: List[str], mongo_helper: AsyncMongoDBHelper = None,
+                 stats_collection: str = ORDER_BOOK_STATS, symbols_per_connection: int = 100,
+                 metrics_port: int = 8002, snapshot_recorder: L2SnapshotRecorder = None,
+                 rate_limiter: RateLimiter = None):
+        self.books: Dict[str, SymbolBook] = {symbol.upper(): SymbolBook(symbol.upper()) for symbol in symbols}
+        self.mongo_helper = mongo_helper
+        self.stats_collection = stats_collection
+        self.symbols_per_connection = symbols_per_connection
+        self.snapshot_recorder = snapshot_recorder
+        self.metrics_port = metrics_port
+        self.reconnect_delay = 3
+        self.sync_tasks: Dict[str, asyncio.Task] = {}
+        self.rate_limiter = rate_limiter or SHARED_LIMITER
+        self.session: Optional[aiohttp.ClientSession] = None
+
+    def shards(self) -> List[List[str]]:
+        symbols = list(self.books)
+        return [symbols[i:i + self.symbols_per_connection]
+                for i in range(0, len(symbols), self.symbols_per_connection)]
+
+    async def fetch_depth_snapshot(self, symbol: str) -> Optional[Dict]:
+        url = f"{BINANCE_REST_URL}/api/v3/depth"
+        snapshot = await self.rate_limiter.get_json(self.session, url, {'symbol': symbol, 'limit': DEPTH_LIMIT},
+                                                    weight=DEPTH_WEIGHT)
+        if snapshot is None:
+            logging.error(f"Failed to fetch {symbol} snapshot")
+            return None
+        if 'lastUpdateId' not in snapshot:
+            logging.error(f"{symbol} snapshot missing 'lastUpdateId'")
+            return None
+        return snapshot
+
+    async def sync_book(self, symbol_book: SymbolBook) -> None:
+        """Snapshot a book while its diffs keep buffering, retrying until it is in sync."""
+        started = time.monotonic()
+        while True:
+            snapshot = await self.fetch_depth_snapshot(symbol_book.symbol)
+            if snapshot and symbol_book.load_snapshot(snapshot):
+                break
+            await asyncio.sleep(1 if snapshot else 5)
+        duration = time.monotonic() - started
+        RESYNC_SECONDS.labels(symbol=symbol_book.symbol).observe(duration)
+        logging.info(f"Synced {symbol_book.symbol} order book in {duration:.2f}s")
+
+    def start_sync(self, symbol_book: SymbolBook) -> None:
+        task = self.sync_tasks.get(symbol_book.symbol)
+        if task is None or task.done():
+            self.sync_tasks[symbol_book.symbol] = asyncio.create_task(self.sync_book(symbol_book))
+
+    def handle_depth_update(self, update: Dict) -> None:
+        symbol_book = self.books.get(update['s'])
+        if symbol_book is None:
+            return
+
+        if not symbol_book.on_diff(update):
+            # Only this book resyncs; the connection and its other books keep running
+            RESYNCS_TOTAL.labels(symbol=symbol_book.symbol).inc()
+            self.start_sync(symbol_book)
+            return
+
+        if symbol_book.synced:
+            symbol_book.minute_stats.sample(symbol_book.book, time.time())
+
+    async def manage_connection(self, symbols: List[str]) -> None:
+        streams = "/".join(f"{symbol.lower()}@depth@100ms" for symbol in symbols)
+        ws_url = f"{BINANCE_STREAM_URL}?streams={streams}"
+
+        while True:
+            try:
+                async with websockets.connect(ws_url, max_size=None) as websocket:
+                    logging.info(f"Connected depth stream for {len(symbols)} symbols")
+                    # Diffs buffer from here on while the snapshots are fetched
+                    for symbol in symbols:
+                        self.books[symbol].reset()
+                        self.start_sync(self.books[symbol])
+
+                    async for data in websocket:
+                        message = json.loads(data)
+                        self.handle_depth_update(message['data'])
+
+            except websockets.ConnectionClosed as e:
+                logging.error(f"WebSocket connection closed: {e}")
+            except Exception as e:
+                logging.error(f"Error: {e}")
+            finally:
+                for symbol in symbols:
+                    task = self.sync_tasks.pop(symbol, None)
+                    if task:
+                        task.cancel()
+                logging.info(f"Attempting to reconnect in {self.reconnect_delay} seconds...")
+                await asyncio.sleep(self.reconnect_delay)
+
+    async def update_database_periodically(self) -> None:
+        """Write every tracked symbol's finished minute shortly after each minute ends."""
+        while True:
+            now = time.time()
+            await asyncio.sleep(60 - now % 60 + 2)
+            await self.write_minute_stats(time.time() // 60 * 60)
+
+    async def write_minute_stats(self, minute_end: float) -> int:
+        """
+        Close the minutes that ended by minute_end and write them in one bulk write.
+
+        Returns:
+            int: Number of minute documents written
+        """
+        documents = []
+        for symbol_book in self.books.values():
+            symbol_book.minute_stats.roll(minute_end)
+            documents.extend(symbol_book.minute_stats.completed)
+            symbol_book.minute_stats.completed = []
+        if not documents:
+            return 0
+
+        if self.mongo_helper is None:
+            for document in documents:
+                logging.info(f"Minute stats: {pformat(document)}")
+            return 0
+
+        # Upserts keyed on (symbol, time) make rewrites of the same minute idempotent
+        operations = [
+            UpdateOne({'symbol': document['symbol'], 'time': document['time']}, {'$set': document}, upsert=True)
+            for document in documents
+        ]
+        try:
+            self.mongo_helper.set_collection(self.stats_collection)
+            await self.mongo_helper.bulk_write(operations)
+            logging.info(f"Wrote {len(operations)} minute stats to {self.stats_collection}")
+        except Exception as e:
+            logging.error(f"Error writing minute stats: {e}")
+            return 0
+        return len(operations)
+
+    async def record_snapshots_periodically(self) -> None:
+        """Sample every synced book at the recorder's cadence and write finished hours off the event loop."""
+        recorder = self.snapshot_recorder
+        try:
+            while True:
+                await asyncio.sleep(recorder.interval - time.time() % recorder.interval)
+                now = time.time()
+                # Hours that ended are written even for books that are not synced right now
+                finished = recorder.flush(now)
+                for symbol, symbol_book in self.books.items():
+                    if symbol_book.synced:
+                        buffer = recorder.record(symbol, symbol_book.book, now)
+                        if buffer is not None:
+                            finished.append((symbol, buffer))
+                for symbol, buffer in finished:
+                    await asyncio.to_thread(recorder.write, symbol, buffer)
+        finally:
+            for symbol, buffer in recorder.drain():
+                recorder.write(symbol, buffer)
+
+    async def run(self) -> None:
+        start_http_server(self.metrics_port)  # Prometheus will scrape metrics from this port
+        async with aiohttp.ClientSession() as session:
+            self.session = session
+            tasks = [self.manage_connection(shard) for shard in self.shards()]
+            tasks.append(self.update_database_periodically())
+            if self.snapshot_recorder:
+                tasks.append(self.record_snapshots_periodically())
+            await asyncio.gather(*tasks)
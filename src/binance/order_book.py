@@ -3,10 +3,14 @@ import json
 import aiohttp
 import websockets
 import logging
-import datetime
+import time
 from pprint import pformat
 import argparse
-from service.mongo import MongoConnector
+from service.mongo import MongoDBHelper
+from pymongo import UpdateOne
+from binance.multi_order_book import (SymbolBook, RESYNCS_TOTAL, RESYNC_SECONDS, BINANCE_REST_URL,
+                                      DEPTH_LIMIT, DEPTH_WEIGHT)
+from service.rate_limiter import SHARED_LIMITER
 
 # MongoDB Collections
 CRYPTO_COLL = "cryptos"
@@ -32,162 +36,117 @@ class OrderBookManager:
         self.crypto = crypto
         self.mongo_client = mongo_client
         self.symbol = None
-        self.min_stats = {}
-        self.current_minute = datetime.datetime.utcnow().minute
 
     async def initialize(self):
-        crypto_entity = self.mongo_client.find_one(CRYPTO_COLL, {"name": self.crypto.lower()})
+        self.mongo_client.set_collection(CRYPTO_COLL)
+        crypto_entity = self.mongo_client.find_one({"name": self.crypto.lower()})
         if not crypto_entity:
             raise ValueError(f"Cryptocurrency {self.crypto} not found in database")
         self.symbol = crypto_entity["symbol"] + "usdt"
-        self.order_book = {
-            'bids': {},
-            'asks': {}
-        }
+        self.symbol_book = SymbolBook(self.symbol.upper())
+
+    @property
+    def order_book(self):
+        return self.symbol_book.book
 
     async def fetch_depth_snapshot(self):
-        url = f"https://api.binance.com/api/v3/depth?symbol={self.symbol.upper()}&limit=1000"
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url) as response:
-                    if response.status != 200:
-                        logging.error(f"Failed to fetch snapshot: {response.status} - {await response.text()}")
-                        return None
-                    snapshot = await response.json()
-                    if 'lastUpdateId' not in snapshot:
-                        logging.error("Snapshot missing 'lastUpdateId'")
-                        return None
-                    return snapshot
-        except Exception as e:
-            logging.error(f"Exception during fetch: {e}")
+        url = f"{BINANCE_REST_URL}/api/v3/depth"
+        params = {'symbol': self.symbol.upper(), 'limit': DEPTH_LIMIT}
+        async with aiohttp.ClientSession() as session:
+            snapshot = await SHARED_LIMITER.get_json(session, url, params, weight=DEPTH_WEIGHT)
+        if snapshot is None:
+            logging.error("Failed to fetch snapshot")
+            return None
+        if 'lastUpdateId' not in snapshot:
+            logging.error("Snapshot missing 'lastUpdateId'")
             return None
+        return snapshot
 
-    def apply_update(self, update):
-        for bid in update.get('b', []):
-            price, qty = bid
-            if float(qty) == 0:
-                self.order_book['bids'].pop(price, None)
-            else:
-                self.order_book['bids'][price] = qty
-
-        for ask in update.get('a', []):
-            price, qty = ask
-            if float(qty) == 0:
-                self.order_book['asks'].pop(price, None)
-            else:
-                self.order_book['asks'][price] = qty
-
-    def calculate_order_book_stats(self):
-        best_bid = max(self.order_book['bids'], key=lambda x: float(x), default=None)
-        best_ask = min(self.order_book['asks'], key=lambda x: float(x), default=None)
-        total_bid_volume = sum(float(qty) for qty in self.order_book['bids'].values())
-        total_ask_volume = sum(float(qty) for qty in self.order_book['asks'].values())
-        num_bids = len(self.order_book['bids'])
-        num_asks = len(self.order_book['asks'])
-        current_time = datetime.datetime.now().replace(second=0, microsecond=0)
-        return {
-            'crypto_name': self.crypto,
-            'symbol': self.symbol,
-            'best_bid': float(best_bid) if best_bid else None,
-            'best_ask': float(best_ask) if best_ask else None,
-            'total_bid_volume': total_bid_volume,
-            'total_ask_volume': total_ask_volume,
-            'num_bids': num_bids,
-            'num_asks': num_asks,
-            'time': current_time
-        }
-
-    async def update_database_periodically(self, interval):
+    async def sync_order_book(self):
+        """Snapshot the book while diffs keep buffering, retrying until it is in sync."""
+        started = time.monotonic()
         while True:
-            if self.min_stats:
-                for stat in self.min_stats.values():
-                    # Uncomment and complete this section as needed
-                    # self.mongo_client.find_one_and_replace_or_insert(
-                    #     ORDER_BOOK_STATS,
-                    #     {"crypto_name": stat["crypto_name"], "time": stat["time"], "symbol": stat["symbol"]},
-                    #     stat, upsert=True
-                    # )
-                    logging.info(f"Updated database with the latest stats: {pformat(stat)}")
-            await asyncio.sleep(interval)
+            snapshot = await self.fetch_depth_snapshot()
+            if snapshot and self.symbol_book.load_snapshot(snapshot):
+                break
+            await asyncio.sleep(1 if snapshot else 5)
+        RESYNC_SECONDS.labels(symbol=self.symbol_book.symbol).observe(time.monotonic() - started)
+        logging.info('Order book synced from snapshot')
+
+    async def update_database_periodically(self):
+        """Write finished minutes shortly after each minute ends."""
+        minute_stats = self.symbol_book.minute_stats
+        while True:
+            await asyncio.sleep(60 - time.time() % 60 + 2)
+            minute_stats.roll(time.time() // 60 * 60)
+            documents, minute_stats.completed = minute_stats.completed, []
+            if not documents:
+                continue
+
+            operations = []
+            for stat in documents:
+                stat["crypto_name"] = self.crypto
+                operations.append(UpdateOne(
+                    {"crypto_name": stat["crypto_name"], "time": stat["time"], "symbol": stat["symbol"]},
+                    {"$set": stat}, upsert=True
+                ))
+            try:
+                self.mongo_client.set_collection(ORDER_BOOK_STATS)
+                await asyncio.to_thread(self.mongo_client.bulk_write, operations)
+                logging.info(f"Updated database with the latest stats: {pformat(documents[-1])}")
+            except Exception as e:
+                logging.error(f"Error writing minute stats: {e}")
 
     async def manage_order_book(self):
         await self.initialize()
 
+        db_task = None
+        sync_task = None
         while True:
             try:
-                snapshot = await self.fetch_depth_snapshot()
-                if not snapshot:
-                    logging.error("Failed to fetch initial snapshot.")
-                    await asyncio.sleep(5)
-                    continue
-
-                last_update_id = snapshot['lastUpdateId']
-                self.order_book['bids'] = {price: qty for price, qty in snapshot['bids']}
-                self.order_book['asks'] = {price: qty for price, qty in snapshot['asks']}
-                logging.info('Fetched initial order book snapshot')
-
                 ws_url = f"wss://stream.binance.com:9443/ws/{self.symbol.lower()}@depth"
                 async with websockets.connect(ws_url) as websocket:
                     logging.info('Connected to WebSocket')
-                    first_update = True
 
-                    db_task = asyncio.create_task(self.update_database_periodically(10))
+                    # Diffs buffer from connect while the snapshot is fetched
+                    self.symbol_book.reset()
+                    sync_task = asyncio.create_task(self.sync_order_book())
+                    db_task = asyncio.create_task(self.update_database_periodically())
 
                     while True:
                         data = await websocket.recv()
                         update = json.loads(data)
 
-                        if first_update and (update['U'] <= last_update_id + 1 and update['u'] >= last_update_id + 1):
-                            first_update = False
-                        if not first_update and update['U'] != last_update_id + 1:
+                        if not self.symbol_book.on_diff(update):
+                            # Resync the book without dropping the connection
+                            RESYNCS_TOTAL.labels(symbol=self.symbol_book.symbol).inc()
+                            if sync_task.done():
+                                sync_task = asyncio.create_task(self.sync_order_book())
+                            continue
+                        if not self.symbol_book.synced:
                             continue
 
-                        self.apply_update(update)
-                        last_update_id = update['u']
-                        stats = self.calculate_order_book_stats()
-
-                        if stats["time"] in self.min_stats:
-                            min_stat = self.min_stats[stats["time"]]
-                            min_stat["total_bid_volume"] += stats["total_bid_volume"]
-                            min_stat["total_ask_volume"] += stats["total_ask_volume"]
-                            min_stat["num_bids"] += stats["num_bids"]
-                            min_stat["num_asks"] += stats["num_asks"]
-
-                            if min_stat["best_bid"] < stats["best_bid"]:
-                                min_stat["best_bid"] = stats["best_bid"]
-
-                            if min_stat["best_ask"] > stats["best_ask"]:
-                                min_stat["best_ask"] = stats["best_ask"]
-                        else:
-                            self.min_stats[stats["time"]] = stats
-
-                        new_minute = datetime.datetime.utcnow().minute
-                        if new_minute != self.current_minute:
-                            logging.info(f"{pformat(self.min_stats)}")
-                            if len(self.min_stats) > 5:
-                                sorted_keys = sorted(self.min_stats)
-                                for key in sorted_keys[:-2]:
-                                    del self.min_stats[key]
-                                logging.warning("Cleaning service has finished")
-
-                            self.current_minute = new_minute
+                        self.symbol_book.minute_stats.sample(self.order_book, time.time())
 
             except websockets.ConnectionClosed as e:
                 logging.error(f"WebSocket connection closed: {e}")
             except Exception as e:
                 logging.error(f"Error: {e}")
             finally:
-                db_task.cancel()
+                for task in (sync_task, db_task):
+                    if task:
+                        task.cancel()
                 logging.info("Attempting to reconnect in 3 seconds...")
                 await asyncio.sleep(3)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--crypto", type=str, required=True, help="Provide the cryptocurrency symbol")
+    parser.add_argument("--db_name", type=str, default="bitpulse_v2", help="Database holding the cryptos collection")
     args = parser.parse_args()
 
     # MongoDB Client
-    mongo_client = MongoConnector()
+    mongo_client = MongoDBHelper(args.db_name)
     
     # Logger setup
     logger = logging.getLogger()
@@ -197,7 +156,4 @@ if __name__ == "__main__":
     logger.addHandler(ch)
 
     order_book_manager = OrderBookManager(args.crypto, mongo_client)
-    asyncio.run(order_book_manager.manage_order_book())
-
-
-# REQUIRES MODIFICATIONS
\ No newline at end of file
+    asyncio.run(order_book_manager.manage_order_book())
\ No newline at end of file
@@ -0,0 +1,227 @@
+from bisect import bisect_left, insort
+from typing import Dict, List, Optional, Tuple
+
+
+def to_units(value: str, decimals: int) -> int:
+    """Parse a decimal string such as "0.01230000" into an integer number of 10^-decimals units."""
+    whole, _, frac = value.partition('.')
+    units = int(whole or '0') * 10 ** decimals
+    if frac:
+        units += int(frac[:decimals].ljust(decimals, '0'))
+    return units
+
+
+class BookSide:
+    """One side of an order book: sorted integer price ticks with quantities and running totals."""
+
+    def __init__(self, is_bid: bool):
+        self.is_bid = is_bid
+        self.prices: List[int] = []  # ascending
+        self.quantities: Dict[int, int] = {}
+        self.total_quantity = 0
+
+    def __len__(self) -> int:
+        return len(self.prices)
+
+    def set(self, price: int, quantity: int) -> int:
+        """
+        Insert, update or (with quantity 0) delete a level.
+
+        Returns:
+            int: Change of the quantity resting at this price
+        """
+        old_quantity = self.quantities.get(price)
+        if quantity == 0:
+            if old_quantity is None:
+                return 0
+            del self.quantities[price]
+            del self.prices[bisect_left(self.prices, price)]
+            self.total_quantity -= old_quantity
+            return -old_quantity
+
+        if old_quantity is None:
+            insort(self.prices, price)
+            old_quantity = 0
+        self.quantities[price] = quantity
+        self.total_quantity += quantity - old_quantity
+        return quantity - old_quantity
+
+    def quantity_between(self, low: int, high: int) -> int:
+        """Exact quantity resting at prices in [low, high)."""
+        start = bisect_left(self.prices, low)
+        end = bisect_left(self.prices, high, start)
+        quantities = self.quantities
+        return sum(quantities[price] for price in self.prices[start:end])
+
+    def clear(self) -> None:
+        self.prices.clear()
+        self.quantities.clear()
+        self.total_quantity = 0
+
+    @property
+    def best(self) -> Optional[int]:
+        if not self.prices:
+            return None
+        return self.prices[-1] if self.is_bid else self.prices[0]
+
+
+class FenwickTree:
+    """Prefix sums over a fixed number of buckets with O(log n) updates and queries."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.tree = [0] * (size + 1)
+
+    def add(self, index: int, delta: int) -> None:
+        i = index + 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    def prefix_sum(self, count: int) -> int:
+        """Sum of the first count buckets."""
+        total = 0
+        i = count
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+
+class DepthBands:
+    """
+    Bid/ask volume within percentage bands around the mid price.
+
+    Quantities near an anchor price are summed into fixed-width price buckets
+    held in Fenwick trees, so a band query is two prefix sums plus a bisect into
+    the single bucket the band edge falls in. The window is rebuilt in O(levels)
+    only when the mid drifts more than the widest band away from the anchor.
+    """
+
+    def __init__(self, bids: BookSide, asks: BookSide, max_band_pct: float = 2.0, bucket_bps: float = 0.5):
+        self.sides = {True: bids, False: asks}
+        self.max_band = max_band_pct / 100
+        self.bucket_fraction = bucket_bps / 10000
+        self.anchor: Optional[int] = None
+
+    def reset(self) -> None:
+        self.anchor = None
+
+    def _anchor_at(self, mid: int) -> None:
+        # Cover the widest band plus the same distance again of mid drift
+        half_window = int(mid * self.max_band * 2) + 1
+        self.bucket_width = max(int(mid * self.bucket_fraction), 1)
+        self.low = mid - half_window
+        self.size = 2 * half_window // self.bucket_width + 1
+        self.anchor = mid
+        self.trees = {True: FenwickTree(self.size), False: FenwickTree(self.size)}
+        high = self.low + self.size * self.bucket_width
+        for is_bid, side in self.sides.items():
+            start = bisect_left(side.prices, self.low)
+            end = bisect_left(side.prices, high, start)
+            for price in side.prices[start:end]:
+                self.trees[is_bid].add((price - self.low) // self.bucket_width, side.quantities[price])
+
+    def on_change(self, is_bid: bool, price: int, delta: int) -> None:
+        if self.anchor is None:
+            return
+        bucket = (price - self.low) // self.bucket_width
+        if 0 <= bucket < self.size:
+            self.trees[is_bid].add(bucket, delta)
+
+    def _bucket(self, price: int) -> int:
+        return min(max((price - self.low) // self.bucket_width, 0), self.size - 1)
+
+    def volumes(self, mid: int, band_pct: float) -> Tuple[int, int]:
+        """
+        Returns:
+            Tuple[int, int]: Bid and ask quantity within band_pct percent of mid
+        """
+        if self.anchor is None or abs(mid - self.anchor) > self.anchor * self.max_band:
+            self._anchor_at(mid)
+        edge = int(mid * band_pct / 100)
+
+        # Bids priced at or above mid - edge
+        low = mid - edge
+        bucket = self._bucket(low)
+        bucket_end = self.low + (bucket + 1) * self.bucket_width
+        bid_tree = self.trees[True]
+        bid_volume = (bid_tree.prefix_sum(self.size) - bid_tree.prefix_sum(bucket + 1)
+                      + self.sides[True].quantity_between(low, bucket_end))
+
+        # Asks priced at or below mid + edge
+        high = mid + edge
+        bucket = self._bucket(high)
+        bucket_start = self.low + bucket * self.bucket_width
+        ask_volume = (self.trees[False].prefix_sum(bucket)
+                      + self.sides[False].quantity_between(bucket_start, high + 1))
+        return bid_volume, ask_volume
+
+
+class SortedOrderBook:
+    """
+    Order book keyed by integer price ticks.
+
+    Levels are kept sorted with bisect, and best prices, total volume and level
+    counts are maintained on every change, so reading stats is O(1).
+    """
+
+    def __init__(self, price_decimals: int = 8, quantity_decimals: int = 8):
+        self.price_decimals = price_decimals
+        self.quantity_decimals = quantity_decimals
+        self.price_scale = 10 ** price_decimals
+        self.quantity_scale = 10 ** quantity_decimals
+        self.bids = BookSide(is_bid=True)
+        self.asks = BookSide(is_bid=False)
+        self.bands = DepthBands(self.bids, self.asks)
+
+    def load_snapshot(self, snapshot: Dict) -> None:
+        """Replace the book with a REST depth snapshot."""
+        self.bids.clear()
+        self.asks.clear()
+        self.bands.reset()
+        self.apply_levels(snapshot.get('bids', []), snapshot.get('asks', []))
+
+    def apply_update(self, update: Dict) -> None:
+        """Apply a depth diff event ('b' and 'a' level lists)."""
+        self.apply_levels(update.get('b', []), update.get('a', []))
+
+    def apply_levels(self, bids: List, asks: List) -> None:
+        for levels, side in ((bids, self.bids), (asks, self.asks)):
+            for price, qty in levels:
+                price = to_units(price, self.price_decimals)
+                delta = side.set(price, to_units(qty, self.quantity_decimals))
+                if delta:
+                    self.bands.on_change(side.is_bid, price, delta)
+
+    @property
+    def best_bid(self) -> Optional[float]:
+        best = self.bids.best
+        return best / self.price_scale if best is not None else None
+
+    @property
+    def best_ask(self) -> Optional[float]:
+        best = self.asks.best
+        return best / self.price_scale if best is not None else None
+
+    @property
+    def total_bid_volume(self) -> float:
+        return self.bids.total_quantity / self.quantity_scale
+
+    @property
+    def total_ask_volume(self) -> float:
+        return self.asks.total_quantity / self.quantity_scale
+
+    @property
+    def mid_price(self) -> Optional[float]:
+        if self.bids.best is None or self.asks.best is None:
+            return None
+        return (self.bids.best + self.asks.best) / 2 / self.price_scale
+
+    def band_volumes(self, band_pct: float) -> Tuple[float, float]:
+        """Bid and ask volume within band_pct percent of the mid price."""
+        if self.bids.best is None or self.asks.best is None:
+            return 0.0, 0.0
+        mid = (self.bids.best + self.asks.best) // 2
+        bid_volume, ask_volume = self.bands.volumes(mid, band_pct)
+        return bid_volume / self.quantity_scale, ask_volume / self.quantity_scale
@@ -1,7 +1,8 @@
-import requests
 from typing import List, Dict
 from datetime import datetime
 
+from service.rate_limiter import fetch_json
+
 def get_binance_top_50_usdt_pairs() -> List[Dict]:
     url = "https://api.coingecko.com/api/v3/exchanges/binance/tickers"
     params = {
@@ -9,14 +10,13 @@ def get_binance_top_50_usdt_pairs() -> List[Dict]:
         "depth": "false"
     }
     
-    response = requests.get(url, params=params)
+    data = fetch_json(url, params)
     
-    if response.status_code == 200:
-        data = response.json()
+    if data is not None:
         usdt_pairs = [pair for pair in data['tickers'] if pair['target'] == 'USDT']
         return usdt_pairs[:50]
     else:
-        raise Exception(f"Failed to fetch data: HTTP {response.status_code}")
+        raise Exception(f"Failed to fetch data from {url}")
 
 def format_datetime(dt_string: str) -> str:
     dt = datetime.strptime(dt_string, "%Y-%m-%dT%H:%M:%S%z")
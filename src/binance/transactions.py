@@ -2,8 +2,12 @@ import asyncio
 import websockets
 import json
 import os
+import time
 from datetime import datetime, timezone
 from service.async_mongo import AsyncMongoDBHelper
+from service.trade_sequence import TradeSequenceTracker
+from service.top_of_book import TopOfBook
+from service.latest_prices import LatestPriceStore
 from bson import CodecOptions
 from prometheus_client import start_http_server, Counter, Gauge
 
@@ -12,10 +16,14 @@ TRANSACTIONS_TOTAL = Counter('binance_transactions_total', 'Total number of tran
 TRANSACTION_VALUE = Counter('binance_transaction_value_total', 'Total value of transactions', ['symbol', 'side'])
 PRICE_GAUGE = Gauge('binance_price', 'Current price', ['symbol'])
 BIG_TRANSACTIONS = Counter('binance_big_transactions_total', 'Number of big transactions', ['symbol', 'side'])
+MISSED_TRADES = Gauge('binance_missed_trades', 'Trades missed according to gaps in trade ids', ['symbol'])
+DUPLICATE_TRADES = Gauge('binance_duplicate_trades', 'Duplicate trades suppressed by trade id', ['symbol'])
 
 class BinanceWebSocket:
-    def __init__(self, pairs, mongo_helper: AsyncMongoDBHelper, stats_collection, big_transactions_collection):
+    def __init__(self, pairs, mongo_helper: AsyncMongoDBHelper, stats_collection, big_transactions_collection, stream_types=None, book_ticker=False):
         self.pairs = pairs
+        # Stream type per pair: "trade" (default) or "aggTrade" to merge fills at the same price and side
+        self.stream_types = stream_types or {}
         self.base_url = "wss://stream.binance.com:9443/ws"
         self.transactions = {}
         self.big_transactions = {}
@@ -28,10 +36,17 @@ class BinanceWebSocket:
         self.BIG_TRANSACTION_THRESHOLD = 10000  # $10,000 threshold for big transactions
         self.stats_collection = stats_collection
         self.big_transactions_collection = big_transactions_collection
+        # Latest price per symbol, mirrored to the latest_prices collection
+        self.latest_prices = LatestPriceStore(mongo_helper)
+        self.sequence_tracker = TradeSequenceTracker()
+        # Optional best bid/ask enrichment from @bookTicker on the same connection
+        self.top_of_book = TopOfBook(pairs) if book_ticker else None
         start_http_server(8000)  # Prometheus will scrape metrics from this port
 
     async def connect(self):
-        stream_names = [f"{pair.lower()}@trade" for pair in self.pairs]
+        stream_names = [f"{pair.lower()}@{self.stream_types.get(pair, 'trade')}" for pair in self.pairs]
+        if self.top_of_book:
+            stream_names += [f"{pair.lower()}@bookTicker" for pair in self.pairs]
         ws_url = f"{self.base_url}/{'/'.join(stream_names)}"
 
         retry_count = 0
@@ -100,8 +115,26 @@ class BinanceWebSocket:
 
     async def handle_message(self, message):
         try:
-            if 'e' in message and message['e'] == 'trade':
+            # bookTicker payloads carry no event type
+            if self.top_of_book and 'e' not in message and 'b' in message and 'a' in message:
+                self.top_of_book.update(message['s'], float(message['b']), float(message['a']))
+                return
+
+            if message.get('e') in ('trade', 'aggTrade'):
                 symbol = message['s']
+
+                # An aggTrade covers trade ids f..l, so count its underlying fills
+                if message['e'] == 'aggTrade':
+                    first_trade_id = int(message['f'])
+                    last_trade_id = int(message['l'])
+                else:
+                    first_trade_id = last_trade_id = int(message['t'])
+                fill_count = last_trade_id - first_trade_id + 1
+
+                # Drop trades re-received after a reconnect
+                if not self.sequence_tracker.observe(symbol, last_trade_id, first_trade_id):
+                    return
+
                 price = float(message['p'])
                 quantity = float(message['q'])
                 timestamp = int(message['T'])
@@ -127,12 +160,13 @@ class BinanceWebSocket:
                 self.transactions[symbol][trade_side].append({
                     'price': price,
                     'quantity': quantity,
+                    'count': fill_count,
                     'baseCurrency': base_currency,
                     'quoteCurrency': quote_currency
                 })
 
                 # Update Prometheus metrics
-                TRANSACTIONS_TOTAL.labels(symbol=symbol, side=trade_side).inc()
+                TRANSACTIONS_TOTAL.labels(symbol=symbol, side=trade_side).inc(fill_count)
                 TRANSACTION_VALUE.labels(symbol=symbol, side=trade_side).inc(transaction_value)
                 PRICE_GAUGE.labels(symbol=symbol).set(price)
 
@@ -163,6 +197,8 @@ class BinanceWebSocket:
             big_transaction_documents = []
             price_documents = []
             price_updates = {}  # Store latest prices for DATA collection
+            book_stats = self.top_of_book.close_interval(time.time()) if self.top_of_book else {}
+            sequence_counts = self.sequence_tracker.pop_interval_counts()
 
             for symbol, data in self.transactions.items():
                 output_data = {
@@ -186,18 +222,23 @@ class BinanceWebSocket:
                         total_quantity += side_quantity
                         total_value += side_value
                         output_data.update({
-                            f"{side}_count": len(trades),
+                            f"{side}_count": sum(trade['count'] for trade in trades),
                             f"{side}_total_quantity": side_quantity,
                             f"{side}_total_value": side_value,
                             f"{side}_min_price": min(trade['price'] for trade in trades),
                             f"{side}_max_price": max(trade['price'] for trade in trades),
                             f"{side}_avg_price": side_value / side_quantity,
                         })
-                        print(f"{symbol} {side}: {len(trades)} trades, total value: {side_value}")
+                        print(f"{symbol} {side}: {output_data[f'{side}_count']} trades, total value: {side_value}")
                     else:
                         print(f"{symbol} {side}: No trades")
 
                 if has_trades:
+                    missed_trades, duplicate_trades = sequence_counts.get(symbol, (0, 0))
+                    output_data["missed_trades"] = missed_trades
+                    output_data["duplicate_trades"] = duplicate_trades
+                    if symbol in book_stats:
+                        output_data.update(book_stats[symbol])
                     documents.append(output_data)
 
                     # Calculate weighted average price
@@ -235,6 +276,11 @@ class BinanceWebSocket:
                             "quoteCurrency": trade['quoteCurrency']
                         })
 
+            # Export sequence health per symbol
+            for symbol, missed in self.sequence_tracker.missed_total.items():
+                MISSED_TRADES.labels(symbol=symbol).set(missed)
+                DUPLICATE_TRADES.labels(symbol=symbol).set(self.sequence_tracker.duplicate_total[symbol])
+
             # Regular data inserts
             if documents:
                 self.mongo_helper.set_collection(self.stats_collection)
@@ -257,12 +303,23 @@ class BinanceWebSocket:
             else:
                 print("No big transactions to insert")
 
+            # Latest price per symbol, only the ones that changed
+            await self.store_latest_prices(price_documents, price_updates)
+
             print("Data processing and storage completed successfully")
         except Exception as e:
             print(f"Error in process_and_store_data: {e}")
         finally:
             print("-"*50)
 
+    async def store_latest_prices(self, price_documents, price_updates):
+        try:
+            updated = await self.latest_prices.update("binance", price_documents, price_updates)
+            if updated:
+                print(f"Updated {updated} prices in {self.latest_prices.collection_name}")
+        except Exception as e:
+            print(f"Error updating latest prices: {e}")
+
     async def bulk_insert(self, documents):
         try:
             result = await self.mongo_helper.insert_many(documents)
@@ -297,7 +354,7 @@ class BinanceWebSocket:
         # Add any other cleanup code here
 
 # main.py
-async def main(db_name, stats_collection, big_transactions_collection, pairs):
+async def main(db_name, stats_collection, big_transactions_collection, pairs, stream_types=None, book_ticker=False):
     try:
         mongo_helper = AsyncMongoDBHelper(db_name)
 
@@ -308,7 +365,7 @@ async def main(db_name, stats_collection, big_transactions_collection, pairs):
         # Set the main collection
         mongo_helper.set_collection(stats_collection)
 
-        binance_ws = BinanceWebSocket(pairs, mongo_helper, stats_collection, big_transactions_collection)
+        binance_ws = BinanceWebSocket(pairs, mongo_helper, stats_collection, big_transactions_collection, stream_types, book_ticker)
         
         print("Starting Binance WebSocket connection")
         await binance_ws.connect()
@@ -0,0 +1,44 @@
+import asyncio
+import sys
+
+import pandas as pd
+from bson import CodecOptions
+from datetime import timezone
+
+from coingecko.universe_builder import TARGET_PAIRS, UniverseBuilder
+from service.async_mongo import AsyncMongoDBHelper
+
+# Parse command-line arguments
+args = dict(arg.split('=', 1) for arg in sys.argv[1:])
+DB_NAME = args.get('db_name', 'bitpulse_v2')
+COLLECTION = args.get('collection', TARGET_PAIRS)
+TOP = int(args.get('top', 100))
+QUOTE = args.get('quote', 'USDT')
+COINGECKO_PAGES = int(args.get('coingecko_pages', 2))
+# Delete coins that dropped out of the top list
+PRUNE = args.get('prune', 'false').lower() == 'true'
+# Optionally also write the merged list to a CSV, e.g. csv=csvs/combined_exchanges.csv
+CSV_PATH = args.get('csv')
+
+CSV_COLUMNS = ['rank', 'coingecko_id', 'symbol', 'base_asset', 'market_cap_usd', 'volume_usd',
+               'price', 'price_change_pct', 'high_24h', 'low_24h', 'source']
+
+
+async def main():
+    mongo_helper = AsyncMongoDBHelper(DB_NAME)
+    mongo_helper.set_codec_options(CodecOptions(tz_aware=True, tzinfo=timezone.utc))
+    try:
+        builder = UniverseBuilder(mongo_helper, COLLECTION, quote=QUOTE, top=TOP, coingecko_pages=COINGECKO_PAGES)
+        documents = await builder.run(prune=PRUNE)
+    finally:
+        await mongo_helper.close_connection()
+
+    if CSV_PATH:
+        df = pd.DataFrame(documents)
+        df['source'] = df['source'].apply(','.join)
+        df[CSV_COLUMNS].to_csv(CSV_PATH, index=False)
+        print(f"Saved {len(df)} coins to {CSV_PATH}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,21 +1,52 @@
 import asyncio
 import aiohttp
+import hashlib
+import json
 import time
 from datetime import datetime, timezone
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+from prometheus_client import start_http_server, Gauge
+from pymongo import UpdateOne
+from coingecko.coingecko_history import CoinGeckoHistory, HISTORY_COLLECTION
+from coingecko.refresh_scheduler import RefreshScheduler, TOP_UP_AHEAD
 from service.async_mongo import AsyncMongoDBHelper
+from service.rate_limiter import RateLimiter, ResponseCache, SHARED_LIMITER
 from bson import CodecOptions
 
+COINGECKO_API_URL = "https://api.coingecko.com/api/v3"
+# Most ids /coins/markets accepts per call
+MARKETS_BATCH_SIZE = 250
+# Seconds between reloads of target_pairs while refreshing
+TARGET_PAIRS_RELOAD = 300
+
+# Fields that change on every fetch without saying anything about the coin
+FETCH_FIELDS = ("_id", "timestamp", "data_source")
+
+# Prometheus metrics
+FRESHNESS_LAG = Gauge('coingecko_freshness_lag_seconds', 'Seconds since the coin was last refreshed', ['coin'])
+
+def document_hash(document: Dict) -> str:
+    """Digest of a coin document without its fetch metadata."""
+    content = {name: value for name, value in document.items() if name not in FETCH_FIELDS}
+    return hashlib.sha1(json.dumps(content, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
 class CoinGeckoDataFetcher:
-    def __init__(self, mongo_helper: AsyncMongoDBHelper, collection_name: str):
+    def __init__(self, mongo_helper: AsyncMongoDBHelper, collection_name: str, base_url: str = COINGECKO_API_URL,
+                 rate_limiter: RateLimiter = None, history_collection: str = HISTORY_COLLECTION):
         self.mongo_helper = mongo_helper
         self.collection_name = collection_name
+        self.base_url = base_url
         self.active_cryptos = []
         
-        # Rate limiting
-        self.RATE_LIMIT = 5  # Calls per minute
-        self.CALL_INTERVAL = 60 / self.RATE_LIMIT
-        self.last_call_time = 0
+        # Calls are paced by the api.coingecko.com bucket, shared with other callers in the process
+        self.rate_limiter = rate_limiter or SHARED_LIMITER
+        self.scheduler = RefreshScheduler()
+        self.cryptos_by_id: Dict[str, Dict] = {}
+        # (last_updated_coingecko, document_hash) of what is stored for each coin
+        self.stored_state: Dict[str, Tuple[Optional[str], str]] = {}
+        self.response_cache = ResponseCache()
+        self.history = CoinGeckoHistory(mongo_helper, history_collection)
 
     async def load_active_cryptos(self):
         """Load active cryptocurrencies from MongoDB target_pairs collection"""
@@ -43,36 +74,118 @@ class CoinGeckoDataFetcher:
             print(f"Error loading active cryptos from MongoDB: {e}")
             raise
 
-    async def fetch_and_store_crypto_data(self, session, crypto: Dict):
-        url = f"https://api.coingecko.com/api/v3/coins/{crypto['id']}"
-        
-        # Ensure we don't exceed rate limit
-        current_time = time.time()
-        time_since_last_call = current_time - self.last_call_time
-        if time_since_last_call < self.CALL_INTERVAL:
-            await asyncio.sleep(self.CALL_INTERVAL - time_since_last_call)
-        
-        try:
-            async with session.get(url) as response:
-                self.last_call_time = time.time()
-                
-                if response.status == 200:
-                    data = await response.json()
-                    await self.process_and_store_data(data, crypto.get('source', []))
-                    return True
-                elif response.status == 429:
-                    print(f"Rate limit exceeded for {crypto['id']}. Waiting before retry.")
-                    await asyncio.sleep(self.CALL_INTERVAL)
-                    return False
-                else:
-                    print(f"Error fetching data for {crypto['id']}: HTTP {response.status}")
-                    return False
-        except aiohttp.ClientError as e:
-            print(f"Request exception for {crypto['id']}: {e}")
-            return False
-
-    async def process_and_store_data(self, data: Dict, source: List[str]):
-        processed_data = {
+    async def sync_schedule(self):
+        """
+        Bring the scheduler in line with active_cryptos. New coins are due once
+        their stored data goes stale, or right away if there is none.
+        """
+        self.cryptos_by_id = {crypto['id']: crypto for crypto in self.active_cryptos}
+        for coin_id in set(self.scheduler.members) - set(self.cryptos_by_id):
+            self.scheduler.remove(coin_id)
+            self.stored_state.pop(coin_id, None)
+            self.history.forget(coin_id)
+            FRESHNESS_LAG.remove(coin_id)
+
+        new_ids = [coin_id for coin_id in self.cryptos_by_id if coin_id not in self.scheduler]
+        if not new_ids:
+            return
+        self.mongo_helper.set_collection(self.collection_name)
+        stored = {doc['id']: doc for doc in await self.mongo_helper.find_many({"id": {"$in": new_ids}})}
+        for coin_id in new_ids:
+            doc = stored.get(coin_id)
+            if doc:
+                self.stored_state[coin_id] = (doc.get('last_updated_coingecko'), document_hash(doc))
+                self.history.seed(doc)
+            if doc and doc.get('timestamp'):
+                self.scheduler.add(coin_id, refreshed_at=doc['timestamp'].timestamp(), rank=doc.get('market_cap_rank'))
+            else:
+                self.scheduler.add(coin_id)
+            FRESHNESS_LAG.labels(coin=coin_id).set_function(lambda coin_id=coin_id: self.scheduler.lag(coin_id))
+
+    async def fetch_markets(self, session, ids: List[str]):
+        """
+        Fetch market data for up to MARKETS_BATCH_SIZE coins in one call.
+
+        Returns:
+            List[Dict]: One row per coin CoinGecko returned, or None if the call failed
+        """
+        url = f"{self.base_url}/coins/markets"
+        params = {
+            "vs_currency": "usd",
+            "ids": ",".join(ids),
+            "per_page": str(MARKETS_BATCH_SIZE),
+            "page": "1"
+        }
+        rows = await self.rate_limiter.get_json(session, url, params, cache=self.response_cache)
+        if rows is None:
+            print(f"Error fetching markets for {len(ids)} coins")
+        return rows
+
+    async def fetch_all(self, session) -> int:
+        """
+        Refresh every active crypto once, in batches of MARKETS_BATCH_SIZE.
+
+        Returns:
+            int: Number of API calls made
+        """
+        calls = 0
+        for i in range(0, len(self.active_cryptos), MARKETS_BATCH_SIZE):
+            calls += await self.refresh_batch(session, self.active_cryptos[i:i + MARKETS_BATCH_SIZE])
+        return calls
+
+    async def refresh_batch(self, session, batch: List[Dict]) -> int:
+        """
+        Refresh a batch with one /coins/markets call, falling back to /coins/{id} for
+        coins a successful response did not include, store the results in one bulk
+        write and schedule each coin's next refresh. If the markets call fails, the
+        whole batch is retried later instead of costing one detail call per coin.
+
+        Returns:
+            int: Number of API calls made
+        """
+        rows = await self.fetch_markets(session, [crypto['id'] for crypto in batch])
+        calls = 1
+        if rows is None:
+            for crypto in batch:
+                self.scheduler.retry(crypto['id'])
+            return calls
+
+        returned = {}
+        for row in rows:
+            returned[row.get('id')] = row
+        documents = []
+        for crypto in batch:
+            row = returned.get(crypto['id'])
+            if row is not None:
+                documents.append(self.process_market_data(row, crypto.get('source', [])))
+                self.scheduler.complete(crypto['id'], row.get('market_cap_rank'), row.get('price_change_percentage_24h'))
+                continue
+
+            calls += 1
+            document = await self.fetch_crypto_data(session, crypto)
+            if document is None:
+                print(f"Failed to fetch data for {crypto.get('name', 'Unknown')} ({crypto['id']}).")
+                self.scheduler.retry(crypto['id'])
+                continue
+            documents.append(document)
+
+        await self.store_batch(documents)
+        return calls
+
+    async def fetch_crypto_data(self, session, crypto: Dict) -> Optional[Dict]:
+        """Document of one coin from /coins/{id}, or None if the call failed"""
+        url = f"{self.base_url}/coins/{crypto['id']}"
+        data = await self.rate_limiter.get_json(session, url, cache=self.response_cache)
+        if data is None:
+            print(f"Error fetching data for {crypto['id']}")
+            return None
+        self.scheduler.complete(crypto['id'], data.get('market_cap_rank'),
+                                data.get('market_data', {}).get('price_change_percentage_24h'))
+        return self.process_detail_data(data, crypto.get('source', []))
+
+    def process_detail_data(self, data: Dict, source: List[str]) -> Dict:
+        """Document from a /coins/{id} response"""
+        return {
             "id": data.get('id'),
             "symbol": data.get('symbol'),
             "name": data.get('name'),
@@ -92,50 +205,127 @@ class CoinGeckoDataFetcher:
             "source": source,  # Add source array from target_pairs
             "data_source": {    # Add detailed data source information
                 "name": "coingecko",
-                "url": f"https://api.coingecko.com/api/v3/coins/{data.get('id')}",
+                "url": f"{COINGECKO_API_URL}/coins/{data.get('id')}",
                 "fetched_at": datetime.now(timezone.utc).isoformat()
             }
         }
 
+    def process_market_data(self, data: Dict, source: List[str]) -> Dict:
+        """Document from a /coins/markets row, with the same fields as process_detail_data"""
+        return {
+            "id": data.get('id'),
+            "symbol": data.get('symbol'),
+            "name": data.get('name'),
+            "market_cap": data.get('market_cap'),
+            "market_cap_rank": data.get('market_cap_rank'),
+            "total_volume": data.get('total_volume'),
+            "circulating_supply": data.get('circulating_supply'),
+            "total_supply": data.get('total_supply'),
+            "max_supply": data.get('max_supply'),
+            "ath": data.get('ath'),
+            "ath_date": data.get('ath_date'),
+            "atl": data.get('atl'),
+            "atl_date": data.get('atl_date'),
+            "last_updated_coingecko": data.get('last_updated'),
+            "image": data.get('image'),  # The markets endpoint returns the large image URL
+            "timestamp": datetime.now(timezone.utc),
+            "source": source,  # Add source array from target_pairs
+            "data_source": {    # Add detailed data source information
+                "name": "coingecko",
+                "url": f"{COINGECKO_API_URL}/coins/markets",
+                "fetched_at": datetime.now(timezone.utc).isoformat()
+            }
+        }
+
+    async def store_batch(self, documents: List[Dict]) -> int:
+        """
+        Upsert the documents that changed since they were last stored, in one bulk write.
+        A coin is unchanged when both CoinGecko's last_updated and the document hash match.
+
+        Returns:
+            int: Number of documents written
+        """
+        changed = []
+        for document in documents:
+            state = (document.get('last_updated_coingecko'), document_hash(document))
+            if self.stored_state.get(document['id']) != state:
+                changed.append((document, state))
+        unchanged = len(documents) - len(changed)
+        if not changed:
+            print(f"All {unchanged} refreshed cryptocurrencies unchanged, nothing to write")
+            return 0
+
         try:
             self.mongo_helper.set_collection(self.collection_name)
-            result = await self.mongo_helper.update_one_upsert(
-                {"id": processed_data["id"]},
-                {"$set": processed_data}
+            result = await self.mongo_helper.bulk_write(
+                [UpdateOne({"id": document["id"]}, {"$set": document}, upsert=True) for document, _ in changed],
+                ordered=False
             )
-            if result.get("upserted_id"):
-                print(f"Inserted new data for {processed_data['name']} ({processed_data['symbol']})")
-            else:
-                print(f"Updated existing data for {processed_data['name']} ({processed_data['symbol']})")
         except Exception as e:
-            print(f"Error inserting/updating data for {processed_data['name']}: {e}")
+            print(f"Error writing data for {len(changed)} cryptocurrencies: {e}")
+            return 0
+
+        for document, state in changed:
+            self.stored_state[document['id']] = state
+        print(f"Inserted {result.upserted_count} and updated {len(changed) - result.upserted_count} "
+              f"cryptocurrencies, {unchanged} unchanged")
+
+        try:
+            await self.history.record([document for document, _ in changed])
+        except Exception as e:
+            print(f"Error recording history for {len(changed)} cryptocurrencies: {e}")
+        return len(changed)
 
     async def main_loop(self):
-        while True:
-            print(f"\nStarting data fetch cycle at {datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')}")
-            
-            # Reload active cryptos at the start of each cycle
-            await self.load_active_cryptos()
-            
-            async with aiohttp.ClientSession() as session:
-                for crypto in self.active_cryptos:
-                    success = await self.fetch_and_store_crypto_data(session, crypto)
-                    if not success:
-                        print(f"Failed to fetch/store data for {crypto.get('name', 'Unknown')} ({crypto['id']}).")
-            
-            print(f"\nFinished fetching and storing data for {len(self.active_cryptos)} cryptocurrencies.")
-            print(f"Waiting for {len(self.active_cryptos) * self.CALL_INTERVAL} seconds before next cycle...")
-            await asyncio.sleep(len(self.active_cryptos) * self.CALL_INTERVAL)
+        """
+        Refresh the coins that are due, most overdue first, in batches paced by
+        the rate limiter. Calls are filled up with the coins due next, and while
+        nothing is due those are only taken once the API budget is full and
+        would otherwise go unused.
+        """
+        bucket = self.rate_limiter.bucket(urlsplit(self.base_url).hostname)
+        reloaded_at = None
+        async with aiohttp.ClientSession() as session:
+            while True:
+                if reloaded_at is None or time.monotonic() - reloaded_at >= TARGET_PAIRS_RELOAD:
+                    await self.load_active_cryptos()
+                    await self.sync_schedule()
+                    reloaded_at = time.monotonic()
+
+                if not len(self.scheduler):
+                    print("No active cryptocurrencies, waiting 60 seconds before reloading...")
+                    await asyncio.sleep(60)
+                    reloaded_at = None
+                    continue
+
+                now = time.time()
+                ids = self.scheduler.next_batch(MARKETS_BATCH_SIZE, now)
+                if ids or bucket.available() >= bucket.capacity:
+                    ids += self.scheduler.next_batch(MARKETS_BATCH_SIZE - len(ids), now, ahead=TOP_UP_AHEAD)
+                if not ids:
+                    # Wait for the next coin to be due or the budget to fill up, whichever comes first
+                    next_due = self.scheduler.next_due()
+                    until_due = next_due - now if next_due is not None else TARGET_PAIRS_RELOAD
+                    until_full = (bucket.capacity - bucket.available()) / bucket.rate
+                    await asyncio.sleep(max(min(until_due, until_full), 1))
+                    continue
+
+                calls = await self.refresh_batch(session, [self.cryptos_by_id[coin_id] for coin_id in ids])
+                lags = [self.scheduler.lag(coin_id) for coin_id in self.cryptos_by_id]
+                print(f"{datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')} Refreshed {len(ids)} "
+                      f"cryptocurrencies in {calls} calls, max freshness lag {max(lags):.0f}s")
 
-async def main(db_name, collection_name):
+async def main(db_name, collection_name, metrics_port=8003, history_collection=HISTORY_COLLECTION):
     try:
+        start_http_server(metrics_port)  # Prometheus will scrape metrics from this port
         mongo_helper = AsyncMongoDBHelper(db_name)
         
         # Set codec options to use timezone-aware datetimes
         codec_options = CodecOptions(tz_aware=True, tzinfo=timezone.utc)
         mongo_helper.set_codec_options(codec_options)
         
-        fetcher = CoinGeckoDataFetcher(mongo_helper, collection_name)
+        fetcher = CoinGeckoDataFetcher(mongo_helper, collection_name, history_collection=history_collection)
+        await fetcher.history.create_indexes()
         
         print("Starting CoinGecko data fetching")
         await fetcher.main_loop()
@@ -0,0 +1,166 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from service.async_mongo import AsyncMongoDBHelper
+
+HISTORY_COLLECTION = "coingecko_history"
+# Not kept in history: fetch metadata, and CoinGecko's own update time, which changes on every fetch
+UNTRACKED_FIELDS = ("_id", "id", "timestamp", "data_source", "last_updated_coingecko")
+
+
+def tracked_state(document: Dict) -> Dict:
+    return {name: value for name, value in document.items() if name not in UNTRACKED_FIELDS}
+
+
+def bucket_day(when: datetime) -> datetime:
+    return when.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def bucket_id(coin_id: str, day: datetime) -> str:
+    return f"{coin_id}:{day.strftime('%Y-%m-%d')}"
+
+
+def state_from_bucket(bucket: Dict, when: datetime) -> Dict:
+    """State of a coin at `when`: the bucket's base with every change up to then applied."""
+    state = dict(bucket['base'])
+    for field, changes in bucket.get('changes', {}).items():
+        for change in changes:
+            # Changes are appended in time order
+            if change['t'] > when:
+                break
+            state[field] = change['v']
+    return state
+
+
+def series_from_bucket(bucket: Dict, field: str) -> List[Tuple[datetime, Any]]:
+    """Values of one field in a bucket as (time, value), starting with its base value."""
+    points = []
+    if field in bucket['base']:
+        points.append((bucket['start'], bucket['base'][field]))
+    for change in bucket.get('changes', {}).get(field, []):
+        points.append((change['t'], change['v']))
+    return points
+
+
+class CoinGeckoHistory:
+    """
+    Append-only history of coingecko_data, stored as deltas.
+
+    One document per coin and UTC day holds the full state at the day's first
+    snapshot (`base`) and, per field, an array of {t, v} entries for every later
+    change, so a field like market_cap_rank that rarely changes costs nothing
+    between changes. Each day is self-contained: the state at any timestamp
+    comes from that day's bucket alone, or from the latest earlier bucket if the
+    coin was not fetched that day.
+    """
+
+    def __init__(self, mongo_helper: AsyncMongoDBHelper, collection_name: str = HISTORY_COLLECTION):
+        self.mongo_helper = mongo_helper
+        self.collection_name = collection_name
+        # Tracked fields of the last recorded snapshot of each coin, and the day of the bucket it went to
+        self.last_state: Dict[str, Dict] = {}
+        self.last_day: Dict[str, datetime] = {}
+
+    async def create_indexes(self) -> None:
+        self.mongo_helper.set_collection(self.collection_name)
+        await self.mongo_helper.collection.create_index([("id", 1), ("day", 1)])
+
+    def seed(self, document: Dict) -> None:
+        """Start from the stored latest state, e.g. after a restart, so the next snapshot records only changes."""
+        self.last_state[document['id']] = tracked_state(document)
+        if document.get('timestamp'):
+            self.last_day[document['id']] = bucket_day(document['timestamp'])
+
+    def forget(self, coin_id: str) -> None:
+        self.last_state.pop(coin_id, None)
+        self.last_day.pop(coin_id, None)
+
+    def snapshot_operations(self, document: Dict) -> List[UpdateOne]:
+        """
+        Writes recording one snapshot; empty if nothing tracked changed since the last recorded one.
+
+        The first snapshot of a day creates the bucket with the snapshot as its
+        base and no changes. Later snapshots append only the changed fields to
+        their change arrays.
+        """
+        state = tracked_state(document)
+        previous = self.last_state.get(document['id'])
+        changed = {name: value for name, value in state.items()
+                   if previous is None or name not in previous or previous[name] != value}
+        if not changed:
+            return []
+
+        when = document['timestamp']
+        day = bucket_day(when)
+        key = {"_id": bucket_id(document['id'], day)}
+        push = {"$set": {"end": when},
+                "$push": {f"changes.{name}": {"t": when, "v": value} for name, value in changed.items()}}
+        if previous is not None and self.last_day.get(document['id']) == day:
+            return [UpdateOne(key, push)]
+
+        insert = {"$setOnInsert": {"id": document['id'], "day": day, "start": when, "base": state},
+                  "$set": {"end": when}}
+        # Only matches a bucket that already existed, e.g. one created by a write that then failed, so
+        # the changes are not lost; a bucket inserted by this snapshot has start == when
+        return [UpdateOne(key, insert, upsert=True), UpdateOne(dict(key, start={"$lt": when}), push)]
+
+    async def record(self, documents: List[Dict]) -> int:
+        """
+        Record the snapshots in one bulk write. The recorded state only moves on
+        once the write succeeded, so after a failure the next snapshot still
+        carries the changes that were not stored.
+
+        Returns:
+            int: Number of coins with changes
+        """
+        operations = {document['id']: self.snapshot_operations(document) for document in documents}
+        operations = {coin_id: coin_operations for coin_id, coin_operations in operations.items() if coin_operations}
+        if operations:
+            self.mongo_helper.set_collection(self.collection_name)
+            await self.mongo_helper.bulk_write(
+                [operation for coin_operations in operations.values() for operation in coin_operations], ordered=False)
+        for document in documents:
+            self.last_state[document['id']] = tracked_state(document)
+            if document['id'] in operations:
+                self.last_day[document['id']] = bucket_day(document['timestamp'])
+        return len(operations)
+
+    async def state_at(self, coin_id: str, when: datetime) -> Optional[Dict]:
+        """
+        Rebuild a coin's tracked fields as they were at `when`.
+
+        Returns:
+            Dict: Field values, or None if nothing was recorded for the coin by then
+        """
+        self.mongo_helper.set_collection(self.collection_name)
+        cursor = self.mongo_helper.collection.find(
+            {"id": coin_id, "day": {"$lte": bucket_day(when)}, "start": {"$lte": when}}
+        ).sort("day", -1).limit(1)
+        buckets = await cursor.to_list(length=1)
+        if not buckets:
+            return None
+        return state_from_bucket(buckets[0], when)
+
+    async def series(self, coin_id: str, field: str, start: datetime, end: datetime) -> List[Tuple[datetime, Any]]:
+        """
+        Time series of one field, e.g. market_cap_rank, over [start, end).
+
+        Returns:
+            List[Tuple[datetime, Any]]: (time, value) at every change, starting with the value in effect at start
+        """
+        opening = await self.state_at(coin_id, start)
+        points = [(start, opening[field])] if opening and field in opening else []
+
+        self.mongo_helper.set_collection(self.collection_name)
+        projection = {"start": 1, f"base.{field}": 1, f"changes.{field}": 1}
+        cursor = self.mongo_helper.collection.find(
+            {"id": coin_id, "day": {"$gte": bucket_day(start), "$lt": end}}, projection
+        ).sort("day", 1)
+        async for bucket in cursor:
+            for when, value in series_from_bucket(bucket, field):
+                # A new day's base repeats the value in effect unless it changed overnight
+                if start < when < end and (not points or points[-1][1] != value):
+                    points.append((when, value))
+        return points
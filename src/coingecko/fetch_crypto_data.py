@@ -1,8 +1,8 @@
-import requests
-import time
 from collections import defaultdict
 import pprint
 
+from service.rate_limiter import fetch_json
+
 def fetch_all_crypto_data():
     all_cryptos = []
     url = "https://api.coingecko.com/api/v3/coins/markets"
@@ -14,13 +14,13 @@ def fetch_all_crypto_data():
             "order": "market_cap_desc",
             "per_page": 250,
             "page": page,
-            "sparkline": False
+            "sparkline": "false"
         }
         
-        response = requests.get(url, params=params)
+        # Paced by the shared api.coingecko.com budget, retrying throttled pages
+        data = fetch_json(url, params)
         
-        if response.status_code == 200:
-            data = response.json()
+        if data is not None:
             if not data:  # If the response is empty, we've reached the end
                 break
             
@@ -28,11 +28,8 @@ def fetch_all_crypto_data():
             
             print(f"Fetched page {page}, total cryptos: {len(all_cryptos)}")
             page += 1
-            
-            # Sleep for a short time to avoid hitting rate limits
-            time.sleep(1)
         else:
-            print(f"Error fetching data: {response.status_code}")
+            print(f"Error fetching page {page}")
             break
     
     return all_cryptos
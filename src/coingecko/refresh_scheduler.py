@@ -0,0 +1,129 @@
+import heapq
+import time
+from typing import Dict, List, Optional, Set
+
+# (highest market cap rank, seconds between refreshes) of each tier
+RANK_INTERVALS = ((10, 60.0), (50, 180.0), (100, 300.0), (250, 900.0))
+UNRANKED_INTERVAL = 1800.0
+MIN_INTERVAL = 30.0
+# Delay before an asset whose refresh failed is tried again
+RETRY_INTERVAL = 60.0
+# How far ahead of its due time an asset may be refreshed to fill a call that has room
+TOP_UP_AHEAD = 30.0
+
+
+def refresh_interval(rank: Optional[int], change_24h: Optional[float] = None) -> float:
+    """
+    Seconds an asset may go without a refresh.
+
+    Args:
+        rank: Market cap rank, None if unranked
+        change_24h: Price change over the last 24h in percent; each 10% halves the interval again
+
+    Returns:
+        float: Refresh interval, at least MIN_INTERVAL
+    """
+    interval = UNRANKED_INTERVAL
+    if rank:
+        for highest_rank, seconds in RANK_INTERVALS:
+            if rank <= highest_rank:
+                interval = seconds
+                break
+    if change_24h:
+        interval /= 1 + abs(change_24h) / 10
+    return max(MIN_INTERVAL, interval)
+
+
+class RefreshScheduler:
+    """
+    Refresh order of a set of assets: a min-heap on the time each one is next due.
+
+    Callers take the assets that are due, most overdue first. A call with room
+    to spare, or a rate budget that would otherwise sit idle, may be filled with
+    the assets due next, but only up to a bounded time ahead, so the intervals
+    still decide how often each asset is refreshed. Rescheduled or removed
+    assets leave their old heap entry behind; it is skipped when reached.
+    """
+
+    def __init__(self):
+        self.heap: List = []  # (due, coin id)
+        self.due: Dict[str, float] = {}
+        self.members: Set[str] = set()
+        self.added_at: Dict[str, float] = {}
+        self.refreshed_at: Dict[str, float] = {}
+
+    def __contains__(self, coin_id: str) -> bool:
+        return coin_id in self.members
+
+    def __len__(self) -> int:
+        return len(self.members)
+
+    def _push(self, coin_id: str, due: float) -> None:
+        self.due[coin_id] = due
+        heapq.heappush(self.heap, (due, coin_id))
+
+    def add(self, coin_id: str, refreshed_at: float = None, rank: int = None, now: float = None) -> None:
+        """Track an asset, due right away unless it was refreshed recently (e.g. before a restart)."""
+        now = now if now is not None else time.time()
+        self.members.add(coin_id)
+        self.added_at[coin_id] = now
+        if refreshed_at is None:
+            self._push(coin_id, now)
+            return
+        self.refreshed_at[coin_id] = refreshed_at
+        self._push(coin_id, refreshed_at + refresh_interval(rank))
+
+    def remove(self, coin_id: str) -> None:
+        self.members.discard(coin_id)
+        self.due.pop(coin_id, None)
+        self.added_at.pop(coin_id, None)
+        self.refreshed_at.pop(coin_id, None)
+
+    def _drop_stale(self) -> None:
+        while self.heap and self.due.get(self.heap[0][1]) != self.heap[0][0]:
+            heapq.heappop(self.heap)
+
+    def next_due(self) -> Optional[float]:
+        """Time the next asset is due, None if nothing is scheduled."""
+        self._drop_stale()
+        return self.heap[0][0] if self.heap else None
+
+    def next_batch(self, size: int, now: float = None, ahead: float = 0.0) -> List[str]:
+        """
+        Pop up to size assets due by now + ahead, most overdue first; they are out
+        of the heap until completed or retried.
+
+        Args:
+            size: Most assets to return
+            now: Current time, defaults to time.time()
+            ahead: Also take assets that become due within this many seconds
+        """
+        now = now if now is not None else time.time()
+        batch = []
+        while len(batch) < size:
+            self._drop_stale()
+            if not self.heap or self.heap[0][0] > now + ahead:
+                break
+            due, coin_id = heapq.heappop(self.heap)
+            del self.due[coin_id]
+            batch.append(coin_id)
+        return batch
+
+    def complete(self, coin_id: str, rank: int = None, change_24h: float = None, now: float = None) -> None:
+        """Record a refresh and schedule the next one from the asset's rank and volatility."""
+        if coin_id not in self.members:
+            return
+        now = now if now is not None else time.time()
+        self.refreshed_at[coin_id] = now
+        self._push(coin_id, now + refresh_interval(rank, change_24h))
+
+    def retry(self, coin_id: str, now: float = None) -> None:
+        if coin_id not in self.members:
+            return
+        now = now if now is not None else time.time()
+        self._push(coin_id, now + RETRY_INTERVAL)
+
+    def lag(self, coin_id: str, now: float = None) -> float:
+        """Seconds since the asset was last refreshed, or since it was added if it never was."""
+        now = now if now is not None else time.time()
+        return now - self.refreshed_at.get(coin_id, self.added_at.get(coin_id, now))
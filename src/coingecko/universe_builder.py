@@ -0,0 +1,289 @@
+import asyncio
+import json
+import os
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import aiohttp
+from pymongo import DeleteMany, UpdateOne
+
+from coingecko.coingecko_data import COINGECKO_API_URL, MARKETS_BATCH_SIZE
+from service.async_mongo import AsyncMongoDBHelper
+from service.rate_limiter import RateLimiter, SHARED_LIMITER
+
+TARGET_PAIRS = "target_pairs"
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "bitpulse", "exchange_info")
+# Listings change rarely; symbols that appear in between are skipped until the cache expires
+EXCHANGE_INFO_TTL = 6 * 3600
+
+
+class ExchangeInfoCache:
+    """Tradable symbols per exchange, kept as JSON files between runs."""
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR, ttl: float = EXCHANGE_INFO_TTL):
+        self.directory = directory
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, exchange: str) -> str:
+        return os.path.join(self.directory, f"{exchange}.json")
+
+    def load(self, exchange: str) -> Optional[Dict[str, Dict]]:
+        """Symbols of the exchange, or None if not cached or older than ttl."""
+        try:
+            if time.time() - os.path.getmtime(self.path(exchange)) > self.ttl:
+                return None
+            with open(self.path(exchange)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, exchange: str, symbols: Dict[str, Dict]) -> None:
+        tmp_path = f"{self.path(exchange)}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(symbols, f)
+        os.replace(tmp_path, self.path(exchange))
+
+
+class ExchangeSource(ABC):
+    """
+    REST endpoints of one exchange: its tradable symbols and their 24h tickers,
+    reduced to {symbol: {base, quote}} and rows with numeric USD values.
+    """
+
+    name = ""
+    symbols_path = ""
+    symbols_weight = 1
+    tickers_path = ""
+    tickers_weight = 1
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+
+    @abstractmethod
+    def parse_symbols(self, body) -> Dict[str, Dict]:
+        """Tradable symbols of the symbols_path response, as {symbol: {base, quote}}."""
+
+    @abstractmethod
+    def parse_tickers(self, body, symbols: Dict[str, Dict]) -> List[Dict]:
+        """One row per tradable symbol of the tickers_path response, with numeric volume and price fields."""
+
+
+class BinanceSource(ExchangeSource):
+    name = "binance"
+    symbols_path = "/api/v3/exchangeInfo"
+    symbols_weight = 20
+    tickers_path = "/api/v3/ticker/24hr"
+    tickers_weight = 80  # all symbols
+
+    def __init__(self, base_url: str = "https://api.binance.com"):
+        super().__init__(base_url)
+
+    def parse_symbols(self, body) -> Dict[str, Dict]:
+        return {
+            item['symbol']: {'base': item['baseAsset'], 'quote': item['quoteAsset']}
+            for item in body['symbols'] if item['status'] == 'TRADING'
+        }
+
+    def parse_tickers(self, body, symbols: Dict[str, Dict]) -> List[Dict]:
+        return [{
+            'symbol': item['symbol'],
+            **symbols[item['symbol']],
+            'volume_usd': float(item['quoteVolume']),
+            'price': float(item['lastPrice']),
+            'price_change_pct': float(item['priceChangePercent']),
+            'high_24h': float(item['highPrice']),
+            'low_24h': float(item['lowPrice']),
+        } for item in body if item['symbol'] in symbols]
+
+
+class KucoinSource(ExchangeSource):
+    name = "kucoin"
+    symbols_path = "/api/v1/symbols"
+    symbols_weight = 4
+    tickers_path = "/api/v1/market/allTickers"
+    tickers_weight = 15
+
+    def __init__(self, base_url: str = "https://api.kucoin.com"):
+        super().__init__(base_url)
+
+    def parse_symbols(self, body) -> Dict[str, Dict]:
+        return {
+            item['symbol']: {'base': item['baseCurrency'], 'quote': item['quoteCurrency']}
+            for item in body['data'] if item['enableTrading']
+        }
+
+    def parse_tickers(self, body, symbols: Dict[str, Dict]) -> List[Dict]:
+        return [{
+            'symbol': item['symbol'],
+            **symbols[item['symbol']],
+            'volume_usd': float(item['volValue'] or 0),
+            'price': float(item['last'] or 0),
+            'price_change_pct': float(item['changeRate'] or 0) * 100,
+            'high_24h': float(item['high'] or 0),
+            'low_24h': float(item['low'] or 0),
+        } for item in body['data']['ticker'] if item['symbol'] in symbols]
+
+
+def merge_pairs(pairs_by_exchange: Dict[str, List[Dict]], coins_by_symbol: Dict[str, Dict],
+                top: int = 100) -> List[Dict]:
+    """
+    One target_pairs document per CoinGecko id across exchanges, ranked by combined volume.
+
+    Args:
+        pairs_by_exchange: Ticker rows of each exchange, already limited to one quote asset
+        coins_by_symbol: CoinGecko id and market cap by upper case symbol
+        top: Number of coins to keep
+
+    Returns:
+        List[Dict]: Documents with a `source` array of the exchanges listing the coin (by volume)
+                    and the per-exchange symbol and ticker under `exchanges`
+    """
+    merged: Dict[str, Dict] = {}
+    for exchange, pairs in pairs_by_exchange.items():
+        for pair in pairs:
+            coin = coins_by_symbol.get(pair['base'].upper())
+            if coin is None:
+                continue
+            document = merged.setdefault(coin['id'], {
+                'id': coin['id'],
+                'coingecko_id': coin['id'],
+                'symbol': f"{pair['base']}/{pair['quote']}",
+                'base_asset': pair['base'],
+                'market_cap_usd': coin['market_cap'],
+                'exchanges': {},
+            })
+            document['exchanges'][exchange] = {
+                name: pair[name] for name in
+                ('symbol', 'volume_usd', 'price', 'price_change_pct', 'high_24h', 'low_24h')
+            }
+
+    documents = []
+    for document in merged.values():
+        by_volume = sorted(document['exchanges'], key=lambda name: -document['exchanges'][name]['volume_usd'])
+        leading = document['exchanges'][by_volume[0]]
+        document['source'] = by_volume
+        document['volume_usd'] = sum(ticker['volume_usd'] for ticker in document['exchanges'].values())
+        for name in ('price', 'price_change_pct', 'high_24h', 'low_24h'):
+            document[name] = leading[name]
+        documents.append(document)
+
+    documents.sort(key=lambda document: -document['volume_usd'])
+    documents = documents[:top]
+    for rank, document in enumerate(documents, 1):
+        document['rank'] = rank
+    return documents
+
+
+class UniverseBuilder:
+    """
+    Builds the set of coins the collectors track from exchange volumes.
+
+    The symbols and 24h tickers of every exchange and the CoinGecko market cap
+    pages are fetched concurrently, each within its host's rate budget, and the
+    exchange symbol lists are cached on disk between runs. Pairs are merged by
+    CoinGecko id and written to target_pairs in one bulk write.
+    """
+
+    def __init__(self,
+                 mongo_helper: AsyncMongoDBHelper,
+                 collection_name: str = TARGET_PAIRS,
+                 sources: List[ExchangeSource] = None,
+                 quote: str = "USDT",
+                 top: int = 100,
+                 coingecko_pages: int = 2,
+                 coingecko_url: str = COINGECKO_API_URL,
+                 cache: ExchangeInfoCache = None,
+                 rate_limiter: RateLimiter = None):
+        self.mongo_helper = mongo_helper
+        self.collection_name = collection_name
+        self.sources = sources or [BinanceSource(), KucoinSource()]
+        self.quote = quote
+        self.top = top
+        self.coingecko_pages = coingecko_pages
+        self.coingecko_url = coingecko_url
+        self.cache = cache or ExchangeInfoCache()
+        self.rate_limiter = rate_limiter or SHARED_LIMITER
+
+    async def fetch_symbols(self, session: aiohttp.ClientSession, source: ExchangeSource) -> Dict[str, Dict]:
+        symbols = self.cache.load(source.name)
+        if symbols is not None:
+            return symbols
+        body = await self.rate_limiter.get_json(session, f"{source.base_url}{source.symbols_path}",
+                                                weight=source.symbols_weight)
+        if body is None:
+            raise IOError(f"Could not fetch {source.name} symbols")
+        symbols = source.parse_symbols(body)
+        self.cache.save(source.name, symbols)
+        return symbols
+
+    async def fetch_pairs(self, session: aiohttp.ClientSession, source: ExchangeSource) -> List[Dict]:
+        """24h ticker rows of the exchange's tradable pairs in the quote asset."""
+        symbols, body = await asyncio.gather(
+            self.fetch_symbols(session, source),
+            self.rate_limiter.get_json(session, f"{source.base_url}{source.tickers_path}",
+                                       weight=source.tickers_weight),
+        )
+        if body is None:
+            raise IOError(f"Could not fetch {source.name} tickers")
+        quoted = {symbol: info for symbol, info in symbols.items() if info['quote'] == self.quote}
+        return source.parse_tickers(body, quoted)
+
+    async def fetch_coins(self, session: aiohttp.ClientSession) -> Dict[str, Dict]:
+        """CoinGecko id and market cap by upper case symbol, keeping the largest coin of each symbol."""
+        pages = await asyncio.gather(*[
+            self.rate_limiter.get_json(session, f"{self.coingecko_url}/coins/markets", {
+                'vs_currency': 'usd',
+                'order': 'market_cap_desc',
+                'per_page': MARKETS_BATCH_SIZE,
+                'page': page,
+                'sparkline': 'false',
+            }) for page in range(1, self.coingecko_pages + 1)
+        ])
+        if pages[0] is None:
+            raise IOError("Could not fetch CoinGecko markets")
+
+        coins = {}
+        for coin in (coin for page in pages for coin in page or []):
+            symbol = coin['symbol'].upper()
+            market_cap = coin.get('market_cap') or 0
+            if symbol not in coins or market_cap > coins[symbol]['market_cap']:
+                coins[symbol] = {'id': coin['id'], 'market_cap': market_cap}
+        return coins
+
+    async def build(self, session: aiohttp.ClientSession) -> List[Dict]:
+        coins, *pairs = await asyncio.gather(
+            self.fetch_coins(session),
+            *[self.fetch_pairs(session, source) for source in self.sources],
+        )
+        pairs_by_exchange = {source.name: source_pairs for source, source_pairs in zip(self.sources, pairs)}
+        return merge_pairs(pairs_by_exchange, coins, self.top)
+
+    async def write(self, documents: List[Dict], prune: bool = False) -> Dict:
+        """
+        Upsert the documents by id in one bulk write; with prune, also delete the
+        coins that dropped out of the universe.
+        """
+        updated_at = datetime.now(timezone.utc)
+        operations = [
+            UpdateOne({"id": document['id']}, {"$set": {**document, 'updated_at': updated_at}}, upsert=True)
+            for document in documents
+        ]
+        if prune:
+            operations.append(DeleteMany({"id": {"$nin": [document['id'] for document in documents]}}))
+        self.mongo_helper.set_collection(self.collection_name)
+        result = await self.mongo_helper.bulk_write(operations, ordered=True)
+        return {'upserted': result.upserted_count, 'modified': result.modified_count,
+                'deleted': result.deleted_count}
+
+    async def run(self, prune: bool = False) -> List[Dict]:
+        async with aiohttp.ClientSession() as session:
+            documents = await self.build(session)
+        if not documents:
+            raise ValueError("No pairs matched a CoinGecko id, leaving target_pairs unchanged")
+        counts = await self.write(documents, prune)
+        print(f"Wrote {len(documents)} coins to {self.collection_name}: {counts['upserted']} new, "
+              f"{counts['modified']} updated, {counts['deleted']} removed")
+        return documents
@@ -0,0 +1,188 @@
+import hashlib
+import json
+import os
+import tempfile
+from datetime import datetime, timedelta
+from itertools import groupby
+from typing import Callable, Dict, List
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from data_processing.archive_formats import ARCHIVE_SCHEMA_VERSION, read_archive_table
+from data_processing.archive_manifest import ArchiveManifest
+from data_processing.archive_policy import ArchivePolicy, STATS_POLICY
+from service.mongo import MongoDBHelper
+from service.s3 import S3Helper
+
+
+def compacted_prefix(key_prefix: str, source: str, symbol: str) -> str:
+    """Prefix of every daily file of one source and symbol, up to the date."""
+    return f"{key_prefix}source={source}/symbol={symbol}/date="
+
+
+def daily_prefix(key_prefix: str, source: str, symbol: str, day: datetime) -> str:
+    return f"{compacted_prefix(key_prefix, source, symbol)}{day.strftime('%Y-%m-%d')}/"
+
+
+class ArchiveCompactor:
+    """
+    Merges the hourly archive objects of completed days into one Parquet file per
+    source, symbol and day under the policy's key prefix, e.g. data/source=/symbol=/date=
+    for the per-second stats, written in the policy's schema.
+
+    Rows are sorted by timestamp with one row group per hour, so the per-row-group
+    timestamp statistics act as an index. Only one hour is held in memory at a time.
+    A day is rewritten, together with its previous daily file, whenever new hour
+    entries show up for it, so repeated runs only touch what changed.
+
+    Order of operations keeps the manifest consistent at every step: upload the
+    new file, write the day entry naming the hours it replaces (readers skip
+    those from then on), then remove the hour entries and their objects.
+    """
+
+    def __init__(self,
+                 manifest: ArchiveManifest,
+                 s3_helper: S3Helper,
+                 policy: ArchivePolicy = STATS_POLICY,
+                 settle_hours: int = 25,
+                 compression: str = "zstd"):
+        if policy.granularity != "hour" or policy.partition_keys != ["symbol", "source"]:
+            raise ValueError(f"Only hourly symbol/source archives can be compacted, {policy.collection_name} "
+                             f"is archived by {policy.granularity} and {', '.join(policy.partition_keys)}")
+        self.manifest = manifest
+        self.policy = policy
+        self.s3_helper = s3_helper
+        self.settle_hours = settle_hours
+        self.compression = compression
+
+    def completed_before(self, now: datetime = None) -> datetime:
+        """Days ending before this have passed the archive cutoff for every hour."""
+        now = now or datetime.utcnow()
+        return (now - timedelta(hours=self.settle_hours)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+    def compact(self, now: datetime = None) -> Dict:
+        """Compact every completed day that has hour entries. Returns counts of days, hours and rows."""
+        summary = {'days': 0, 'hours': 0, 'rows': 0, 'failed': []}
+        entries = self.manifest.iter_hourly_entries(self.completed_before(now))
+        day_of = lambda entry: (entry['symbol'], entry['source'], entry['hour'].date())
+        for (symbol, source, date), day_entries in groupby(entries, key=day_of):
+            day_entries = list(day_entries)
+            day = datetime(date.year, date.month, date.day)
+            try:
+                day_entry = self.compact_day(symbol, source, day, day_entries)
+            except Exception as e:
+                print(f"Error compacting {symbol} {source} {date}: {e}")
+                summary['failed'].append(f"{symbol}_{source}_{date}")
+                continue
+            summary['days'] += 1
+            summary['hours'] += len(day_entries)
+            summary['rows'] += day_entry['rows']
+        return summary
+
+    def compact_day(self, symbol: str, source: str, day: datetime, hour_entries: List[Dict]) -> Dict:
+        """Write the daily file of one symbol and source from its hour entries and any previous daily file."""
+        key = f"{symbol}_{source}_{day.strftime('%Y-%m-%d')}"
+        previous = self.manifest.get(key)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # Readers per hour, each loading just that hour's rows when called
+            hour_readers: Dict[datetime, List[Callable[[], pa.Table]]] = {}
+            if previous:
+                previous_path = os.path.join(tmp_dir, "previous.parquet")
+                self.s3_helper.s3_client.download_file(self.s3_helper.bucket_name, previous['s3_key'], previous_path)
+                previous_file = pq.ParquetFile(previous_path)
+                hours = json.loads(previous_file.schema_arrow.metadata[b"hours"])
+                for index, hour in enumerate(hours):
+                    hour_readers.setdefault(datetime.fromisoformat(hour), []).append(
+                        lambda index=index: previous_file.read_row_group(index))
+            for entry in hour_entries:
+                hour_readers.setdefault(entry['hour'], []).append(
+                    lambda entry=entry: read_archive_table(self._download(entry), schema=self.policy.schema))
+
+            path = os.path.join(tmp_dir, "day.parquet")
+            hours = sorted(hour_readers)
+            metadata = {
+                "schema_version": str(ARCHIVE_SCHEMA_VERSION),
+                "symbol": symbol,
+                "source": source,
+                "date": day.strftime('%Y-%m-%d'),
+                "hours": json.dumps([hour.isoformat() for hour in hours]),
+            }
+            schema = self.policy.schema.with_metadata(metadata)
+            rows = 0
+            with pq.ParquetWriter(path, schema, compression=self.compression) as writer:
+                for hour in hours:
+                    tables = [read().replace_schema_metadata(None).cast(self.policy.schema)
+                              for read in hour_readers[hour]]
+                    table = pa.concat_tables(tables).sort_by(self.policy.time_field)
+                    writer.write_table(table.replace_schema_metadata(metadata), row_group_size=max(len(table), 1))
+                    rows += len(table)
+
+            sha256 = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    sha256.update(chunk)
+            digest = sha256.hexdigest()
+            # A new object name per version, so readers of the old file never see it change
+            s3_key = f"{daily_prefix(self.policy.key_prefix, source, symbol, day)}{symbol}_{digest[:16]}.parquet"
+            self.s3_helper.s3_client.upload_file(path, self.s3_helper.bucket_name, s3_key,
+                                                 ExtraArgs={'ContentType': 'application/octet-stream'})
+            size = os.path.getsize(path)
+
+        day_entry = {
+            "_id": key,
+            "kind": "day",
+            "partition": {"symbol": symbol, "source": source},
+            "symbol": symbol,
+            "source": source,
+            "hour": day,
+            "end": day + timedelta(days=1),
+            "s3_key": s3_key,
+            "format": "parquet",
+            "rows": rows,
+            "bytes": size,
+            "sha256": digest,
+            "archived_at": datetime.utcnow(),
+            "replaces": sorted(set((previous or {}).get('replaces', []))
+                               | {entry['_id'] for entry in hour_entries}),
+        }
+        self.manifest.write_entry(day_entry)
+
+        self.manifest.remove_entries(hour_entries)
+        for entry in hour_entries:
+            self.s3_helper.delete_file(entry['s3_key'])
+        if previous and previous['s3_key'] != s3_key:
+            self.s3_helper.delete_file(previous['s3_key'])
+
+        print(f"Compacted {len(hour_entries)} hours of {symbol} {source} {day.date()} into {s3_key} ({rows} rows)")
+        return day_entry
+
+    def _download(self, entry: Dict) -> bytes:
+        data = self.s3_helper.download_bytes(entry['s3_key'])
+        if data is None:
+            raise IOError(f"Could not download {entry['s3_key']}")
+        if entry.get('sha256') and hashlib.sha256(data).hexdigest() != entry['sha256']:
+            raise IOError(f"Checksum mismatch for {entry['s3_key']}")
+        return data
+
+
+def main(policy: ArchivePolicy = STATS_POLICY):
+    s3_helper = S3Helper()
+    mongo_helper = MongoDBHelper("bitpulse_v2")
+    mongo_helper.set_collection(policy.manifest_collection)
+    try:
+        manifest = ArchiveManifest(mongo_helper, s3_helper, prefix=policy.manifest_prefix,
+                                   partition_keys=policy.partition_keys)
+        compactor = ArchiveCompactor(manifest, s3_helper, policy)
+        summary = compactor.compact()
+        print(f"Compacted {summary['hours']} hourly objects into {summary['days']} daily files "
+              f"({summary['rows']} rows)")
+        for failed_key in summary['failed']:
+            print(f"- Failed: {failed_key}")
+    finally:
+        mongo_helper.close_connection()
+
+
+if __name__ == "__main__":
+    main()
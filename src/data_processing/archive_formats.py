@@ -0,0 +1,180 @@
+import io
+import json
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Dict, List
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from bson import json_util
+
+# Bump when columns change in a way readers need to know about
+ARCHIVE_SCHEMA_VERSION = 1
+
+STATS_SCHEMA = pa.schema(
+    [
+        ("timestamp", pa.timestamp("ms", tz="UTC")),
+        ("symbol", pa.string()),
+        ("source", pa.string()),
+        ("baseCurrency", pa.string()),
+        ("quoteCurrency", pa.string()),
+    ]
+    + [
+        (f"{side}_{name}", column_type)
+        for side in ("buy", "sell")
+        for name, column_type in (
+            ("count", pa.int64()),
+            ("total_quantity", pa.float64()),
+            ("total_value", pa.float64()),
+            ("min_price", pa.float64()),
+            ("max_price", pa.float64()),
+            ("avg_price", pa.float64()),
+        )
+    ]
+    + [
+        ("missed_trades", pa.int64()),
+        ("duplicate_trades", pa.int64()),
+        ("avg_spread", pa.float64()),
+        ("max_spread", pa.float64()),
+        ("mid_price", pa.float64()),
+        ("_id", pa.string()),
+        # JSON of any fields not covered by a typed column, so archives stay lossless
+        ("extra", pa.string()),
+    ]
+)
+
+
+class ArchiveFormat(ABC):
+    """Serializes one archive group (an hour of documents plus its metadata) into an S3 object body."""
+
+    name = ""
+    extension = ""
+    content_type = "application/octet-stream"
+
+    @abstractmethod
+    def serialize(self, group: Dict) -> bytes:
+        """Object body holding the group's documents and its partition and time range."""
+
+
+class JsonArchiveFormat(ArchiveFormat):
+    """The original pretty-printed Extended JSON layout."""
+
+    name = "json"
+    extension = "json"
+    content_type = "application/json"
+
+    def serialize(self, group: Dict) -> bytes:
+        output_data = {
+            **group['partition'],
+            "interval_start": group['start_time'].strftime("%Y-%m-%d %H:%M:%S"),
+            "interval_end": group['end_time'].strftime("%Y-%m-%d %H:%M:%S"),
+            "total_documents": len(group['documents']),
+            "documents": group['documents']
+        }
+        return json.dumps(output_data, default=json_util.default, indent=2).encode('utf-8')
+
+
+class ParquetArchiveFormat(ArchiveFormat):
+    """Typed columns in a single zstd-compressed Parquet row group."""
+
+    name = "parquet"
+    extension = "parquet"
+
+    def __init__(self, schema: pa.Schema = STATS_SCHEMA, compression: str = "zstd", compression_level: int = 9):
+        self.schema = schema
+        self.compression = compression
+        self.compression_level = compression_level
+
+    def to_table(self, group: Dict) -> pa.Table:
+        documents = group['documents']
+        known = set(self.schema.names)
+        columns = {}
+        for field in self.schema:
+            if field.name == "_id":
+                columns[field.name] = [str(doc["_id"]) if "_id" in doc else None for doc in documents]
+            elif field.name == "extra":
+                columns[field.name] = [
+                    json.dumps({k: v for k, v in doc.items() if k not in known}, default=json_util.default)
+                    if not known.issuperset(doc) else None
+                    for doc in documents
+                ]
+            else:
+                columns[field.name] = [doc.get(field.name) for doc in documents]
+
+        metadata = {
+            "schema_version": str(ARCHIVE_SCHEMA_VERSION),
+            **{name: str(value) for name, value in group['partition'].items()},
+            "interval_start": group['start_time'].strftime("%Y-%m-%d %H:%M:%S"),
+            "interval_end": group['end_time'].strftime("%Y-%m-%d %H:%M:%S"),
+            "total_documents": str(len(documents)),
+        }
+        return pa.Table.from_pydict(columns, schema=self.schema.with_metadata(metadata))
+
+    def serialize(self, group: Dict) -> bytes:
+        sink = io.BytesIO()
+        pq.write_table(
+            self.to_table(group),
+            sink,
+            compression=self.compression,
+            compression_level=self.compression_level,
+        )
+        return sink.getvalue()
+
+
+ARCHIVE_FORMATS = {
+    JsonArchiveFormat.name: JsonArchiveFormat,
+    ParquetArchiveFormat.name: ParquetArchiveFormat,
+}
+
+
+def get_archive_format(name: str, schema: pa.Schema = None) -> ArchiveFormat:
+    if name not in ARCHIVE_FORMATS:
+        raise ValueError(f"Unknown archive format: {name}. Choose from {', '.join(ARCHIVE_FORMATS)}")
+    if schema is not None and name == ParquetArchiveFormat.name:
+        return ParquetArchiveFormat(schema)
+    return ARCHIVE_FORMATS[name]()
+
+
+def read_archive_table(data: bytes, columns: List[str] = None, schema: pa.Schema = STATS_SCHEMA) -> pa.Table:
+    """
+    Load an archived group as an Arrow table, whichever format it was written in.
+
+    Args:
+        data: Object body as downloaded from S3
+        columns: Optional subset of columns to read
+        schema: Columns to convert JSON archives to
+    """
+    if data[:4] == b"PAR1":
+        return pq.read_table(io.BytesIO(data), columns=columns)
+
+    # JSON archives are converted to the same typed columns
+    payload = json_util.loads(data)
+    header = ('interval_start', 'interval_end', 'total_documents', 'documents')
+    group = {
+        'partition': {name: value for name, value in payload.items() if name not in header},
+        'start_time': datetime.strptime(payload['interval_start'], "%Y-%m-%d %H:%M:%S"),
+        'end_time': datetime.strptime(payload['interval_end'], "%Y-%m-%d %H:%M:%S"),
+        'documents': payload['documents'],
+    }
+    table = ParquetArchiveFormat(schema).to_table(group)
+    return table.select(columns) if columns else table
+
+
+def read_archive_frame(data: bytes, columns: List[str] = None):
+    """Load an archived hour into a pandas DataFrame."""
+    return read_archive_table(data, columns).to_pandas()
+
+
+def read_archive_arrays(data: bytes, columns: List[str] = None) -> Dict[str, np.ndarray]:
+    """Load an archived hour as one NumPy array per column."""
+    table = read_archive_table(data, columns)
+    return {name: table.column(name).to_numpy(zero_copy_only=False) for name in table.column_names}
+
+
+def archive_schema_version(data: bytes) -> int:
+    """Schema version embedded in a Parquet archive; JSON archives are version 0."""
+    if data[:4] != b"PAR1":
+        return 0
+    metadata = pq.read_schema(io.BytesIO(data)).metadata or {}
+    return int(metadata.get(b"schema_version", b"0"))
@@ -0,0 +1,162 @@
+import hashlib
+import json
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Sequence
+
+from bson import json_util
+
+from service.mongo import MongoDBHelper
+from service.s3 import S3Helper
+
+MANIFEST_COLLECTION = "archive_manifest"
+MANIFEST_PREFIX = "manifest/"
+
+
+class ArchiveManifest:
+    """
+    Record of every archive group (e.g. symbol-hour) that is safely in S3.
+
+    Each entry is written as its own small JSON object under MANIFEST_PREFIX, so
+    the S3 copy never needs a read-modify-write, and mirrored into a Mongo
+    collection keyed by the group key for fast lookups. An entry is written only
+    after its archive object is uploaded, so an hour is either fully recorded or
+    not recorded at all, and archiving can resume from the manifest after a crash.
+    """
+
+    def __init__(self, mongo_helper: MongoDBHelper, s3_helper: S3Helper, prefix: str = MANIFEST_PREFIX,
+                 partition_keys: Sequence[str] = ("symbol", "source")):
+        self.mongo_helper = mongo_helper
+        self.s3_helper = s3_helper
+        self.prefix = prefix
+        self.partition_keys = list(partition_keys)
+        # Entries keep their bucket start in "hour" whatever the policy's granularity or time field
+        self.sort = [(name, 1) for name in self.partition_keys] + [("hour", 1)]
+        self.mongo_helper.create_index(self.sort)
+
+    def entry_key(self, entry: Dict) -> str:
+        """Entries are grouped under their first partition value, e.g. manifest/BTCUSDT/."""
+        return f"{self.prefix}{next(iter(entry['partition'].values()))}/{entry['_id']}.json"
+
+    def load_rows(self, partition: Dict, start: datetime) -> Dict[str, Dict]:
+        """
+        Row count and deleted flag of the recorded groups of one partition from start on, keyed by group key.
+
+        Only this range is loaded, served by the partition keys and hour index, so
+        memory does not grow with the manifest. Hours replaced by a day entry
+        count as deleted; day entries start up to a day before the first such hour.
+        """
+        query = {name: partition[name] for name in self.partition_keys}
+        query["hour"] = {"$gte": start - timedelta(days=1)}
+        cursor = self.mongo_helper.find_cursor(query, projection={"rows": 1, "deleted": 1, "replaces": 1})
+        rows = {}
+        try:
+            for entry in cursor:
+                for key in entry.get('replaces', []):
+                    rows[key] = {"rows": None, "deleted": True}
+                rows.setdefault(entry['_id'], {"rows": entry['rows'], "deleted": entry.get('deleted', False)})
+        finally:
+            cursor.close()
+        return rows
+
+    def get(self, key: str) -> Optional[Dict]:
+        return self.mongo_helper.find_one({"_id": key})
+
+    def record(self, key: str, group: Dict, s3_key: str, body: bytes, archive_format: str) -> Dict:
+        """
+        Record an uploaded group, first in S3 and then in the Mongo mirror.
+
+        Args:
+            key: Group key, e.g. BTCUSDT_binance_2024-01-01_03
+            group: Group info with partition, start_time, end_time, granularity and document_count
+            s3_key: Key of the archive object
+            body: The uploaded object body, used for the size and checksum
+            archive_format: Name of the format the body was written in
+
+        Returns:
+            Dict: The manifest entry
+        """
+        entry = {
+            "_id": key,
+            "kind": group.get('granularity', "hour"),
+            "partition": group['partition'],
+            **group['partition'],
+            "hour": group['start_time'],
+            "end": group['end_time'],
+            "s3_key": s3_key,
+            "format": archive_format,
+            "rows": group['document_count'],
+            "bytes": len(body),
+            "sha256": hashlib.sha256(body).hexdigest(),
+            "archived_at": datetime.utcnow(),
+            "deleted": False,
+        }
+        self.write_entry(entry)
+        return entry
+
+    def write_entry(self, entry: Dict) -> None:
+        """Write an entry to S3, then to the Mongo mirror."""
+        payload = json.dumps(entry, default=json_util.default).encode('utf-8')
+        if not self.s3_helper.upload_bytes(payload, self.entry_key(entry),
+                                           content_type="application/json"):
+            raise IOError(f"Could not write manifest entry for {entry['_id']}")
+        self.mongo_helper.collection.replace_one({"_id": entry['_id']}, entry, upsert=True)
+
+    def remove_entries(self, entries: List[Dict]) -> None:
+        """Drop entries from the Mongo mirror, then from S3."""
+        if not entries:
+            return
+        self.mongo_helper.delete_many({"_id": {"$in": [entry['_id'] for entry in entries]}})
+        for entry in entries:
+            self.s3_helper.delete_file(self.entry_key(entry))
+
+    def iter_hourly_entries(self, before: datetime) -> Iterator[Dict]:
+        """Hour entries whose Mongo documents are gone, for hours before a cutoff, by partition and hour."""
+        query = {"kind": {"$ne": "day"}, "deleted": True, "hour": {"$lt": before}}
+        cursor = self.mongo_helper.find_cursor(query, sort=self.sort)
+        try:
+            yield from cursor
+        finally:
+            cursor.close()
+
+    def mark_deleted(self, keys: List[str]) -> None:
+        """Note that the Mongo documents of these groups were removed."""
+        if keys:
+            self.mongo_helper.update_many({"_id": {"$in": keys}}, {"deleted": True})
+
+    def entries(self, symbol: str, source: str = None, start: datetime = None, end: datetime = None) -> List[Dict]:
+        """Manifest entries of one symbol (and source, if given) whose hour starts in [start, end), oldest first."""
+        query = {"symbol": symbol}
+        if source is not None:
+            query["source"] = source
+        if start or end:
+            query["hour"] = {}
+            if start:
+                query["hour"]["$gte"] = start.replace(minute=0, second=0, microsecond=0)
+            if end:
+                query["hour"]["$lt"] = end
+        cursor = self.mongo_helper.find_cursor(query, sort=[("hour", 1)])
+        try:
+            entries = list(cursor)
+        finally:
+            cursor.close()
+
+        # A day entry is written before the hour entries it replaces are removed,
+        # so skip those hours if a compaction is half way through
+        replaced = {key for entry in entries for key in entry.get('replaces', [])}
+        return [entry for entry in entries if entry['_id'] not in replaced]
+
+    def iter_s3_entries(self) -> Iterator[Dict]:
+        """Read every entry back from S3, e.g. to rebuild the Mongo mirror."""
+        paginator = self.s3_helper.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.s3_helper.bucket_name, Prefix=self.prefix):
+            for obj in page.get('Contents', []):
+                response = self.s3_helper.s3_client.get_object(Bucket=self.s3_helper.bucket_name, Key=obj['Key'])
+                yield json_util.loads(response['Body'].read())
+
+    def rebuild_mirror(self) -> int:
+        """Re-create the Mongo mirror from the S3 entries. Returns the number of entries."""
+        count = 0
+        for entry in self.iter_s3_entries():
+            self.mongo_helper.collection.replace_one({"_id": entry['_id']}, entry, upsert=True)
+            count += 1
+        return count
@@ -0,0 +1,201 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from queue import Queue
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from data_processing.archive_formats import ArchiveFormat
+from data_processing.archive_manifest import ArchiveManifest
+from service.s3 import S3Helper
+
+# Marks the end of a stage's input
+_DONE = object()
+
+
+def serialize_group(archive_format: ArchiveFormat, group: Dict) -> bytes:
+    """Runs in a worker process so compression happens off the reader's core."""
+    return archive_format.serialize(group)
+
+
+class ArchivePipeline:
+    """
+    Archives hour groups through bounded, concurrent stages:
+
+    read (caller's iterator) -> serialize (process pool) -> upload (threads) -> delete (one thread)
+
+    Each queue holds at most queue_size groups, so a slow stage holds back the
+    reader instead of buffering the whole collection in memory. Uploaded groups
+    are handed to delete_groups in batches of roughly delete_batch_size documents;
+    groups whose serialization or upload failed are never deleted.
+
+    With a manifest, every upload is recorded before its group may be deleted,
+    and groups already recorded with the same row count skip straight to the
+    delete stage, so a run interrupted at any point resumes where it stopped.
+    A recorded group is only re-archived if it gained rows before its deletion;
+    rows showing up for a group that was already deleted (or with fewer rows
+    than recorded) are left in place and reported as conflicts, since a new
+    object would replace the complete archive with a partial one.
+    """
+
+    def __init__(self,
+                 archive_format: ArchiveFormat,
+                 s3_helper: S3Helper,
+                 delete_groups: Callable[[List[Dict]], int],
+                 serialize_workers: int = 2,
+                 upload_workers: int = 8,
+                 delete_batch_size: int = 50000,
+                 queue_size: int = 16,
+                 multipart_threshold: int = 16 * 1024 * 1024,
+                 manifest: ArchiveManifest = None,
+                 object_prefix: Callable[[Dict], str] = None):
+        self.archive_format = archive_format
+        self.s3_helper = s3_helper
+        self.delete_groups = delete_groups
+        self.serialize_workers = serialize_workers
+        self.upload_workers = upload_workers
+        self.delete_batch_size = delete_batch_size
+        self.queue_size = queue_size
+        self.multipart_threshold = multipart_threshold
+        self.manifest = manifest
+        self.object_prefix = object_prefix or (lambda group: f"data/{group['symbol']}/")
+
+        self.lock = threading.Lock()
+        self.summary = {}
+
+    def s3_key(self, key: str, group: Dict) -> str:
+        return f"{self.object_prefix(group)}{key}.{self.archive_format.extension}"
+
+    def run(self, groups: Iterable[Tuple[str, Dict]]) -> Dict:
+        """
+        Archive every (key, group) from groups.
+
+        Returns:
+            Dict: Counts of documents, groups, uploads and deletions, plus the keys that failed
+        """
+        self.summary = {
+            'total_documents': 0,
+            'total_groups': 0,
+            'uploaded': 0,
+            'uploaded_bytes': 0,
+            'skipped': 0,
+            'deleted': 0,
+            'failed': [],
+            'conflicts': [],
+        }
+        partition = None
+        recorded = {}
+        serialized_queue = Queue(maxsize=self.queue_size)
+        confirmed_queue = Queue(maxsize=self.queue_size)
+
+        uploaders = [
+            threading.Thread(target=self._upload_stage, args=(serialized_queue, confirmed_queue), daemon=True)
+            for _ in range(self.upload_workers)
+        ]
+        deleter = threading.Thread(target=self._delete_stage, args=(confirmed_queue,), daemon=True)
+        for thread in uploaders:
+            thread.start()
+        deleter.start()
+
+        try:
+            # Spawned rather than forked: several pipelines may run side by side in threads
+            with ProcessPoolExecutor(max_workers=self.serialize_workers,
+                                     mp_context=multiprocessing.get_context("spawn")) as pool:
+                for key, group in groups:
+                    self.summary['total_groups'] += 1
+                    self.summary['total_documents'] += len(group['documents'])
+                    # Keep only what the later stages need; the documents live on in the worker
+                    info = {name: value for name, value in group.items() if name != 'documents'}
+                    info['key'] = key
+                    info['document_count'] = len(group['documents'])
+
+                    if self.manifest and group['partition'] != partition:
+                        # Groups arrive sorted by partition and time: load one partition's entries at a time
+                        partition = group['partition']
+                        recorded = self.manifest.load_rows(partition, group['start_time'])
+
+                    entry = recorded.get(key)
+                    if entry is not None and not entry['deleted'] and entry['rows'] == info['document_count']:
+                        # Archived by an earlier run that stopped before deleting
+                        self.summary['skipped'] += 1
+                        confirmed_queue.put(info)
+                        continue
+                    if entry is not None and (entry['deleted'] or info['document_count'] < entry['rows']):
+                        print(f"Not overwriting the archive of {key}: {info['document_count']} rows in the "
+                              f"collection, {entry['rows']} archived{' and deleted' if entry['deleted'] else ''}")
+                        self.summary['conflicts'].append(key)
+                        continue
+
+                    future = pool.submit(serialize_group, self.archive_format, group)
+                    serialized_queue.put((key, info, future))
+        finally:
+            for _ in uploaders:
+                serialized_queue.put(_DONE)
+            for thread in uploaders:
+                thread.join()
+            confirmed_queue.put(_DONE)
+            deleter.join()
+
+        return self.summary
+
+    def _upload_stage(self, serialized_queue: Queue, confirmed_queue: Queue) -> None:
+        while True:
+            item = serialized_queue.get()
+            if item is _DONE:
+                return
+            key, info, future = item
+            try:
+                body = future.result()
+            except Exception as e:
+                print(f"Error serializing group {key}: {e}")
+                self._record_failure(key)
+                continue
+
+            s3_key = self.s3_key(key, info)
+            if not self.s3_helper.upload_bytes(body, s3_key, content_type=self.archive_format.content_type,
+                                               multipart_threshold=self.multipart_threshold):
+                self._record_failure(key)
+                continue
+
+            if self.manifest:
+                try:
+                    self.manifest.record(key, info, s3_key, body, self.archive_format.name)
+                except Exception as e:
+                    print(f"Error recording {key} in the manifest: {e}")
+                    self._record_failure(key)
+                    continue
+
+            print(f"Uploaded to S3: {s3_key} with {info['document_count']} documents")
+            with self.lock:
+                self.summary['uploaded'] += 1
+                self.summary['uploaded_bytes'] += len(body)
+            confirmed_queue.put(info)
+
+    def _delete_stage(self, confirmed_queue: Queue) -> None:
+        batch = []
+        batch_documents = 0
+        while True:
+            info = confirmed_queue.get()
+            if info is not _DONE:
+                batch.append(info)
+                batch_documents += info['document_count']
+                if batch_documents < self.delete_batch_size:
+                    continue
+
+            if batch:
+                try:
+                    deleted = self.delete_groups(batch)
+                except Exception as e:
+                    # Keep draining so the upload stage never blocks on a full queue
+                    print(f"Error deleting archived groups: {e}")
+                    deleted = 0
+                with self.lock:
+                    self.summary['deleted'] += deleted
+                batch = []
+                batch_documents = 0
+            if info is _DONE:
+                return
+
+    def _record_failure(self, key: str) -> None:
+        print(f"Failed to upload group: {key}")
+        with self.lock:
+            self.summary['failed'].append(key)
@@ -0,0 +1,110 @@
+from datetime import datetime, timedelta
+from typing import Dict, List, Sequence
+
+import pyarrow as pa
+
+from data_processing.archive_formats import STATS_SCHEMA
+from data_processing.archive_manifest import MANIFEST_COLLECTION, MANIFEST_PREFIX
+
+GRANULARITIES = {
+    "hour": (timedelta(hours=1), '%Y-%m-%d_%H'),
+    "day": (timedelta(days=1), '%Y-%m-%d'),
+}
+
+BIG_TRANSACTIONS_SCHEMA = pa.schema([
+    ("timestamp", pa.timestamp("ms", tz="UTC")),
+    ("symbol", pa.string()),
+    ("source", pa.string()),
+    ("side", pa.string()),
+    ("price", pa.float64()),
+    ("quantity", pa.float64()),
+    ("value", pa.float64()),
+    ("baseCurrency", pa.string()),
+    ("quoteCurrency", pa.string()),
+    ("_id", pa.string()),
+    ("extra", pa.string()),
+])
+
+
+class ArchivePolicy:
+    """
+    How one collection is archived: what is old enough, how documents are grouped
+    into S3 objects, which format they are written in and where they go.
+
+    Groups are keyed by the partition key values plus the start of the time
+    bucket, e.g. BTCUSDT_binance_2024-01-01_03 for hourly symbol/source groups.
+    """
+
+    def __init__(self,
+                 collection_name: str,
+                 retention: timedelta = timedelta(hours=24),
+                 partition_keys: Sequence[str] = ("symbol", "source"),
+                 time_field: str = "timestamp",
+                 granularity: str = "hour",
+                 archive_format: str = "parquet",
+                 schema: pa.Schema = STATS_SCHEMA,
+                 projection: Dict = None,
+                 key_prefix: str = None,
+                 manifest_collection: str = None,
+                 manifest_prefix: str = None):
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Unknown granularity: {granularity}. Choose from {', '.join(GRANULARITIES)}")
+        if not partition_keys:
+            raise ValueError("At least one partition key is required")
+        self.collection_name = collection_name
+        self.retention = retention
+        self.partition_keys = list(partition_keys)
+        self.time_field = time_field
+        self.granularity = granularity
+        self.bucket_length, self.bucket_format = GRANULARITIES[granularity]
+        self.archive_format = archive_format
+        self.schema = schema
+        self.projection = projection
+        self.key_prefix = key_prefix if key_prefix is not None else f"archive/{collection_name}/"
+        self.manifest_collection = manifest_collection or f"{MANIFEST_COLLECTION}_{collection_name}"
+        self.manifest_prefix = manifest_prefix or f"{MANIFEST_PREFIX}{collection_name}/"
+
+    @property
+    def sort(self) -> List:
+        """Index and cursor order: partition keys, then time."""
+        return [(name, 1) for name in self.partition_keys] + [(self.time_field, 1)]
+
+    def bucket_start(self, timestamp: datetime) -> datetime:
+        if self.granularity == "day":
+            return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+
+    def cutoff(self, now: datetime = None) -> datetime:
+        """Start of the bucket holding now - retention; everything before it is archived."""
+        return self.bucket_start((now or datetime.utcnow()) - self.retention)
+
+    def group_key(self, partition: Dict, start: datetime) -> str:
+        return "_".join([str(partition[name]) for name in self.partition_keys] + [start.strftime(self.bucket_format)])
+
+    def object_prefix(self, group: Dict) -> str:
+        """Objects are stored under the first partition value, e.g. data/BTCUSDT/."""
+        return f"{self.key_prefix}{group['partition'][self.partition_keys[0]]}/"
+
+    def range_filter(self, group: Dict) -> Dict:
+        """Predicate matching exactly one group, served by the index on sort."""
+        query = dict(group['partition'])
+        query[self.time_field] = {"$gte": group['start_time'], "$lt": group['end_time']}
+        return query
+
+
+# Per-second trade stats keep their original layout: data/{symbol}/ and the archive_manifest collection
+STATS_POLICY = ArchivePolicy(
+    "transactions_stats_second",
+    key_prefix="data/",
+    manifest_collection=MANIFEST_COLLECTION,
+    manifest_prefix=MANIFEST_PREFIX,
+)
+
+BIG_TRANSACTIONS_POLICY = ArchivePolicy(
+    "big_transactions",
+    retention=timedelta(days=7),
+    granularity="day",
+    schema=BIG_TRANSACTIONS_SCHEMA,
+)
+
+DEFAULT_POLICIES = [STATS_POLICY, BIG_TRANSACTIONS_POLICY]
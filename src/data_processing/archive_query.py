@@ -0,0 +1,204 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from data_processing.archive_compaction import compacted_prefix
+from data_processing.archive_formats import read_archive_table
+from data_processing.archive_manifest import ArchiveManifest
+from data_processing.archive_policy import ArchivePolicy, STATS_POLICY
+from service.s3 import S3Helper
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "bitpulse", "archive")
+
+
+class DiskLRUCache:
+    """
+    Archive objects cached as files in one directory, evicting the least
+    recently used once the total size exceeds max_bytes.
+    """
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR, max_bytes: int = 2 * 1024 ** 3):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+        # Restore recency from the previous process via access times
+        files = []
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if name.endswith('.tmp') or not os.path.isfile(path):
+                continue
+            stat = os.stat(path)
+            files.append((stat.st_atime, name, stat.st_size))
+        self.entries: "OrderedDict[str, int]" = OrderedDict(
+            (name, size) for _, name, size in sorted(files)
+        )
+        self.total_bytes = sum(self.entries.values())
+
+    @staticmethod
+    def file_name(key: str) -> str:
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[bytes]:
+        name = self.file_name(key)
+        with self.lock:
+            if name not in self.entries:
+                return None
+            self.entries.move_to_end(name)
+        path = os.path.join(self.directory, name)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+            return data
+        except FileNotFoundError:
+            with self.lock:
+                self.total_bytes -= self.entries.pop(name, 0)
+            return None
+
+    def put(self, key: str, data: bytes) -> None:
+        name = self.file_name(key)
+        path = os.path.join(self.directory, name)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self.lock:
+            self.total_bytes += len(data) - self.entries.pop(name, 0)
+            self.entries[name] = len(data)
+            while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+                evicted, size = self.entries.popitem(last=False)
+                self.total_bytes -= size
+                try:
+                    os.remove(os.path.join(self.directory, evicted))
+                except FileNotFoundError:
+                    pass
+
+
+class ArchiveQuery:
+    """
+    Reads archived stats for a symbol and time range back as columnar arrays.
+
+    Objects are found through the manifest when one is given, otherwise by
+    listing the policy's archive and compacted daily prefixes in S3, then fetched
+    concurrently through a local LRU disk cache so repeated reads of the same
+    buckets never touch S3.
+    """
+
+    def __init__(self,
+                 s3_helper: S3Helper = None,
+                 manifest: ArchiveManifest = None,
+                 cache: DiskLRUCache = None,
+                 max_workers: int = 8,
+                 policy: ArchivePolicy = STATS_POLICY):
+        self.s3_helper = s3_helper or S3Helper()
+        self.manifest = manifest
+        self.cache = cache or DiskLRUCache()
+        self.max_workers = max_workers
+        self.policy = policy
+
+    def resolve_objects(self, symbol: str, source: str, start: datetime, end: datetime) -> List[Tuple[str, str]]:
+        """
+        Returns:
+            List[Tuple[str, str]]: (S3 key, checksum or "") of every object overlapping [start, end)
+        """
+        policy = self.policy
+        if self.manifest is not None:
+            # Entries cover [hour, end); look back far enough to catch a covering entry
+            entries = self.manifest.entries(symbol, source, start - timedelta(days=1), end)
+            return [(entry['s3_key'], entry.get('sha256', "")) for entry in entries
+                    if entry.get('end', entry['hour'] + policy.bucket_length) > start]
+
+        objects = []
+        compacted_days = set()
+        daily = compacted_prefix(policy.key_prefix, source, symbol)
+        for s3_key in self.s3_helper.list_files(daily):
+            try:
+                day = datetime.strptime(s3_key[len(daily):].split('/')[0], '%Y-%m-%d')
+            except ValueError:
+                continue
+            compacted_days.add(day.date())
+            if day + timedelta(days=1) > start and day < end:
+                objects.append((s3_key, ""))
+
+        # Objects are named after their group key, e.g. data/BTCUSDT/BTCUSDT_binance_2024-01-01_03.parquet
+        partition = {"symbol": symbol, "source": source}
+        group = {"partition": {name: partition[name] for name in policy.partition_keys}}
+        prefix = policy.object_prefix(group) + "".join(f"{value}_" for value in group['partition'].values())
+        first_bucket = policy.bucket_start(start)
+        for s3_key in self.s3_helper.list_files(prefix):
+            stem = s3_key[len(prefix):].split('.')[0]
+            try:
+                bucket = datetime.strptime(stem, policy.bucket_format)
+            except ValueError:
+                continue
+            # Buckets already merged into a daily file but not deleted yet
+            if bucket.date() in compacted_days:
+                continue
+            if first_bucket <= bucket < end:
+                objects.append((s3_key, ""))
+        return sorted(objects)
+
+    def fetch(self, s3_key: str, checksum: str = "") -> bytes:
+        """Object body from the cache, or from S3 (then cached)."""
+        # Re-archived objects get a new checksum and so a new cache entry
+        cache_key = f"{s3_key}#{checksum}"
+        data = self.cache.get(cache_key)
+        if data is not None:
+            return data
+
+        data = self.s3_helper.download_bytes(s3_key)
+        if data is None:
+            raise IOError(f"Could not download s3://{self.s3_helper.bucket_name}/{s3_key}")
+        if checksum and hashlib.sha256(data).hexdigest() != checksum:
+            raise IOError(f"Checksum mismatch for {s3_key}")
+        self.cache.put(cache_key, data)
+        return data
+
+    def get_range(self, symbol: str, source: str, start: datetime, end: datetime,
+                  fields: List[str] = None) -> Dict[str, np.ndarray]:
+        """
+        Archived rows of one symbol and source with time field values in [start, end).
+
+        Args:
+            symbol: Symbol, e.g. BTCUSDT
+            source: Exchange the stats came from, e.g. binance
+            start: Range start (UTC, naive)
+            end: Range end (UTC, naive), exclusive
+            fields: Columns to return besides the policy's time field; all columns if omitted
+
+        Returns:
+            Dict[str, np.ndarray]: One array per column, sorted by the time field
+        """
+        time_field = self.policy.time_field
+        columns = None
+        if fields:
+            columns = [time_field] + [name for name in fields if name != time_field]
+
+        objects = self.resolve_objects(symbol, source, start, end)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            bodies = list(pool.map(lambda obj: self.fetch(*obj), objects))
+
+        tables = [read_archive_table(body, columns, schema=self.policy.schema).replace_schema_metadata(None)
+                  for body in bodies]
+        if not tables:
+            return {name: np.array([]) for name in columns or [time_field]}
+
+        table = pa.concat_tables(tables)
+        timestamps = table.column(time_field)
+        mask = pc.and_(
+            pc.greater_equal(timestamps, pa.scalar(start, type=timestamps.type)),
+            pc.less(timestamps, pa.scalar(end, type=timestamps.type)),
+        )
+        table = table.filter(mask).sort_by(time_field)
+        return {name: table.column(name).to_numpy(zero_copy_only=False) for name in table.column_names}
@@ -0,0 +1,215 @@
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+
+import pyarrow as pa
+import pyarrow.compute as pc
+from bson import ObjectId, json_util
+from pymongo import MongoClient
+from pymongo.errors import BulkWriteError, CollectionInvalid
+
+from data_processing.archive_formats import read_archive_table
+from data_processing.archive_manifest import ArchiveManifest
+from data_processing.archive_policy import ArchivePolicy, STATS_POLICY
+from service.mongo import MongoDBHelper, MONGO_URI
+from service.s3 import S3Helper
+
+RESTORE_PROGRESS_COLLECTION = "archive_restores"
+DUPLICATE_KEY = 11000
+
+
+def table_to_documents(table: pa.Table) -> List[Dict]:
+    """Turn archived rows back into documents: original _id, no empty columns, extra fields merged back in."""
+    documents = []
+    for row in table.to_pylist():
+        extra = row.pop('extra', None)
+        doc = {name: value for name, value in row.items() if value is not None}
+        if '_id' in doc and ObjectId.is_valid(doc['_id']):
+            doc['_id'] = ObjectId(doc['_id'])
+        if extra:
+            doc.update(json_util.loads(extra))
+        documents.append(doc)
+    return documents
+
+
+class ArchiveRestorer:
+    """
+    Loads archived documents for a set of symbols and a time range back into a
+    Mongo collection.
+
+    Objects are found through the manifest and handled by a pool of workers, each
+    downloading, decoding and inserting one object at a time in insert_many
+    batches spread over several client connections. Inserts are unordered and keep
+    the original _id, so re-inserted documents are skipped as duplicates, and each
+    finished object is recorded in a progress collection so an interrupted restore
+    picks up with the objects it had not finished. Time series collections do not
+    enforce unique _id values, so there only whole objects are skipped on resume.
+    """
+
+    def __init__(self,
+                 database_name: str,
+                 target_collection: str,
+                 policy: ArchivePolicy = STATS_POLICY,
+                 s3_helper: S3Helper = None,
+                 workers: int = 8,
+                 connections: int = 4,
+                 insert_batch_size: int = 10000,
+                 time_series: bool = False,
+                 meta_field: str = None,
+                 progress_interval: float = 10.0):
+        self.database_name = database_name
+        self.target_collection = target_collection
+        self.policy = policy
+        self.s3_helper = s3_helper or S3Helper()
+        self.workers = workers
+        self.insert_batch_size = insert_batch_size
+        self.progress_interval = progress_interval
+
+        self.clients = [MongoClient(MONGO_URI) for _ in range(max(connections, 1))]
+        self.targets = []
+        for client in self.clients:
+            helper = MongoDBHelper(database_name, client=client)
+            helper.set_collection(target_collection)
+            self.targets.append(helper)
+
+        manifest_mongo = MongoDBHelper(database_name, client=self.clients[0])
+        manifest_mongo.set_collection(policy.manifest_collection)
+        self.manifest = ArchiveManifest(manifest_mongo, self.s3_helper, prefix=policy.manifest_prefix,
+                                        partition_keys=policy.partition_keys)
+
+        self.progress = MongoDBHelper(database_name, client=self.clients[0])
+        self.progress.set_collection(RESTORE_PROGRESS_COLLECTION)
+
+        if time_series:
+            self.create_time_series_collection(meta_field)
+
+        self.lock = threading.Lock()
+        self.stats = {}
+
+    def create_time_series_collection(self, meta_field: str = None) -> None:
+        options = {"timeField": self.policy.time_field, "granularity": "seconds"}
+        if meta_field:
+            options["metaField"] = meta_field
+        try:
+            self.targets[0].db.create_collection(self.target_collection, timeseries=options)
+            print(f"Created time series collection {self.target_collection}")
+        except CollectionInvalid:
+            # Already exists, e.g. when resuming
+            pass
+
+    def resolve_entries(self, symbols: List[str], start: datetime, end: datetime,
+                        sources: List[str] = None) -> List[Dict]:
+        """Manifest entries overlapping [start, end) for the symbols (and sources, if given)."""
+        entries = []
+        for symbol in symbols:
+            # Day entries start before a mid-day start; look back one day and drop what ends too early
+            for entry in self.manifest.entries(symbol, None, start - timedelta(days=1), end):
+                if sources and entry.get('source') not in sources:
+                    continue
+                if entry.get('end', entry['hour'] + self.policy.bucket_length) > start:
+                    entries.append(entry)
+        return entries
+
+    def restore(self, symbols: List[str], start: datetime, end: datetime, sources: List[str] = None) -> Dict:
+        """
+        Restore every archived document of symbols with timestamps in [start, end).
+
+        Returns:
+            Dict: Counts of objects, inserted and duplicate documents, bytes and elapsed seconds
+        """
+        entries = self.resolve_entries(symbols, start, end, sources)
+        restore_id = f"{self.target_collection}:{','.join(sorted(symbols))}:{start.isoformat()}:{end.isoformat()}"
+        done = {
+            entry['s3_key'] for entry in
+            self.progress.find_many({"restore": restore_id, "target": self.target_collection})
+        }
+        pending = [entry for entry in entries if entry['s3_key'] not in done]
+
+        self.stats = {
+            'objects': len(entries),
+            'already_restored': len(entries) - len(pending),
+            'restored_objects': 0,
+            'inserted': 0,
+            'duplicates': 0,
+            'bytes': 0,
+            'failed': [],
+            'started': time.monotonic(),
+        }
+        print(f"Restoring {len(pending)} of {len(entries)} archived objects into {self.target_collection} "
+              f"({len(done)} already restored)")
+
+        last_report = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {
+                executor.submit(self.restore_entry, restore_id, entry, start, end, index % len(self.targets)): entry
+                for index, entry in enumerate(pending)
+            }
+            for future in as_completed(futures):
+                entry = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"Error restoring {entry['s3_key']}: {e}")
+                    with self.lock:
+                        self.stats['failed'].append(entry['s3_key'])
+                if time.monotonic() - last_report >= self.progress_interval:
+                    self.report()
+                    last_report = time.monotonic()
+
+        self.report()
+        self.stats['elapsed'] = time.monotonic() - self.stats.pop('started')
+        return self.stats
+
+    def restore_entry(self, restore_id: str, entry: Dict, start: datetime, end: datetime, connection: int) -> None:
+        data = self.s3_helper.download_bytes(entry['s3_key'])
+        if data is None:
+            raise IOError(f"Could not download {entry['s3_key']}")
+        if entry.get('sha256') and hashlib.sha256(data).hexdigest() != entry['sha256']:
+            raise IOError(f"Checksum mismatch for {entry['s3_key']}")
+
+        table = read_archive_table(data, schema=self.policy.schema)
+        timestamps = table.column(self.policy.time_field)
+        mask = pc.and_(
+            pc.greater_equal(timestamps, pa.scalar(start, type=timestamps.type)),
+            pc.less(timestamps, pa.scalar(end, type=timestamps.type)),
+        )
+        documents = table_to_documents(table.filter(mask))
+
+        target = self.targets[connection]
+        inserted = duplicates = 0
+        for i in range(0, len(documents), self.insert_batch_size):
+            batch = documents[i:i + self.insert_batch_size]
+            try:
+                inserted += len(target.insert_many(batch, ordered=False))
+            except BulkWriteError as e:
+                errors = e.details.get('writeErrors', [])
+                if any(error.get('code') != DUPLICATE_KEY for error in errors):
+                    raise
+                inserted += e.details.get('nInserted', 0)
+                duplicates += len(errors)
+
+        self.progress.collection.update_one(
+            {"restore": restore_id, "target": self.target_collection, "s3_key": entry['s3_key']},
+            {"$set": {"documents": len(documents), "restored_at": datetime.now(timezone.utc)}},
+            upsert=True
+        )
+        with self.lock:
+            self.stats['restored_objects'] += 1
+            self.stats['inserted'] += inserted
+            self.stats['duplicates'] += duplicates
+            self.stats['bytes'] += len(data)
+
+    def report(self) -> None:
+        elapsed = max(time.monotonic() - self.stats['started'], 1e-9)
+        with self.lock:
+            stats = dict(self.stats)
+        print(f"Restored {stats['restored_objects'] + stats['already_restored']}/{stats['objects']} objects, "
+              f"{stats['inserted']} documents inserted ({stats['duplicates']} duplicates skipped), "
+              f"{stats['inserted'] / elapsed:.0f} docs/s, {stats['bytes'] / elapsed / 1024 ** 2:.1f} MB/s")
+
+    def close(self) -> None:
+        for client in self.clients:
+            client.close()
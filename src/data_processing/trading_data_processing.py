@@ -1,192 +1,217 @@
-from datetime import datetime, timedelta
-from typing import List, Dict
-import json
-from bson import json_util
-from service.mongo import MongoDBHelper
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import List, Dict, Iterator, Tuple
+from pymongo import DeleteMany, MongoClient
+from service.mongo import MongoDBHelper, MONGO_URI
 from service.s3 import S3Helper
+from data_processing.archive_formats import get_archive_format
+from data_processing.archive_manifest import ArchiveManifest
+from data_processing.archive_pipeline import ArchivePipeline
+from data_processing.archive_policy import ArchivePolicy, DEFAULT_POLICIES, STATS_POLICY
 
 class TradingDataProcessor:
+    """Archives one collection to S3 as described by its ArchivePolicy, then deletes what was archived."""
+
     def __init__(self, 
                  database_name: str,
-                 collection_name: str):
-        self.mongo_helper = MongoDBHelper(database_name)
-        self.mongo_helper.set_collection(collection_name)
-        self.s3_helper = S3Helper()
-
-    def get_documents_older_than_24h(self) -> List[Dict]:
-        """Fetch documents older than 24 hours from MongoDB."""
-        current_time = datetime.utcnow()
-        # Round up to the next hour
-        if current_time.minute > 0 or current_time.second > 0:
-            current_time = (current_time + timedelta(hours=1)).replace(minute=0, second=0, microsecond=0)
-        
-        cutoff_time = current_time - timedelta(hours=24)
-        
+                 collection_name: str = None,
+                 batch_size: int = 5000,
+                 projection: Dict = None,
+                 archive_format: str = None,
+                 serialize_workers: int = 2,
+                 upload_workers: int = 8,
+                 delete_batch_size: int = 50000,
+                 queue_size: int = 16,
+                 delete_chunk_size: int = 100,
+                 policy: ArchivePolicy = STATS_POLICY,
+                 s3_helper: S3Helper = None,
+                 client: MongoClient = None):
+        self.policy = policy
+        self.owns_client = client is None
+        self.mongo_helper = MongoDBHelper(database_name, client=client)
+        self.mongo_helper.set_collection(collection_name or policy.collection_name)
+        self.mongo_helper.create_index(policy.sort)
+        self.s3_helper = s3_helper or S3Helper()
+        self.batch_size = batch_size
+        self.projection = projection if projection is not None else policy.projection
+        self.delete_chunk_size = delete_chunk_size
+        self.unverified_groups: List[Dict] = []
+        # The manifest shares the connection pool of the collection it describes
+        manifest_mongo = MongoDBHelper(database_name, client=self.mongo_helper.client)
+        manifest_mongo.set_collection(policy.manifest_collection)
+        self.manifest = ArchiveManifest(manifest_mongo, self.s3_helper, prefix=policy.manifest_prefix,
+                                        partition_keys=policy.partition_keys)
+        self.archive_format = get_archive_format(archive_format or policy.archive_format, policy.schema)
+        self.pipeline = ArchivePipeline(
+            self.archive_format,
+            self.s3_helper,
+            self.delete_confirmed_groups,
+            serialize_workers=serialize_workers,
+            upload_workers=upload_workers,
+            delete_batch_size=delete_batch_size,
+            queue_size=queue_size,
+            manifest=self.manifest,
+            object_prefix=policy.object_prefix
+        )
+
+    def get_cutoff_time(self) -> datetime:
+        """Start of the time bucket holding now minus the policy's retention."""
+        cutoff_time = self.policy.cutoff()
+        print(f"Current time: {datetime.utcnow()}")
+        print(f"Processing {self.policy.collection_name} documents older than: {cutoff_time}")
+        return cutoff_time
+
+    def iter_groups(self) -> Iterator[Tuple[str, Dict]]:
+        """
+        Stream documents past retention and yield one group (e.g. symbol-hour) at a time.
+
+        The cursor is sorted by the partition keys and then time, so a group is
+        complete as soon as the cursor moves past it and memory stays at one group.
+        """
+        policy = self.policy
         query = {
-            "timestamp": {
-                "$lt": cutoff_time
+            policy.time_field: {
+                "$lt": self.get_cutoff_time()
             }
         }
-        from pprint import pprint
-        print("Query cutoff time:")
-        print(f"Current time: {datetime.utcnow()}")
-        print(f"Rounded current time: {current_time}")
-        print(f"Processing documents older than: {cutoff_time}")
-        pprint(query)
-        
-        return self.mongo_helper.find_many(query)
-
-    def group_by_hour(self, documents: List[Dict]) -> Dict[str, List[Dict]]:
-        """Group documents by hour intervals."""
-        hourly_groups = {}
-        
-        for doc in documents:
-            if doc is None:
-                continue
-            
-            # Get the start of the hour for the document's timestamp
-            timestamp = doc['timestamp']
-            hour_start = timestamp.replace(minute=0, second=0, microsecond=0)
-            hour_end = hour_start + timedelta(hours=1)
-            
-            # Create key for the hour group
-            key = f"{doc['symbol']}_{doc['source']}_{hour_start.strftime('%Y-%m-%d_%H')}"
-            
-            if key not in hourly_groups:
-                hourly_groups[key] = {
-                    'start_time': hour_start,
-                    'end_time': hour_end,
-                    'symbol': doc['symbol'],
-                    'source': doc['source'],
-                    'documents': [],
-                    'document_ids': []
-                }
-            
-            hourly_groups[key]['documents'].append(doc)
-            hourly_groups[key]['document_ids'].append(doc['_id'])
-        
-        return hourly_groups
+        cursor = self.mongo_helper.find_cursor(
+            query,
+            projection=self.projection,
+            sort=policy.sort,
+            batch_size=self.batch_size
+        )
 
-    def upload_hour_group_to_s3(self, key: str, group: Dict) -> bool:
-        """Upload a single hour group directly to S3."""
+        key = None
+        group = None
         try:
-            # Prepare the output data structure
-            output_data = {
-                "symbol": group['symbol'],
-                "source": group['source'],
-                "interval_start": group['start_time'].strftime("%Y-%m-%d %H:%M:%S"),
-                "interval_end": group['end_time'].strftime("%Y-%m-%d %H:%M:%S"),
-                "total_documents": len(group['documents']),
-                "documents": group['documents']
-            }
-            
-            # Convert to JSON string
-            json_data = json.dumps(output_data, default=json_util.default, indent=2)
-            
-            # Create S3 key with symbol-based path
-            s3_key = f"data/{group['symbol']}/{key}.json"
-            
-            # Upload directly to S3
-            self.s3_helper.s3_client.put_object(
-                Bucket=self.s3_helper.bucket_name,
-                Key=s3_key,
-                Body=json_data
-            )
-            
-            print(f"Uploaded to S3: {s3_key} with {len(group['documents'])} documents")
-            return True
-            
-        except Exception as e:
-            print(f"Error uploading to S3: {e}")
-            return False
+            for doc in cursor:
+                bucket_start = policy.bucket_start(doc[policy.time_field])
+                partition = {name: doc.get(name) for name in policy.partition_keys}
+                doc_key = policy.group_key(partition, bucket_start)
 
-    def delete_processed_documents(self, document_ids: List) -> int:
-        """Delete processed documents from MongoDB."""
-        try:
-            query = {
-                "_id": {"$in": document_ids}
-            }
-            deleted_count = self.mongo_helper.delete_many(query)
-            print(f"Deleted {deleted_count} documents from MongoDB")
-            return deleted_count
-            
-        except Exception as e:
-            print(f"Error deleting documents from MongoDB: {e}")
-            return 0
+                if doc_key != key:
+                    if group is not None:
+                        yield key, group
+                    key = doc_key
+                    group = {
+                        'start_time': bucket_start,
+                        'end_time': bucket_start + policy.bucket_length,
+                        'granularity': policy.granularity,
+                        'partition': partition,
+                        **partition,
+                        'documents': []
+                    }
+
+                group['documents'].append(doc)
+
+            if group is not None:
+                yield key, group
+        finally:
+            cursor.close()
+
+    def delete_confirmed_groups(self, groups: List[Dict]) -> int:
+        """
+        Delete the documents of groups recorded in the manifest, as range deletes in
+        chunks of delete_chunk_size, and check each chunk with a count on the same ranges.
+        """
+        deleted_count = 0
+        for i in range(0, len(groups), self.delete_chunk_size):
+            chunk = groups[i:i + self.delete_chunk_size]
+            filters = [self.policy.range_filter(group) for group in chunk]
+            try:
+                result = self.mongo_helper.bulk_write([DeleteMany(f) for f in filters], ordered=False)
+                deleted_count += result.deleted_count
+                remaining = self.mongo_helper.count_documents({"$or": filters})
+            except Exception as e:
+                print(f"Error deleting documents from MongoDB: {e}")
+                self.unverified_groups.extend(chunk)
+                continue
+
+            if remaining:
+                print(f"{remaining} documents remain in {len(chunk)} archived ranges")
+                self.unverified_groups.extend(chunk)
+            else:
+                self.manifest.mark_deleted([group['key'] for group in chunk])
+
+        print(f"Deleted {deleted_count} documents from MongoDB")
+        return deleted_count
 
     def verify_deletion(self) -> bool:
-        """Verify that no documents older than 24 hours remain."""
-        cutoff_time = datetime.utcnow() - timedelta(hours=24)
+        """Verify that every archived range was emptied and no documents past retention remain."""
         query = {
-            "timestamp": {"$lt": cutoff_time}
+            self.policy.time_field: {"$lt": self.policy.cutoff()}
         }
-        remaining_docs = self.mongo_helper.find_many(query)
-        return len(remaining_docs) == 0
+        return not self.unverified_groups and self.mongo_helper.count_documents(query, limit=1) == 0
 
-    def process_upload_and_cleanup(self):
-        """Main method to process documents older than 24h, upload to S3, and clean up MongoDB."""
+    def process_upload_and_cleanup(self) -> Dict:
+        """Main method to process documents past retention, upload to S3, and clean up MongoDB."""
+        summary = {}
         try:
-            # Fetch documents older than 24 hours
-            print("Fetching documents older than 24 hours...")
-            documents = self.get_documents_older_than_24h()
-            if not documents:
-                print("No documents found older than 24 hours.")
-                return
-            
-            # Group documents by hour
-            print(f"Grouping {len(documents)} documents by hour...")
-            hourly_groups = self.group_by_hour(documents)
-            print(f"Found {len(hourly_groups)} hour groups")
+            print(f"Streaming {self.policy.collection_name} documents past retention...")
+            summary = self.pipeline.run(self.iter_groups())
             
-            # Process each group
-            total_processed = 0
-            total_deleted = 0
-            failed_uploads = []
-            
-            for key, group in hourly_groups.items():
-                print(f"\nProcessing group: {key}")
-                print(f"Documents in group: {len(group['documents'])}")
-                
-                # Upload to S3
-                if self.upload_hour_group_to_s3(key, group):
-                    total_processed += 1
-                    # Delete from MongoDB only if S3 upload was successful
-                    deleted_count = self.delete_processed_documents(group['document_ids'])
-                    total_deleted += deleted_count
-                else:
-                    failed_uploads.append(key)
-                    print(f"Failed to upload group: {key}")
+            if summary['total_groups'] == 0:
+                print(f"No {self.policy.collection_name} documents found past retention.")
+                return summary
             
             # Verify deletion
             all_deleted = self.verify_deletion()
             
-            print(f"\nProcessing Summary:")
-            print(f"- Total documents processed: {len(documents)}")
-            print(f"- Hour groups processed: {len(hourly_groups)}")
-            print(f"- Files uploaded to S3: {total_processed}")
-            print(f"- Documents deleted from MongoDB: {total_deleted}")
+            print(f"\nProcessing Summary for {self.policy.collection_name}:")
+            print(f"- Total documents processed: {summary['total_documents']}")
+            print(f"- Groups processed: {summary['total_groups']}")
+            print(f"- Files uploaded to S3: {summary['uploaded']} ({summary['uploaded_bytes']} bytes)")
+            print(f"- Groups already in the manifest: {summary['skipped']}")
+            print(f"- Documents deleted from MongoDB: {summary['deleted']}")
             print(f"- All old documents deleted: {'Yes' if all_deleted else 'No'}")
             
-            if failed_uploads:
-                print(f"\nFailed uploads ({len(failed_uploads)}):")
-                for failed_key in failed_uploads:
+            if summary['failed']:
+                print(f"\nFailed uploads ({len(summary['failed'])}):")
+                for failed_key in summary['failed']:
                     print(f"- {failed_key}")
+
+            if summary['conflicts']:
+                print(f"\nGroups left in MongoDB, their archive already exists ({len(summary['conflicts'])}):")
+                for conflict_key in summary['conflicts']:
+                    print(f"- {conflict_key}")
             
         except Exception as e:
-            print(f"Error in processing: {e}")
+            print(f"Error in processing {self.policy.collection_name}: {e}")
         finally:
-            self.mongo_helper.close_connection()
+            if self.owns_client:
+                self.mongo_helper.close_connection()
+        return summary
+
+def archive_collections(database_name: str, policies: List[ArchivePolicy], max_parallel: int = 4, **kwargs) -> Dict:
+    """
+    Archive several collections in one run, each through its own pipeline, sharing
+    one Mongo connection pool and one S3 client.
+
+    Returns:
+        Dict: Summary per collection name
+    """
+    client = MongoClient(MONGO_URI)
+    s3_helper = S3Helper()
+    try:
+        processors = [
+            TradingDataProcessor(database_name, policy=policy, s3_helper=s3_helper, client=client, **kwargs)
+            for policy in policies
+        ]
+        with ThreadPoolExecutor(max_workers=max_parallel) as executor:
+            summaries = executor.map(lambda processor: processor.process_upload_and_cleanup(), processors)
+            return {policy.collection_name: summary for policy, summary in zip(policies, summaries)}
+    finally:
+        client.close()
 
 def main():
     # Configuration
     config = {
         "database_name": "bitpulse_v2",
-        "collection_name": "transactions_stats_second"
+        "policies": DEFAULT_POLICIES
     }
     
-    # Initialize and run processor
-    processor = TradingDataProcessor(**config)
-    processor.process_upload_and_cleanup()
+    # Archive every configured collection
+    archive_collections(**config)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,40 @@
+import asyncio
+import logging
+import sys
+from datetime import timezone
+from bson import CodecOptions
+from service.async_mongo import AsyncMongoDBHelper
+from binance.order_book import CustomFormatter
+from binance.multi_order_book import MultiOrderBookManager
+from binance.l2_snapshots import L2SnapshotRecorder
+
+# Parse command-line arguments
+args = dict(arg.split('=', 1) for arg in sys.argv[1:])
+DB_NAME = args.get('db_name', 'testing')
+STATS_COLLECTION = args.get('stats_collection', 'order_book_stats')
+SYMBOLS_PER_CONNECTION = int(args.get('symbols_per_connection', '100'))
+
+# Optional L2 sampling to hourly .npz files, e.g. snapshot_dir=/app/l2_data
+SNAPSHOT_DIR = args.get('snapshot_dir')
+SNAPSHOT_DEPTH = int(args.get('snapshot_depth', '20'))
+SNAPSHOT_INTERVAL = float(args.get('snapshot_interval', '1'))
+
+# Parse symbols from command-line argument
+symbols_str = args.get('symbols', '')
+SYMBOLS = [symbol.strip().upper() for symbol in symbols_str.split(',')] if symbols_str else ['BTCUSDT']
+
+if __name__ == "__main__":
+    logger = logging.getLogger()
+    logger.setLevel(logging.INFO)
+    ch = logging.StreamHandler()
+    ch.setFormatter(CustomFormatter())
+    logger.addHandler(ch)
+
+    mongo_helper = AsyncMongoDBHelper(DB_NAME)
+    mongo_helper.set_codec_options(CodecOptions(tz_aware=True, tzinfo=timezone.utc))
+
+    snapshot_recorder = L2SnapshotRecorder(SNAPSHOT_DIR, SNAPSHOT_DEPTH, SNAPSHOT_INTERVAL) if SNAPSHOT_DIR else None
+
+    manager = MultiOrderBookManager(SYMBOLS, mongo_helper, STATS_COLLECTION, SYMBOLS_PER_CONNECTION,
+                                    snapshot_recorder=snapshot_recorder)
+    asyncio.run(manager.run())
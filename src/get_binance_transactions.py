@@ -1,6 +1,8 @@
 import asyncio
 import sys
 from binance.transactions import main
+from service.mongo import MongoDBHelper
+from service.shard_planner import load_shard_pairs
 
 # Parse command-line arguments
 args = dict(arg.split('=', 1) for arg in sys.argv[1:])
@@ -12,5 +14,23 @@ BIG_TRANSACTIONS_COLLECTION = args.get('big_transactions_collection', 'binance_b
 usdt_pairs_str = args.get('pairs', '')
 PAIRS = [pair.strip() for pair in usdt_pairs_str.split(',')] if usdt_pairs_str else ['BTCUSDT']
 
+# Or take the pairs of a planned shard (see plan_shards.py) instead of pairs=
+SHARD = args.get('shard')
+if SHARD is not None:
+    mongo_helper = MongoDBHelper(DB_NAME)
+    try:
+        PAIRS = load_shard_pairs(mongo_helper, 'binance', int(SHARD))
+    finally:
+        mongo_helper.close_connection()
+    if not PAIRS:
+        sys.exit(f"No pairs planned for binance shard {SHARD}, run plan_shards.py first")
+
+# Pairs that subscribe to @aggTrade instead of @trade
+agg_trade_pairs_str = args.get('agg_trade_pairs', '')
+STREAM_TYPES = {pair.strip(): 'aggTrade' for pair in agg_trade_pairs_str.split(',') if pair.strip()}
+
+# Enrich per-second stats with best bid/ask from @bookTicker
+BOOK_TICKER = args.get('book_ticker', 'false').lower() == 'true'
+
 if __name__ == "__main__":
-    asyncio.run(main(DB_NAME, STATS_COLLECTION, BIG_TRANSACTIONS_COLLECTION, PAIRS))
\ No newline at end of file
+    asyncio.run(main(DB_NAME, STATS_COLLECTION, BIG_TRANSACTIONS_COLLECTION, PAIRS, STREAM_TYPES, BOOK_TICKER))
\ No newline at end of file
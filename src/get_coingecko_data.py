@@ -6,8 +6,10 @@ from coingecko.coingecko_data import main
 args = dict(arg.split('=', 1) for arg in sys.argv[1:])
 DB_NAME = args.get('db_name', 'testing')
 DATA_COLLECTION = args.get('data_collection', 'coingecko_data')
+METRICS_PORT = int(args.get('metrics_port', 8003))
+HISTORY_COLLECTION = args.get('history_collection', 'coingecko_history')
 
 # Parse usdt_pairs from command-line argument
 
 if __name__ == "__main__":
-    asyncio.run(main(DB_NAME, DATA_COLLECTION))
\ No newline at end of file
+    asyncio.run(main(DB_NAME, DATA_COLLECTION, METRICS_PORT, HISTORY_COLLECTION))
\ No newline at end of file
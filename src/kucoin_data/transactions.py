@@ -1,9 +1,13 @@
 import asyncio
 import json
 import os
+import time
 from datetime import datetime, timezone
 from kucoin.client import Client
 from service.async_mongo import AsyncMongoDBHelper
+from service.trade_sequence import TradeSequenceTracker
+from service.top_of_book import TopOfBook
+from service.latest_prices import LatestPriceStore
 from bson import CodecOptions
 import websockets
 from prometheus_client import start_http_server, Counter, Gauge
@@ -14,9 +18,11 @@ TRANSACTIONS_TOTAL = Counter('kucoin_transactions_total', 'Total number of trans
 TRANSACTION_VALUE = Counter('kucoin_transaction_value_total', 'Total value of transactions', ['symbol', 'side'])
 PRICE_GAUGE = Gauge('kucoin_price', 'Current price', ['symbol'])
 BIG_TRANSACTIONS = Counter('kucoin_big_transactions_total', 'Number of big transactions', ['symbol', 'side'])
+MISSED_TRADES = Gauge('kucoin_missed_trades', 'Trades missed according to gaps in trade ids', ['symbol'])
+DUPLICATE_TRADES = Gauge('kucoin_duplicate_trades', 'Duplicate trades suppressed by sequence', ['symbol'])
 
 class KucoinWebSocket:
-    def __init__(self, pairs, mongo_helper: AsyncMongoDBHelper, stats_collection, big_transactions_collection):
+    def __init__(self, pairs, mongo_helper: AsyncMongoDBHelper, stats_collection, big_transactions_collection, book_ticker=False):
         self.pairs = pairs
         self.transactions = {}
         self.big_transactions = {}
@@ -29,6 +35,13 @@ class KucoinWebSocket:
         self.BIG_TRANSACTION_THRESHOLD = 10000  # $10,000 threshold for big transactions
         self.stats_collection = stats_collection
         self.big_transactions_collection = big_transactions_collection
+        # Latest price per symbol, mirrored to the latest_prices collection
+        self.latest_prices = LatestPriceStore(mongo_helper)
+        # Match sequences share the order book sequence space, so they increase
+        # but are not contiguous: use them for duplicate suppression only
+        self.sequence_tracker = TradeSequenceTracker(count_gaps=False)
+        # Optional best bid/ask enrichment from /market/ticker on the same connection
+        self.top_of_book = TopOfBook(pairs) if book_ticker else None
         start_http_server(8001)  # Prometheus will scrape metrics from this port
 
         # KuCoin client setup
@@ -68,6 +81,16 @@ class KucoinWebSocket:
                         await websocket.send(json.dumps(subscribe_message))
                         print(f"Sent subscription request for {symbol}")
 
+                        if self.top_of_book:
+                            await websocket.send(json.dumps({
+                                "id": f"{symbol}-ticker",
+                                "type": "subscribe",
+                                "topic": f"/market/ticker:{symbol}",
+                                "privateChannel": False,
+                                "response": True
+                            }))
+                            print(f"Sent ticker subscription request for {symbol}")
+
                     # Reset retry counters on successful connection
                     retry_count = 0
                     retry_delay = self.initial_retry_delay
@@ -109,9 +132,20 @@ class KucoinWebSocket:
 
     async def handle_message(self, message):
         try:
+            if self.top_of_book and message['type'] == 'message' and message['subject'] == 'trade.ticker':
+                data = message['data']
+                symbol = message['topic'].split(':', 1)[1]
+                self.top_of_book.update(symbol, float(data['bestBid']), float(data['bestAsk']))
+                return
+
             if message['type'] == 'message' and message['subject'] == 'trade.l3match':
                 data = message['data']
                 symbol = data['symbol']
+
+                # Drop matches re-received after a reconnect
+                if not self.sequence_tracker.observe(symbol, int(data['sequence'])):
+                    return
+
                 price = float(data['price'])
                 quantity = float(data['size'])
                 timestamp = int(data['time'])
@@ -171,6 +205,8 @@ class KucoinWebSocket:
                 big_transaction_documents = []
                 price_documents = []
                 price_updates = {}  # Store latest prices for DATA collection
+                book_stats = self.top_of_book.close_interval(time.time()) if self.top_of_book else {}
+                sequence_counts = self.sequence_tracker.pop_interval_counts()
 
                 for symbol, data in self.transactions.items():
                     standard_symbol = symbol.replace('-','')  # Convert BTC-USDT to BTCUSDT
@@ -210,6 +246,11 @@ class KucoinWebSocket:
                             print(f"{symbol} {side}: No trades")
 
                     if has_trades:
+                        missed_trades, duplicate_trades = sequence_counts.get(symbol, (0, 0))
+                        output_data["missed_trades"] = missed_trades
+                        output_data["duplicate_trades"] = duplicate_trades
+                        if symbol in book_stats:
+                            output_data.update(book_stats[symbol])
                         documents.append(output_data)
 
                         # Calculate weighted average price
@@ -247,6 +288,11 @@ class KucoinWebSocket:
                                 "quoteCurrency": quote_currency
                             })
 
+                # Export sequence health per symbol
+                for symbol, missed in self.sequence_tracker.missed_total.items():
+                    MISSED_TRADES.labels(symbol=symbol).set(missed)
+                    DUPLICATE_TRADES.labels(symbol=symbol).set(self.sequence_tracker.duplicate_total[symbol])
+
                 # Insert regular transactions
                 if documents:
                     self.mongo_helper.set_collection(self.stats_collection)
@@ -268,12 +314,23 @@ class KucoinWebSocket:
                 else:
                     print("No big transactions to insert")
 
+                # Latest price per symbol, only the ones that changed
+                await self.store_latest_prices(price_documents, price_updates)
+
                 print("Data processing and storage completed successfully")
             except Exception as e:
                 print(f"Error in process_and_store_data: {e}")
             finally:
                 print("-"*50)
 
+    async def store_latest_prices(self, price_documents, price_updates):
+        try:
+            updated = await self.latest_prices.update("kucoin", price_documents, price_updates)
+            if updated:
+                print(f"Updated {updated} prices in {self.latest_prices.collection_name}")
+        except Exception as e:
+            print(f"Error updating latest prices: {e}")
+
     async def bulk_insert(self, documents):
         try:
             result = await self.mongo_helper.insert_many(documents)
@@ -307,7 +364,7 @@ class KucoinWebSocket:
             await self.process_and_store_data()
         # Add any other cleanup code here
 
-async def main(db_name, stats_collection, big_transactions_collection, pairs):
+async def main(db_name, stats_collection, big_transactions_collection, pairs, book_ticker=False):
     try:
         mongo_helper = AsyncMongoDBHelper(db_name)
 
@@ -319,7 +376,7 @@ async def main(db_name, stats_collection, big_transactions_collection, pairs):
         mongo_helper.set_collection(stats_collection)
 
         kucoin_ws = KucoinWebSocket(pairs, mongo_helper, stats_collection, 
-                                   big_transactions_collection)
+                                   big_transactions_collection, book_ticker)
         
         print("Starting KuCoin WebSocket connection")
         await kucoin_ws.connect()
@@ -0,0 +1,30 @@
+import sys
+from datetime import timedelta
+from service.mongo import MongoDBHelper
+from service.shard_planner import ShardPlanner
+
+# Parse command-line arguments
+args = dict(arg.split('=', 1) for arg in sys.argv[1:])
+DB_NAME = args.get('db_name', 'bitpulse_v2')
+EXCHANGE = args.get('exchange', 'binance')
+SHARDS = int(args.get('shards', 2))
+STATS_COLLECTION = args.get('stats_collection', 'transactions_stats_second')
+WINDOW_HOURS = float(args.get('window_hours', 24))
+TOLERANCE = float(args.get('tolerance', 0.05))
+# Re-plan every interval seconds; plan once if 0
+INTERVAL = float(args.get('interval', 0))
+
+if __name__ == "__main__":
+    mongo_helper = MongoDBHelper(DB_NAME)
+    try:
+        planner = ShardPlanner(
+            mongo_helper,
+            EXCHANGE,
+            SHARDS,
+            stats_collection=STATS_COLLECTION,
+            window=timedelta(hours=WINDOW_HOURS),
+            tolerance=TOLERANCE
+        )
+        planner.run(INTERVAL)
+    finally:
+        mongo_helper.close_connection()
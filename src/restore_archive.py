@@ -0,0 +1,53 @@
+import sys
+from datetime import datetime
+from data_processing.archive_policy import DEFAULT_POLICIES
+from data_processing.archive_restore import ArchiveRestorer
+
+# Parse command-line arguments
+args = dict(arg.split('=', 1) for arg in sys.argv[1:])
+DB_NAME = args.get('db_name', 'bitpulse_v2')
+# Which archived collection to restore from, e.g. transactions_stats_second or big_transactions
+SOURCE_COLLECTION = args.get('archive', 'transactions_stats_second')
+TARGET_COLLECTION = args.get('target_collection', f"{SOURCE_COLLECTION}_restored")
+
+symbols_str = args.get('symbols', '')
+SYMBOLS = [symbol.strip() for symbol in symbols_str.split(',') if symbol.strip()]
+sources_str = args.get('sources', '')
+SOURCES = [source.strip() for source in sources_str.split(',') if source.strip()] or None
+
+# UTC, e.g. start=2024-01-01T00:00 end=2024-01-02T00:00
+START = datetime.fromisoformat(args['start']) if 'start' in args else None
+END = datetime.fromisoformat(args['end']) if 'end' in args else None
+
+WORKERS = int(args.get('workers', 8))
+CONNECTIONS = int(args.get('connections', 4))
+BATCH_SIZE = int(args.get('batch_size', 10000))
+TIME_SERIES = args.get('time_series', 'false').lower() == 'true'
+META_FIELD = args.get('meta_field')
+
+if __name__ == "__main__":
+    if not SYMBOLS or START is None or END is None:
+        sys.exit("Usage: restore_archive.py symbols=BTCUSDT,ETHUSDT start=2024-01-01T00:00 end=2024-01-02T00:00 "
+                 "[db_name=] [archive=] [target_collection=] [sources=] [workers=] [connections=] "
+                 "[batch_size=] [time_series=true] [meta_field=]")
+
+    policies = {policy.collection_name: policy for policy in DEFAULT_POLICIES}
+    if SOURCE_COLLECTION not in policies:
+        sys.exit(f"No archive policy for {SOURCE_COLLECTION}. Choose from {', '.join(policies)}")
+
+    restorer = ArchiveRestorer(
+        DB_NAME,
+        TARGET_COLLECTION,
+        policy=policies[SOURCE_COLLECTION],
+        workers=WORKERS,
+        connections=CONNECTIONS,
+        insert_batch_size=BATCH_SIZE,
+        time_series=TIME_SERIES,
+        meta_field=META_FIELD
+    )
+    try:
+        stats = restorer.restore(SYMBOLS, START, END, SOURCES)
+        print(f"Done in {stats['elapsed']:.1f}s: {stats['inserted']} documents inserted, "
+              f"{stats['duplicates']} duplicates skipped, {len(stats['failed'])} objects failed")
+    finally:
+        restorer.close()
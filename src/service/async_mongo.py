@@ -2,6 +2,7 @@ import os
 from typing import List, Dict, Any
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase, AsyncIOMotorCollection
 from pymongo import UpdateOne
+from pymongo.results import BulkWriteResult
 from bson import CodecOptions
 from dotenv import load_dotenv
 
@@ -76,8 +77,8 @@ class AsyncMongoDBHelper:
         result = await self.collection.delete_many(query)
         return result.deleted_count
 
-    async def bulk_write(self, operations: List[UpdateOne]) -> None:
-        await self.collection.bulk_write(operations)
+    async def bulk_write(self, operations: List[UpdateOne], ordered: bool = True) -> BulkWriteResult:
+        return await self.collection.bulk_write(operations, ordered=ordered)
 
     async def close_connection(self) -> None:
         self.client.close()
\ No newline at end of file
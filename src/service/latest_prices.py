@@ -0,0 +1,87 @@
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from service.async_mongo import AsyncMongoDBHelper
+from service.mongo import MongoDBHelper
+
+LATEST_PRICES = "latest_prices"
+
+
+def price_id(source: str, symbol: str) -> str:
+    return f"{source}:{symbol}"
+
+
+class LatestPriceStore:
+    """
+    Latest trade-weighted price of every (source, symbol) a collector sees, kept
+    in memory and mirrored to a small collection with one document per pair
+    (_id "binance:BTCUSDT"), so "current price of X" is a point read.
+
+    Each interval writes one unordered bulk write of upserts for the pairs whose
+    price changed; pairs without trades or with the same price are left as is.
+    """
+
+    def __init__(self, mongo_helper: AsyncMongoDBHelper, collection_name: str = LATEST_PRICES):
+        self.mongo_helper = mongo_helper
+        self.collection_name = collection_name
+        self.prices: Dict[Tuple[str, str], Dict] = {}
+        # Latest price per source and lower case base token, e.g. {"binance": {"btc": 91987.08}}
+        self.token_prices: Dict[str, Dict[str, float]] = {}
+        self.loaded = False
+
+    async def load(self) -> None:
+        """Start from the stored prices, so unchanged pairs are not rewritten after a restart."""
+        self.mongo_helper.set_collection(self.collection_name)
+        for document in await self.mongo_helper.find_many({}):
+            document.pop('_id', None)
+            self.prices[(document['source'], document['symbol'])] = document
+        self.loaded = True
+
+    def get(self, source: str, symbol: str) -> Optional[Dict]:
+        return self.prices.get((source, symbol))
+
+    def get_token_price(self, source: str, token: str) -> Optional[float]:
+        return self.token_prices.get(source, {}).get(token.lower())
+
+    async def update(self, source: str, price_documents: List[Dict], price_updates: Dict[str, float] = None) -> int:
+        """
+        Record one interval's prices of a source and persist the changed ones.
+
+        Args:
+            source: Exchange, e.g. binance
+            price_documents: {timestamp, symbol, source, price, baseCurrency, quoteCurrency} per traded pair
+            price_updates: Price per lower case base token from the same interval
+
+        Returns:
+            int: Number of pairs written
+        """
+        if not self.loaded:
+            await self.load()
+        if price_updates:
+            self.token_prices.setdefault(source, {}).update(price_updates)
+
+        changed = []
+        for document in price_documents:
+            previous = self.prices.get((document['source'], document['symbol']))
+            if previous is None or previous['price'] != document['price']:
+                changed.append(document)
+        if not changed:
+            return 0
+
+        self.mongo_helper.set_collection(self.collection_name)
+        await self.mongo_helper.bulk_write([
+            UpdateOne({"_id": price_id(document['source'], document['symbol'])}, {"$set": document}, upsert=True)
+            for document in changed
+        ], ordered=False)
+        # Only once stored, so pairs of a failed write are written again next interval
+        for document in changed:
+            self.prices[(document['source'], document['symbol'])] = document
+        return len(changed)
+
+
+def get_latest_price(mongo_helper: MongoDBHelper, source: str, symbol: str,
+                     collection_name: str = LATEST_PRICES) -> Optional[Dict]:
+    """Latest price document of a pair, e.g. get_latest_price(helper, "binance", "BTCUSDT")."""
+    mongo_helper.set_collection(collection_name)
+    return mongo_helper.find_one({"_id": price_id(source, symbol)})
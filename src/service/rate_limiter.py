@@ -0,0 +1,209 @@
+import asyncio
+import logging
+import random
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlencode, urlsplit
+
+import aiohttp
+
+# (request weight, seconds) each API host allows per IP
+HOST_LIMITS: Dict[str, Tuple[float, float]] = {
+    "api.binance.com": (4800, 60.0),  # 6000 weight per minute, keeping 20% for other clients on the IP
+    "api.kucoin.com": (2000, 30.0),   # public endpoint pool
+    "api.coingecko.com": (5, 60.0),   # public API without a key
+}
+DEFAULT_LIMIT = (600, 60.0)
+
+# Headers in which Binance reports the weight already used in the current minute
+USED_WEIGHT_HEADERS = ("X-MBX-USED-WEIGHT-1M", "X-MBX-USED-WEIGHT")
+RETRY_STATUSES = (418, 429, 500, 502, 503, 504)
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Request weight budget of one API host.
+
+    Holds up to capacity tokens, refilled continuously over period seconds.
+    Requests take their weight immediately while tokens last, so any number of
+    them run concurrently within the budget; once it is spent, each caller
+    reserves its weight ahead of time and sleeps until it has been refilled,
+    which keeps waiters in arrival order without a lock.
+    """
+
+    def __init__(self, capacity: float, period: float = 60.0):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, weight: float = 1) -> None:
+        """Wait until the request weight fits into the budget, then spend it."""
+        now = time.monotonic()
+        if self.paused_until > now:
+            await asyncio.sleep(self.paused_until - now)
+            now = time.monotonic()
+        self._refill(now)
+        self.tokens -= min(weight, self.capacity)
+        if self.tokens < 0:
+            await asyncio.sleep(-self.tokens / self.rate)
+        # A pause may have started while this request was waiting for its tokens
+        while self.paused_until > time.monotonic():
+            await asyncio.sleep(self.paused_until - time.monotonic())
+
+    def available(self) -> float:
+        """Tokens that can be spent right now without waiting."""
+        now = time.monotonic()
+        if self.paused_until > now:
+            return 0.0
+        self._refill(now)
+        return max(self.tokens, 0.0)
+
+    def pause(self, seconds: float) -> None:
+        """Hold back every request to the host, e.g. after a 429 with Retry-After."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def observe_used(self, used: float) -> None:
+        """Align the budget with the weight the server reports as used."""
+        # Other clients on the same IP count against the same limit
+        self._refill(time.monotonic())
+        self.tokens = min(self.tokens, self.capacity - used)
+
+
+class ResponseCache:
+    """
+    Last ETag and parsed body per request, so repeated GETs can be sent as
+    If-None-Match and answered with 304 Not Modified. Least recently used
+    entries are dropped beyond max_entries.
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, Tuple[str, Any]]" = OrderedDict()
+
+    @staticmethod
+    def key(url: str, params: Dict = None) -> str:
+        return f"{url}?{urlencode(sorted((params or {}).items()))}"
+
+    def get(self, key: str) -> Optional[Tuple[str, Any]]:
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key: str, etag: str, body: Any) -> None:
+        self.entries[key] = (etag, body)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+
+class RateLimiter:
+    """
+    Token buckets per API host plus a GET helper that spends request weight,
+    follows the server's rate limit headers and retries throttled or failed
+    requests with jittered exponential backoff.
+    """
+
+    def __init__(self,
+                 limits: Dict[str, Tuple[float, float]] = None,
+                 max_retries: int = 5,
+                 backoff_base: float = 0.5,
+                 backoff_cap: float = 60.0):
+        self.limits = dict(HOST_LIMITS if limits is None else limits)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.buckets: Dict[str, TokenBucket] = {}
+
+    def bucket(self, host: str) -> TokenBucket:
+        bucket = self.buckets.get(host)
+        if bucket is None:
+            capacity, period = self.limits.get(host, DEFAULT_LIMIT)
+            bucket = self.buckets[host] = TokenBucket(capacity, period)
+        return bucket
+
+    def backoff(self, attempt: int) -> float:
+        """Full jitter: uniform in [0, base * 2^attempt], capped."""
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    async def get_json(self, session: aiohttp.ClientSession, url: str, params: Dict = None,
+                       weight: float = 1, cache: ResponseCache = None) -> Optional[Any]:
+        """
+        GET a JSON endpoint within its host's budget.
+
+        Args:
+            session: Session to send the request with
+            url: Endpoint URL; its host selects the bucket
+            params: Query parameters (strings or numbers)
+            weight: Request weight the endpoint costs, 1 for plain call counts
+            cache: Sends the cached ETag as If-None-Match and returns the cached body on 304
+
+        Returns:
+            Any: Parsed JSON body, or None if the request failed or kept being throttled
+        """
+        bucket = self.bucket(urlsplit(url).hostname)
+        cache_key = cached = None
+        headers = {}
+        if cache is not None:
+            cache_key = cache.key(url, params)
+            cached = cache.get(cache_key)
+            if cached is not None:
+                headers['If-None-Match'] = cached[0]
+
+        for attempt in range(self.max_retries + 1):
+            await bucket.acquire(weight)
+            try:
+                async with session.get(url, params=params, headers=headers) as response:
+                    for header in USED_WEIGHT_HEADERS:
+                        if header in response.headers:
+                            bucket.observe_used(float(response.headers[header]))
+                            break
+                    if response.status == 200:
+                        body = await response.json(content_type=None)
+                        if cache is not None and response.headers.get('ETag'):
+                            cache.put(cache_key, response.headers['ETag'], body)
+                        return body
+                    if response.status == 304 and cached is not None:
+                        return cached[1]
+
+                    if response.status not in RETRY_STATUSES:
+                        logger.error(f"GET {url} failed: {response.status} - {(await response.text())[:200]}")
+                        return None
+                    delay = self.backoff(attempt)
+                    retry_after = response.headers.get('Retry-After')
+                    if retry_after is not None and retry_after.isdigit():
+                        delay = max(delay, float(retry_after))
+                    if response.status in (418, 429):
+                        # The limit is per IP, so every caller of the host has to wait
+                        bucket.pause(delay)
+                    logger.warning(f"GET {url} returned {response.status}, retrying in {delay:.1f}s "
+                                   f"({attempt + 1}/{self.max_retries})")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                delay = self.backoff(attempt)
+                logger.warning(f"GET {url} raised {e!r}, retrying in {delay:.1f}s ({attempt + 1}/{self.max_retries})")
+
+            if attempt < self.max_retries:
+                await asyncio.sleep(delay)
+        logger.error(f"GET {url} failed after {self.max_retries} retries")
+        return None
+
+
+# One limiter per process, so every caller of a host shares its budget
+SHARED_LIMITER = RateLimiter()
+
+
+def fetch_json(url: str, params: Dict = None, weight: float = 1, limiter: RateLimiter = None) -> Optional[Any]:
+    """Blocking get_json for one-off scripts, through the shared limiter unless one is given."""
+    async def fetch():
+        async with aiohttp.ClientSession() as session:
+            return await (limiter or SHARED_LIMITER).get_json(session, url, params, weight)
+    return asyncio.run(fetch())
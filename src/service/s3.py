@@ -1,20 +1,37 @@
 # service/s3.py
+import io
 import os
 import boto3
 from typing import List, Union
+from boto3.exceptions import S3UploadFailedError
+from boto3.s3.transfer import TransferConfig
 from botocore.exceptions import ClientError
 from dotenv import load_dotenv
 
 load_dotenv()
 
 class S3Helper:
-    def __init__(self):
-        """Initialize S3 client with credentials from environment variables."""
+    def __init__(self, client=None, bucket_name: str = None, endpoint_url: str = None):
+        """
+        Initialize S3 client with credentials from environment variables.
+
+        Args:
+            client: Pre-built boto3 S3 client to use instead, e.g. one created under moto
+            bucket_name: Bucket to use instead of AWS_BUCKET_NAME
+            endpoint_url: Custom endpoint such as a local MinIO, defaults to AWS_ENDPOINT_URL
+        """
         self.aws_access_key_id = os.getenv('AWS_ACCESS_KEY_ID')
         self.aws_secret_access_key = os.getenv('AWS_SECRET_ACCESS_KEY')
         self.region_name = os.getenv('AWS_REGION', 'ap-south-1')
-        self.bucket_name = os.getenv('AWS_BUCKET_NAME')
-        
+        self.bucket_name = bucket_name or os.getenv('AWS_BUCKET_NAME')
+        self.endpoint_url = endpoint_url or os.getenv('AWS_ENDPOINT_URL')
+
+        if client is not None:
+            if not self.bucket_name:
+                raise ValueError("Bucket name not provided and AWS_BUCKET_NAME is not set")
+            self.s3_client = client
+            return
+
         if not all([self.aws_access_key_id, self.aws_secret_access_key, self.bucket_name]):
             raise ValueError("AWS credentials or bucket name not found in environment variables")
         
@@ -22,7 +39,8 @@ class S3Helper:
             's3',
             aws_access_key_id=self.aws_access_key_id,
             aws_secret_access_key=self.aws_secret_access_key,
-            region_name=self.region_name
+            region_name=self.region_name,
+            endpoint_url=self.endpoint_url
         )
 
     def upload_data(self, data: Union[str, bytes], s3_key: str) -> bool:
@@ -49,6 +67,41 @@ class S3Helper:
             print(f"Error uploading data to S3: {e}")
             return False
 
+    def upload_bytes(self, data: bytes, s3_key: str, content_type: str = None,
+                     multipart_threshold: int = 16 * 1024 * 1024, max_concurrency: int = 4) -> bool:
+        """
+        Upload bytes, switching to a parallel multipart upload above multipart_threshold.
+        
+        Args:
+            data: The object body
+            s3_key: The key (path) where the data will be stored in S3
+            content_type: Optional Content-Type of the object
+            multipart_threshold: Size in bytes from which parts are uploaded concurrently
+            max_concurrency: Parts uploaded at once for a multipart upload
+        
+        Returns:
+            bool: True if upload was successful, False otherwise
+        """
+        config = TransferConfig(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=max(multipart_threshold // 2, 5 * 1024 * 1024),
+            max_concurrency=max_concurrency
+        )
+        extra_args = {'ContentType': content_type} if content_type else None
+        try:
+            self.s3_client.upload_fileobj(
+                io.BytesIO(data),
+                self.bucket_name,
+                s3_key,
+                ExtraArgs=extra_args,
+                Config=config
+            )
+            return True
+            
+        except (ClientError, S3UploadFailedError) as e:
+            print(f"Error uploading data to S3: {e}")
+            return False
+
     def download_file(self, s3_key: str) -> Union[str, None]:
         """
         Download a file from S3 bucket and return its contents.
@@ -67,6 +120,24 @@ class S3Helper:
             print(f"Error downloading file from S3: {e}")
             return None
 
+    def download_bytes(self, s3_key: str) -> Union[bytes, None]:
+        """
+        Download an object from S3 without decoding it.
+        
+        Args:
+            s3_key: The key of the file in S3
+        
+        Returns:
+            bytes: Object body if successful, None if failed
+        """
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket_name, Key=s3_key)
+            return response['Body'].read()
+            
+        except ClientError as e:
+            print(f"Error downloading file from S3: {e}")
+            return None
+
     def list_files(self, prefix: str = "") -> List[str]:
         """
         List all files in the S3 bucket with given prefix.
@@ -78,14 +149,11 @@ class S3Helper:
             List[str]: List of file keys in the bucket
         """
         try:
-            response = self.s3_client.list_objects_v2(
-                Bucket=self.bucket_name,
-                Prefix=prefix
-            )
-            
-            if 'Contents' in response:
-                return [obj['Key'] for obj in response['Contents']]
-            return []
+            paginator = self.s3_client.get_paginator('list_objects_v2')
+            keys = []
+            for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix):
+                keys.extend(obj['Key'] for obj in page.get('Contents', []))
+            return keys
             
         except ClientError as e:
             print(f"Error listing files in S3: {e}")
@@ -0,0 +1,225 @@
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from pymongo import DeleteMany, UpdateOne
+
+from service.mongo import MongoDBHelper
+from service.rate_limiter import fetch_json
+
+SHARD_ASSIGNMENTS = "shard_assignments"
+BINANCE_TICKER_URL = "https://api.binance.com/api/v3/ticker/24hr"
+
+
+def estimate_rates(volumes: Dict[str, float], counts: Dict[str, float]) -> Dict[str, float]:
+    """
+    Expected trades per second of each pair.
+
+    Pairs with a trade count use it; the others are estimated from their volume
+    at the average trades per dollar of the counted pairs (or rank by volume
+    alone if nothing was counted).
+    """
+    counted = [pair for pair in volumes if counts.get(pair)]
+    counted_volume = sum(volumes[pair] for pair in counted)
+    per_dollar = sum(counts[pair] for pair in counted) / counted_volume if counted_volume else 0
+    day = 24 * 3600
+    rates = {}
+    for pair, volume in volumes.items():
+        if counts.get(pair):
+            rates[pair] = counts[pair] / day
+        elif per_dollar:
+            rates[pair] = volume * per_dollar / day
+        else:
+            rates[pair] = volume
+    return rates
+
+
+def shard_loads(assignment: Dict[str, int], rates: Dict[str, float], shards: int) -> List[float]:
+    loads = [0.0] * shards
+    for pair, shard in assignment.items():
+        loads[shard] += rates[pair]
+    return loads
+
+
+def plan_shards(rates: Dict[str, float], shards: int, previous: Dict[str, int] = None,
+                tolerance: float = 0.05) -> Dict[str, int]:
+    """
+    Assign pairs to shards with roughly equal total rates, moving as few as possible.
+
+    Pairs keep their previous shard; new ones go, heaviest first, to the lightest
+    shard. Then, while the heaviest shard is more than `tolerance` above the mean,
+    the pair that best evens it out with the lightest shard moves over. Every move
+    narrows the spread, so a small shift in volumes moves only a few pairs.
+
+    Args:
+        rates: Expected message rate per pair
+        shards: Number of shards
+        previous: Current shard of each pair, if any
+        tolerance: Allowed excess of the heaviest shard over the mean load
+
+    Returns:
+        Dict[str, int]: Shard index of every pair in rates
+    """
+    assignment = {}
+    loads = [0.0] * shards
+    for pair, shard in (previous or {}).items():
+        if pair in rates and 0 <= shard < shards:
+            assignment[pair] = shard
+            loads[shard] += rates[pair]
+
+    for pair in sorted((pair for pair in rates if pair not in assignment), key=lambda pair: -rates[pair]):
+        shard = min(range(shards), key=loads.__getitem__)
+        assignment[pair] = shard
+        loads[shard] += rates[pair]
+
+    mean = sum(loads) / shards
+    while True:
+        heavy = max(range(shards), key=loads.__getitem__)
+        light = min(range(shards), key=loads.__getitem__)
+        gap = loads[heavy] - loads[light]
+        if loads[heavy] <= mean * (1 + tolerance):
+            break
+        # Any pair lighter than the gap narrows it; closest to half the gap narrows it most
+        candidates = [pair for pair, shard in assignment.items() if shard == heavy and 0 < rates[pair] < gap]
+        if not candidates:
+            break
+        pair = min(candidates, key=lambda pair: abs(rates[pair] - gap / 2))
+        assignment[pair] = light
+        loads[heavy] -= rates[pair]
+        loads[light] += rates[pair]
+    return assignment
+
+
+class ShardPlanner:
+    """
+    Splits the target_pairs of one exchange into collector shards by expected
+    message rate and writes them to the shard_assignments collection, one
+    document per shard, for the collector entry points to read at startup.
+
+    Trade counts come from the last `window` of our own stats where a pair has
+    been collected, otherwise from the Binance 24h ticker, otherwise from volume.
+    """
+
+    def __init__(self,
+                 mongo_helper: MongoDBHelper,
+                 exchange: str,
+                 shards: int,
+                 stats_collection: str = "transactions_stats_second",
+                 universe_collection: str = "target_pairs",
+                 assignments_collection: str = SHARD_ASSIGNMENTS,
+                 window: timedelta = timedelta(hours=24),
+                 tolerance: float = 0.05):
+        self.mongo_helper = mongo_helper
+        self.exchange = exchange
+        self.shards = shards
+        self.stats_collection = stats_collection
+        self.universe_collection = universe_collection
+        self.assignments_collection = assignments_collection
+        self.window = window
+        self.tolerance = tolerance
+
+    def load_volumes(self) -> Dict[str, float]:
+        """24h USD volume of every target pair listed on the exchange, by exchange symbol."""
+        self.mongo_helper.set_collection(self.universe_collection)
+        field = f"exchanges.{self.exchange}"
+        volumes = {}
+        for pair in self.mongo_helper.find_cursor({field: {"$exists": True}}, {field: 1}):
+            ticker = pair['exchanges'][self.exchange]
+            volumes[ticker['symbol']] = ticker.get('volume_usd') or 0.0
+        return volumes
+
+    def load_counts(self, pairs: List[str]) -> Dict[str, float]:
+        """Trades per pair over the window, from our stats and, for Binance, the 24h ticker."""
+        counts = {}
+        if self.exchange == "binance":
+            tickers = fetch_json(BINANCE_TICKER_URL, weight=80) or []
+            wanted = set(pairs)
+            counts = {ticker['symbol']: float(ticker['count']) for ticker in tickers if ticker['symbol'] in wanted}
+
+        # Stats store symbols without separators, e.g. BTCUSDT for BTC-USDT
+        by_stats_symbol = {pair.replace('-', ''): pair for pair in pairs}
+        since = datetime.now(timezone.utc) - self.window
+        self.mongo_helper.set_collection(self.stats_collection)
+        scale = timedelta(hours=24) / self.window
+        for row in self.mongo_helper.collection.aggregate([
+            {"$match": {"source": self.exchange, "symbol": {"$in": list(by_stats_symbol)}, "timestamp": {"$gte": since}}},
+            {"$group": {"_id": "$symbol", "trades": {"$sum": {"$add": [
+                {"$ifNull": ["$buy_count", 0]}, {"$ifNull": ["$sell_count", 0]}]}}}},
+        ]):
+            if row['trades']:
+                counts[by_stats_symbol[row['_id']]] = row['trades'] * scale
+        return counts
+
+    def load_assignment(self) -> Dict[str, int]:
+        self.mongo_helper.set_collection(self.assignments_collection)
+        return {pair: doc['shard'] for doc in self.mongo_helper.find_many({"exchange": self.exchange})
+                for pair in doc['pairs']}
+
+    def plan(self) -> Dict:
+        """
+        Returns:
+            Dict: assignment, rates, per-shard loads, and the pairs that changed shard
+        """
+        volumes = self.load_volumes()
+        rates = estimate_rates(volumes, self.load_counts(list(volumes)))
+        previous = self.load_assignment()
+        assignment = plan_shards(rates, self.shards, previous, self.tolerance)
+        return {
+            'assignment': assignment,
+            'rates': rates,
+            'loads': shard_loads(assignment, rates, self.shards),
+            'moved': sorted(pair for pair, shard in assignment.items() if pair in previous and previous[pair] != shard),
+            'previous': previous,
+        }
+
+    def write(self, plan: Dict) -> List[int]:
+        """
+        Upsert one document per shard and drop shards beyond the current count, in one bulk write.
+
+        Returns:
+            List[int]: Shards whose pairs changed, i.e. collectors to restart
+        """
+        now = datetime.now(timezone.utc)
+        assignment, rates = plan['assignment'], plan['rates']
+        previous_pairs = [set() for _ in range(self.shards)]
+        for pair, shard in plan['previous'].items():
+            if shard < self.shards:
+                previous_pairs[shard].add(pair)
+
+        operations, changed = [], []
+        for shard in range(self.shards):
+            pairs = sorted((pair for pair, assigned in assignment.items() if assigned == shard),
+                           key=lambda pair: -rates[pair])
+            update = {"exchange": self.exchange, "shard": shard, "pairs": pairs,
+                      "expected_rate": plan['loads'][shard], "planned_at": now}
+            if set(pairs) != previous_pairs[shard]:
+                update["changed_at"] = now
+                changed.append(shard)
+            operations.append(UpdateOne({"_id": f"{self.exchange}:{shard}"}, {"$set": update}, upsert=True))
+        operations.append(DeleteMany({"exchange": self.exchange, "shard": {"$gte": self.shards}}))
+
+        self.mongo_helper.set_collection(self.assignments_collection)
+        self.mongo_helper.bulk_write(operations)
+        return changed
+
+    def run(self, interval: float = 0) -> None:
+        """Plan and write once, or every `interval` seconds if given."""
+        while True:
+            plan = self.plan()
+            changed = self.write(plan)
+            loads = ", ".join(f"{load:.1f}" for load in plan['loads'])
+            print(f"Planned {len(plan['assignment'])} {self.exchange} pairs into {self.shards} shards "
+                  f"(trades/s: {loads}), moved {len(plan['moved'])}: {', '.join(plan['moved']) or '-'}")
+            if changed:
+                print(f"Restart {self.exchange} collectors for shards {', '.join(map(str, changed))}")
+            if not interval:
+                return
+            time.sleep(interval)
+
+
+def load_shard_pairs(mongo_helper: MongoDBHelper, exchange: str, shard: int,
+                     assignments_collection: str = SHARD_ASSIGNMENTS) -> Optional[List[str]]:
+    """Pairs assigned to one collector shard, or None if the shard has not been planned."""
+    mongo_helper.set_collection(assignments_collection)
+    doc = mongo_helper.find_one({"_id": f"{exchange}:{shard}"})
+    return doc['pairs'] if doc else None
@@ -0,0 +1,77 @@
+import math
+import time
+from array import array
+from typing import Dict, List
+
+NAN = float('nan')
+
+
+class TopOfBook:
+    """
+    Latest best bid/ask per symbol with time-weighted spread accumulators.
+
+    State lives in preallocated arrays indexed by symbol position, so an update
+    is a handful of float writes and closing an interval is O(symbols).
+    """
+
+    def __init__(self, symbols: List[str]):
+        self.index: Dict[str, int] = {symbol: i for i, symbol in enumerate(symbols)}
+        size = len(symbols)
+        self.bid = array('d', [NAN] * size)
+        self.ask = array('d', [NAN] * size)
+        self.updated_at = array('d', [0.0] * size)
+        self.spread_time = array('d', [0.0] * size)
+        self.weight_time = array('d', [0.0] * size)
+        self.max_spread = array('d', [NAN] * size)
+
+    def update(self, symbol: str, bid: float, ask: float, now: float = None) -> None:
+        """Record a new best bid/ask for a symbol."""
+        i = self.index.get(symbol)
+        if i is None:
+            return
+        if now is None:
+            now = time.time()
+
+        self._accumulate(i, now)
+        self.bid[i] = bid
+        self.ask[i] = ask
+        spread = ask - bid
+        if not spread <= self.max_spread[i]:  # also true while max_spread is NaN
+            self.max_spread[i] = spread
+
+    def _accumulate(self, i: int, now: float) -> None:
+        """Weight the quote that was live until now by how long it was live."""
+        if not math.isnan(self.bid[i]):
+            elapsed = now - self.updated_at[i]
+            if elapsed > 0:
+                self.spread_time[i] += (self.ask[i] - self.bid[i]) * elapsed
+                self.weight_time[i] += elapsed
+        self.updated_at[i] = now
+
+    def close_interval(self, now: float = None) -> Dict[str, Dict[str, float]]:
+        """
+        Finish the current interval for every symbol with a quote.
+
+        Returns:
+            Dict[str, Dict]: avg_spread (time-weighted), max_spread and mid_price per symbol
+        """
+        if now is None:
+            now = time.time()
+
+        stats = {}
+        for symbol, i in self.index.items():
+            if math.isnan(self.bid[i]):
+                continue
+            self._accumulate(i, now)
+            spread = self.ask[i] - self.bid[i]
+            weight = self.weight_time[i]
+            stats[symbol] = {
+                "avg_spread": self.spread_time[i] / weight if weight > 0 else spread,
+                "max_spread": self.max_spread[i],
+                "mid_price": (self.bid[i] + self.ask[i]) / 2,
+            }
+            # The live quote carries over into the next interval
+            self.spread_time[i] = 0.0
+            self.weight_time[i] = 0.0
+            self.max_spread[i] = spread
+        return stats
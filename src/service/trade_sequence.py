@@ -0,0 +1,107 @@
+from typing import Dict, Optional, Tuple
+
+
+class TradeSequenceTracker:
+    """
+    Per-symbol tracker for monotonically increasing trade ids.
+
+    Keeps the highest id seen per symbol plus a fixed-width bitmap of the ids
+    just below it, so duplicates (e.g. replays after a reconnect) are suppressed
+    and holes in the sequence are counted as missed trades. Every call is O(1)
+    and memory is bounded by the window size per symbol.
+    """
+
+    def __init__(self, window: int = 1024, count_gaps: bool = True):
+        """
+        Args:
+            window: Number of ids below the highest seen id that are remembered
+            count_gaps: Count holes in the id sequence as missed trades. Disable
+                for sources whose ids are increasing but not contiguous.
+        """
+        self.window = window
+        self.count_gaps = count_gaps
+        self._mask = (1 << window) - 1
+        self._last_id: Dict[str, int] = {}
+        self._seen: Dict[str, int] = {}
+        self.missed_total: Dict[str, int] = {}
+        self.duplicate_total: Dict[str, int] = {}
+        self._interval_missed: Dict[str, int] = {}
+        self._interval_duplicates: Dict[str, int] = {}
+
+    def observe(self, symbol: str, trade_id: int, first_id: Optional[int] = None) -> bool:
+        """
+        Record a trade id for a symbol.
+
+        Args:
+            symbol: Trading pair the trade belongs to
+            trade_id: Trade id, or the last trade id of an aggregated trade
+            first_id: First trade id of an aggregated trade covering first_id..trade_id
+
+        Returns:
+            bool: True if the trade is new and should be processed, False if it
+            is a duplicate (or too old to tell apart from one) and should be dropped
+        """
+        if first_id is None:
+            first_id = trade_id
+        fills_mask = (1 << min(trade_id - first_id + 1, self.window)) - 1
+
+        last_id = self._last_id.get(symbol)
+        if last_id is None:
+            self._last_id[symbol] = trade_id
+            self._seen[symbol] = fills_mask
+            self.missed_total.setdefault(symbol, 0)
+            self.duplicate_total.setdefault(symbol, 0)
+            return True
+
+        if trade_id > last_id:
+            shift = trade_id - last_id
+            if self.count_gaps and first_id > last_id + 1:
+                self._add_missed(symbol, first_id - last_id - 1)
+            if shift < self.window:
+                self._seen[symbol] = ((self._seen[symbol] << shift) | fills_mask) & self._mask
+            else:
+                self._seen[symbol] = fills_mask
+            self._last_id[symbol] = trade_id
+            return True
+
+        fills = trade_id - first_id + 1
+        offset = last_id - trade_id
+        if offset < self.window:
+            fills_bits = (fills_mask << offset) & self._mask
+            if not self._seen[symbol] & (1 << offset):
+                # A late arrival filling a hole that was already counted as missed
+                filled = bin(fills_bits & ~self._seen[symbol]).count('1')
+                self._seen[symbol] |= fills_bits
+                if self.count_gaps:
+                    self._add_missed(symbol, -filled)
+                return True
+            # Fills already seen, plus those too old to tell apart from seen ones
+            duplicates = bin(fills_bits & self._seen[symbol]).count('1') + max(fills - (self.window - offset), 0)
+        else:
+            duplicates = fills
+
+        self.duplicate_total[symbol] += duplicates
+        self._interval_duplicates[symbol] = self._interval_duplicates.get(symbol, 0) + duplicates
+        return False
+
+    def _add_missed(self, symbol: str, count: int) -> None:
+        self.missed_total[symbol] = max(self.missed_total[symbol] + count, 0)
+        self._interval_missed[symbol] = self._interval_missed.get(symbol, 0) + count
+
+    def pop_interval_counts(self) -> Dict[str, Tuple[int, int]]:
+        """
+        Return and reset the (missed, duplicate) counts accumulated since the last call.
+
+        Counts of every tracked symbol are reset, including symbols without trades
+        in the interval, so they are not carried over into a later interval.
+
+        Returns:
+            Dict[str, Tuple[int, int]]: (missed, duplicate) per tracked symbol
+        """
+        counts = {
+            symbol: (max(self._interval_missed.get(symbol, 0), 0), self._interval_duplicates.get(symbol, 0))
+            for symbol in self._last_id
+        }
+        self._interval_missed.clear()
+        self._interval_duplicates.clear()
+        return counts
@@ -0,0 +1,435 @@
+import copy
+import threading
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from bson import ObjectId
+from pymongo import DeleteMany, UpdateOne
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+from data_processing.archive_formats import get_archive_format
+from data_processing.archive_manifest import ArchiveManifest
+from data_processing.archive_policy import STATS_POLICY
+from service.mongo import MongoDBHelper
+
+
+class InMemoryS3Client:
+    """The file transfers of the boto3 client, over the helper's objects."""
+
+    def __init__(self, helper):
+        self.helper = helper
+
+    def upload_file(self, path, bucket, s3_key, ExtraArgs=None):
+        with open(path, "rb") as f:
+            self.helper.upload_bytes(f.read(), s3_key)
+
+    def download_file(self, bucket, s3_key, path):
+        with open(path, "wb") as f:
+            f.write(self.helper.objects[s3_key])
+
+
+class InMemoryS3Helper:
+    """In-memory stand-in exposing the part of S3Helper the archive code uses."""
+
+    bucket_name = "test"
+
+    def __init__(self, objects=None, fail_keys=()):
+        self.objects = dict(objects or {})
+        self.fail_keys = set(fail_keys)
+        self.downloads = 0
+        self.lock = threading.Lock()
+        self.s3_client = InMemoryS3Client(self)
+
+    def upload_bytes(self, data, s3_key, content_type=None, multipart_threshold=None):
+        if s3_key in self.fail_keys:
+            return False
+        with self.lock:
+            self.objects[s3_key] = data
+        return True
+
+    def download_bytes(self, s3_key):
+        with self.lock:
+            self.downloads += 1
+            return self.objects.get(s3_key)
+
+    def list_files(self, prefix=""):
+        return sorted(key for key in self.objects if key.startswith(prefix))
+
+    def delete_file(self, s3_key):
+        with self.lock:
+            return self.objects.pop(s3_key, None) is not None
+
+
+class RangeDeletingCollection:
+    """Live documents, deleted the way TradingDataProcessor does: one range per group."""
+
+    def __init__(self, hours, start=datetime(2024, 1, 1), per_hour=3):
+        self.documents = [
+            {"_id": f"{hour}-{i}", "timestamp": start + timedelta(hours=hour, seconds=i),
+             "symbol": "BTCUSDT", "source": "binance", "buy_count": i}
+            for hour in range(hours) for i in range(per_hour)
+        ]
+
+    def iter_groups(self):
+        """Groups as iter_groups yields them: partition, bucket range and documents, no ids."""
+        for hour_start in sorted({STATS_POLICY.bucket_start(doc["timestamp"]) for doc in self.documents}):
+            partition = {"symbol": "BTCUSDT", "source": "binance"}
+            documents = [doc for doc in self.documents if STATS_POLICY.bucket_start(doc["timestamp"]) == hour_start]
+            yield STATS_POLICY.group_key(partition, hour_start), {
+                "start_time": hour_start, "end_time": hour_start + STATS_POLICY.bucket_length,
+                "granularity": "hour", "partition": partition, **partition, "documents": documents}
+
+    def delete_groups(self, groups):
+        def in_range(doc, group):
+            return (all(doc[name] == value for name, value in group["partition"].items())
+                    and group["start_time"] <= doc["timestamp"] < group["end_time"])
+
+        remaining = [doc for doc in self.documents if not any(in_range(doc, group) for group in groups)]
+        deleted = len(self.documents) - len(remaining)
+        self.documents = remaining
+        return deleted
+
+
+def matches(document, query):
+    """Equality, comparison, $in/$nin and $or on top-level fields, the filters this repo uses."""
+    for field, condition in query.items():
+        if field == "$or":
+            if not any(matches(document, clause) for clause in condition):
+                return False
+            continue
+        value = document.get(field)
+        if isinstance(condition, dict) and condition and all(name.startswith("$") for name in condition):
+            for operator, operand in condition.items():
+                if not OPERATORS[operator](value, operand):
+                    return False
+        elif value != condition:
+            return False
+    return True
+
+
+OPERATORS = {
+    "$in": lambda value, operand: value in operand,
+    "$nin": lambda value, operand: value not in operand,
+    "$ne": lambda value, operand: value != operand,
+    "$gt": lambda value, operand: value is not None and value > operand,
+    "$gte": lambda value, operand: value is not None and value >= operand,
+    "$lt": lambda value, operand: value is not None and value < operand,
+    "$lte": lambda value, operand: value is not None and value <= operand,
+}
+
+
+def parent_of(document, path):
+    """The dict holding a dotted path's last field, created on the way like Mongo does."""
+    *parents, name = path.split(".")
+    for parent in parents:
+        document = document.setdefault(parent, {})
+    return document, name
+
+
+def apply_update(document, update, inserted):
+    if inserted:
+        document.update(copy.deepcopy(update.get("$setOnInsert", {})))
+    for path, value in update.get("$set", {}).items():
+        parent, name = parent_of(document, path)
+        parent[name] = copy.deepcopy(value)
+    for path, value in update.get("$push", {}).items():
+        parent, name = parent_of(document, path)
+        parent.setdefault(name, []).append(copy.deepcopy(value))
+
+
+def project(document, projection):
+    if not projection:
+        return copy.deepcopy(document)
+    if not any(projection.values()):
+        return {name: copy.deepcopy(value) for name, value in document.items() if name not in projection}
+    return {name: copy.deepcopy(value) for name, value in document.items() if name == "_id" or projection.get(name)}
+
+
+class FakeCursor:
+    def __init__(self, documents):
+        self.documents = documents
+        self.closed = False
+
+    def sort(self, keys, direction=None):
+        keys = [(keys, direction or 1)] if isinstance(keys, str) else keys
+        for name, order in reversed(keys):
+            self.documents.sort(key=lambda document: document.get(name), reverse=order < 0)
+        return self
+
+    def batch_size(self, size):
+        return self
+
+    def limit(self, count):
+        if count:
+            self.documents = self.documents[:count]
+        return self
+
+    def __iter__(self):
+        for document in self.documents:
+            if self.closed:
+                return
+            yield document
+
+    def close(self):
+        self.closed = True
+
+
+class FakeCollection:
+    """
+    In-memory collection with the pymongo calls this repo makes. Raises
+    AutoReconnect for the next `failures` writes (an insert_many stores half its
+    batch first, like a connection lost mid-batch) and calls `after_write`, if
+    set, after every other write.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.documents = []
+        self.indexes = []
+        self.cursors = []
+        self.failures = 0
+        self.after_write = None
+        self.lock = threading.RLock()
+
+    def keyed(self, field="_id"):
+        return {document[field]: document for document in self.documents}
+
+    def with_options(self, **kwargs):
+        return self
+
+    def create_index(self, keys, **kwargs):
+        self.indexes.append(list(keys))
+        return "_".join(f"{name}_{order}" for name, order in keys)
+
+    def _fail(self):
+        if self.failures:
+            self.failures -= 1
+            raise AutoReconnect("connection lost")
+
+    def _written(self):
+        if self.after_write:
+            self.after_write()
+
+    def find(self, query=None, projection=None):
+        with self.lock:
+            cursor = FakeCursor([project(document, projection) for document in self.documents
+                                 if matches(document, query or {})])
+            self.cursors.append(cursor)
+            return cursor
+
+    def find_one(self, query=None, projection=None):
+        return next(iter(self.find(query, projection).limit(1)), None)
+
+    def count_documents(self, query, limit=0, **kwargs):
+        count = sum(matches(document, query) for document in self.documents)
+        return min(count, limit) if limit else count
+
+    def insert_many(self, documents, ordered=True):
+        with self.lock:
+            if self.failures:
+                self.failures -= 1
+                for document in documents[:len(documents) // 2]:
+                    document.setdefault("_id", ObjectId())
+                    self.documents.append(copy.deepcopy(document))
+                raise AutoReconnect("connection lost")
+            ids = {document["_id"] for document in self.documents}
+            inserted, errors = [], []
+            for index, document in enumerate(documents):
+                document.setdefault("_id", ObjectId())
+                if document["_id"] in ids:
+                    errors.append({"index": index, "code": 11000, "errmsg": "E11000 duplicate key error"})
+                    if ordered:
+                        break
+                    continue
+                ids.add(document["_id"])
+                self.documents.append(copy.deepcopy(document))
+                inserted.append(document["_id"])
+            self._written()
+            if errors:
+                raise BulkWriteError({"writeErrors": errors, "nInserted": len(inserted)})
+            return SimpleNamespace(inserted_ids=inserted)
+
+    def _update(self, query, update, upsert, replace=False):
+        document = next((document for document in self.documents if matches(document, query)), None)
+        inserted = document is None
+        if inserted:
+            if not upsert:
+                return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=None)
+            document = {name: value for name, value in query.items() if not isinstance(value, dict)}
+            self.documents.append(document)
+        if replace:
+            document.clear()
+            document.update(copy.deepcopy(update))
+        else:
+            apply_update(document, update, inserted)
+        if inserted:
+            document.setdefault("_id", ObjectId())
+        return SimpleNamespace(matched_count=int(not inserted), modified_count=int(not inserted),
+                               upserted_id=document.get("_id") if inserted else None)
+
+    def update_one(self, query, update, upsert=False):
+        with self.lock:
+            self._fail()
+            result = self._update(query, update, upsert)
+            self._written()
+            return result
+
+    def replace_one(self, query, document, upsert=False):
+        with self.lock:
+            self._fail()
+            result = self._update(query, document, upsert, replace=True)
+            self._written()
+            return result
+
+    def update_many(self, query, update):
+        with self.lock:
+            self._fail()
+            matched = [document for document in self.documents if matches(document, query)]
+            for document in matched:
+                apply_update(document, update, inserted=False)
+            self._written()
+            return SimpleNamespace(matched_count=len(matched), modified_count=len(matched))
+
+    def delete_many(self, query):
+        with self.lock:
+            self._fail()
+            remaining = [document for document in self.documents if not matches(document, query)]
+            deleted = len(self.documents) - len(remaining)
+            self.documents[:] = remaining
+            self._written()
+            return SimpleNamespace(deleted_count=deleted)
+
+    def bulk_write(self, operations, ordered=True):
+        """Applies UpdateOne upserts and DeleteMany; returns BulkWriteResult's counts."""
+        with self.lock:
+            self._fail()
+            result = SimpleNamespace(matched_count=0, modified_count=0, upserted_count=0, deleted_count=0)
+            for operation in operations:
+                if isinstance(operation, DeleteMany):
+                    remaining = [document for document in self.documents if not matches(document, operation._filter)]
+                    result.deleted_count += len(self.documents) - len(remaining)
+                    self.documents[:] = remaining
+                elif isinstance(operation, UpdateOne):
+                    updated = self._update(operation._filter, operation._doc, operation._upsert)
+                    result.matched_count += updated.matched_count
+                    result.modified_count += updated.modified_count
+                    result.upserted_count += updated.upserted_id is not None
+                else:
+                    raise NotImplementedError(type(operation).__name__)
+            self._written()
+            return result
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.collections = {}
+
+    def __getitem__(self, name):
+        if name not in self.collections:
+            self.collections[name] = FakeCollection(name)
+        return self.collections[name]
+
+    def get_collection(self, name, codec_options=None):
+        return self[name]
+
+    def create_collection(self, name, **kwargs):
+        return self[name]
+
+
+class FakeClient:
+    """Stands in for MongoClient, so the real MongoDBHelper runs over in-memory collections."""
+
+    def __init__(self):
+        self.databases = {}
+
+    def __getitem__(self, name):
+        if name not in self.databases:
+            self.databases[name] = FakeDatabase()
+        return self.databases[name]
+
+    def close(self):
+        pass
+
+
+class FakeMongoHelper:
+    """
+    In-memory stand-in for AsyncMongoDBHelper over a FakeDatabase. Raises
+    IOError for the next `failures` bulk writes and records the others in
+    `bulk_writes` as (collection name, operations).
+    """
+
+    def __init__(self):
+        self.db = FakeDatabase()
+        self.collection_name = None
+        self.bulk_writes = []
+        self.failures = 0
+
+    def set_collection(self, collection_name):
+        self.collection_name = collection_name
+
+    @property
+    def collection(self):
+        return self.db[self.collection_name]
+
+    def seed(self, collection_name, documents):
+        self.db[collection_name].documents.extend(copy.deepcopy(documents))
+
+    def keyed(self, collection_name, field="_id"):
+        return self.db[collection_name].keyed(field)
+
+    async def find_many(self, query, limit=0):
+        return list(self.collection.find(query).limit(limit))
+
+    async def bulk_write(self, operations, ordered=True):
+        if self.failures:
+            self.failures -= 1
+            raise IOError("write failed")
+        self.bulk_writes.append((self.collection_name, operations))
+        return self.collection.bulk_write(operations, ordered=ordered)
+
+
+@pytest.fixture
+def mongo_helper():
+    return FakeMongoHelper()
+
+
+@pytest.fixture
+def mongo_client():
+    return FakeClient()
+
+
+@pytest.fixture
+def s3_helper():
+    return InMemoryS3Helper()
+
+
+@pytest.fixture
+def archive_collection():
+    """Factory for a collection holding `hours` hourly groups of BTCUSDT stats."""
+    return RangeDeletingCollection
+
+
+@pytest.fixture
+def archive_manifest(mongo_client, s3_helper):
+    manifest_mongo = MongoDBHelper("bitpulse", client=mongo_client)
+    manifest_mongo.set_collection(STATS_POLICY.manifest_collection)
+    return ArchiveManifest(manifest_mongo, s3_helper, prefix=STATS_POLICY.manifest_prefix,
+                           partition_keys=STATS_POLICY.partition_keys)
+
+
+@pytest.fixture
+def archived_hours(archive_manifest, s3_helper, archive_collection):
+    """Factory archiving `hours` hourly groups the way the pipeline does; returns their documents."""
+    archive_format = get_archive_format("parquet")
+
+    def archive(hours, **kwargs):
+        collection = archive_collection(hours, **kwargs)
+        for key, group in collection.iter_groups():
+            body = archive_format.serialize(group)
+            s3_key = f"{STATS_POLICY.object_prefix(group)}{key}.parquet"
+            s3_helper.upload_bytes(body, s3_key)
+            archive_manifest.record(key, dict(group, document_count=len(group["documents"])), s3_key, body,
+                                    archive_format.name)
+        return collection.documents
+    return archive
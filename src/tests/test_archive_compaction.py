@@ -0,0 +1,66 @@
+import io
+from datetime import datetime, timedelta
+
+import numpy as np
+import pyarrow.parquet as pq
+
+from data_processing.archive_compaction import ArchiveCompactor
+from data_processing.archive_query import ArchiveQuery, DiskLRUCache
+
+DAY = datetime(2024, 1, 1)
+
+
+def test_day_of_hourly_objects_is_compacted_into_one_row_group_per_hour(tmp_path, s3_helper, archive_manifest,
+                                                                        archived_hours):
+    archived_hours(24)
+    hour_keys = [f"BTCUSDT_binance_2024-01-01_{hour:02d}" for hour in range(24)]
+    hour_objects = [f"data/BTCUSDT/{key}.parquet" for key in hour_keys]
+    archive_manifest.mark_deleted(hour_keys)
+    query = ArchiveQuery(s3_helper=s3_helper, manifest=archive_manifest, cache=DiskLRUCache(str(tmp_path)))
+    before = query.get_range("BTCUSDT", "binance", DAY + timedelta(hours=5, seconds=1), DAY + timedelta(hours=20))
+
+    # Record what the manifest and S3 hold at each step of the compaction
+    steps = []
+    write_entry, remove_entries, delete_file = (archive_manifest.write_entry, archive_manifest.remove_entries,
+                                                s3_helper.delete_file)
+
+    def recording_write_entry(entry):
+        steps.append(("write_entry", entry["_id"], len(entry["replaces"]),
+                      all(key in s3_helper.objects for key in hour_objects)))
+        write_entry(entry)
+
+    def recording_remove_entries(entries):
+        steps.append(("remove_entries", len(entries)))
+        remove_entries(entries)
+
+    def recording_delete_file(s3_key):
+        steps.append(("delete_file", s3_key))
+        return delete_file(s3_key)
+
+    archive_manifest.write_entry = recording_write_entry
+    archive_manifest.remove_entries = recording_remove_entries
+    s3_helper.delete_file = recording_delete_file
+
+    summary = ArchiveCompactor(archive_manifest, s3_helper).compact(now=DAY + timedelta(days=2, hours=2))
+
+    assert summary == {"days": 1, "hours": 24, "rows": 72, "failed": []}
+    # The day entry goes first, while every hour is still in place; then the hour entries, then their objects
+    assert steps == [("write_entry", "BTCUSDT_binance_2024-01-01", 24, True), ("remove_entries", 24)] + [
+        ("delete_file", f"manifest/BTCUSDT/{key}.json") for key in hour_keys] + [
+        ("delete_file", s3_key) for s3_key in hour_objects]
+
+    [daily_key] = [key for key in s3_helper.objects if key.endswith(".parquet")]
+    assert daily_key.startswith("data/source=binance/symbol=BTCUSDT/date=2024-01-01/")
+    daily = pq.ParquetFile(io.BytesIO(s3_helper.objects[daily_key]))
+    assert daily.num_row_groups == 24
+    for hour in range(24):
+        timestamps = daily.read_row_group(hour, columns=["timestamp"]).column("timestamp").to_pylist()
+        assert [timestamp.replace(tzinfo=None) for timestamp in timestamps] == [
+            DAY + timedelta(hours=hour, seconds=second) for second in range(3)]
+
+    after = query.get_range("BTCUSDT", "binance", DAY + timedelta(hours=5, seconds=1), DAY + timedelta(hours=20))
+    assert len(before["timestamp"]) == 44
+    assert list(after) == list(before)
+    for name in before:
+        # Columns the stats documents do not have come back as all NaN or None
+        assert np.array_equal(after[name], before[name], equal_nan=before[name].dtype.kind == "f"), name
@@ -0,0 +1,31 @@
+from datetime import datetime
+
+from bson import ObjectId
+
+from data_processing.archive_formats import archive_schema_version, get_archive_format, read_archive_table
+
+
+def make_group():
+    documents = [
+        {"_id": ObjectId(), "timestamp": datetime(2024, 1, 1, 3, 0, 1), "symbol": "BTCUSDT",
+         "source": "binance", "buy_count": 3, "buy_total_quantity": 1.5, "note": "x"},
+        {"_id": ObjectId(), "timestamp": datetime(2024, 1, 1, 3, 0, 2), "symbol": "BTCUSDT",
+         "source": "binance", "sell_count": 2},
+    ]
+    return {"partition": {"symbol": "BTCUSDT", "source": "binance"}, "start_time": datetime(2024, 1, 1, 3),
+            "end_time": datetime(2024, 1, 1, 4), "documents": documents}
+
+
+def test_parquet_and_json_archives_read_back_as_the_same_columns():
+    group = make_group()
+    parquet = get_archive_format("parquet").serialize(group)
+    legacy = get_archive_format("json").serialize(group)
+
+    assert archive_schema_version(parquet) == 1
+    assert archive_schema_version(legacy) == 0
+    columns = ["buy_count", "sell_count", "extra"]
+    assert read_archive_table(parquet, columns).to_pylist() == read_archive_table(legacy, columns).to_pylist()
+    assert read_archive_table(parquet, columns).to_pylist() == [
+        {"buy_count": 3, "sell_count": None, "extra": '{"note": "x"}'},
+        {"buy_count": None, "sell_count": 2, "extra": None},
+    ]
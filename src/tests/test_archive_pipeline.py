@@ -0,0 +1,85 @@
+from datetime import datetime
+
+from data_processing.archive_formats import get_archive_format, read_archive_table
+from data_processing.archive_pipeline import ArchivePipeline
+from data_processing.archive_policy import STATS_POLICY
+
+
+def test_pipeline_uploads_every_group_and_deletes_only_uploaded_ones(s3_helper, archive_collection):
+    s3_helper.fail_keys.add("data/BTCUSDT/BTCUSDT_binance_2024-01-01_02.parquet")
+    collection = archive_collection(6)
+    deleted_groups = []
+
+    def delete_groups(groups):
+        deleted_groups.extend(groups)
+        return collection.delete_groups(groups)
+
+    pipeline = ArchivePipeline(get_archive_format("parquet"), s3_helper, delete_groups,
+                               serialize_workers=2, upload_workers=3, delete_batch_size=4, queue_size=2,
+                               object_prefix=STATS_POLICY.object_prefix)
+    summary = pipeline.run(collection.iter_groups())
+
+    assert summary["total_groups"] == 6
+    assert summary["uploaded"] == 5
+    assert summary["failed"] == ["BTCUSDT_binance_2024-01-01_02"]
+    assert summary["deleted"] == 15
+    # Groups reach the delete stage with their range and count, never their documents
+    assert all("documents" not in group and group["document_count"] == 3 for group in deleted_groups)
+    assert [doc["_id"] for doc in collection.documents] == ["2-0", "2-1", "2-2"]
+    body = s3_helper.objects["data/BTCUSDT/BTCUSDT_binance_2024-01-01_05.parquet"]
+    assert read_archive_table(body, ["buy_count"]).column("buy_count").to_pylist() == [0, 1, 2]
+
+
+class RecordingManifest:
+    def __init__(self, rows, deleted=()):
+        self.rows = dict(rows)
+        self.deleted = set(deleted)
+        self.loads = []
+
+    def load_rows(self, partition, start):
+        self.loads.append((partition["symbol"], start))
+        return {key: {"rows": rows, "deleted": key in self.deleted} for key, rows in self.rows.items()}
+
+    def record(self, key, group, s3_key, body, archive_format):
+        self.rows[key] = group["document_count"]
+
+
+def test_pipeline_resumes_from_manifest(s3_helper, archive_collection):
+    collection = archive_collection(3)
+    manifest = RecordingManifest({"BTCUSDT_binance_2024-01-01_00": 3, "BTCUSDT_binance_2024-01-01_01": 2})
+    deleted_keys = []
+
+    def delete_groups(groups):
+        deleted_keys.extend(group["key"] for group in groups)
+        return collection.delete_groups(groups)
+
+    pipeline = ArchivePipeline(get_archive_format("parquet"), s3_helper, delete_groups, manifest=manifest)
+    summary = pipeline.run(collection.iter_groups())
+
+    # Hour 0 matches its manifest entry; hour 1 gained rows since it was recorded
+    assert summary["skipped"] == 1
+    assert sorted(s3_helper.objects) == ["data/BTCUSDT/BTCUSDT_binance_2024-01-01_01.parquet",
+                                  "data/BTCUSDT/BTCUSDT_binance_2024-01-01_02.parquet"]
+    assert sorted(deleted_keys) == [f"BTCUSDT_binance_2024-01-01_0{hour}" for hour in range(3)]
+    assert summary["deleted"] == 9
+    assert collection.documents == []
+    assert manifest.rows["BTCUSDT_binance_2024-01-01_01"] == 3
+    # One manifest query for the partition, starting at its oldest live hour
+    assert manifest.loads == [("BTCUSDT", datetime(2024, 1, 1))]
+
+
+def test_pipeline_never_overwrites_a_deleted_or_larger_archive(s3_helper, archive_collection):
+    # Hour 0 was archived and range-deleted, then a late insert put rows back; hour 1 lost rows since its upload
+    collection = archive_collection(3)
+    manifest = RecordingManifest({"BTCUSDT_binance_2024-01-01_00": 5, "BTCUSDT_binance_2024-01-01_01": 4},
+                                 deleted={"BTCUSDT_binance_2024-01-01_00"})
+
+    pipeline = ArchivePipeline(get_archive_format("parquet"), s3_helper, collection.delete_groups, manifest=manifest)
+    summary = pipeline.run(collection.iter_groups())
+
+    assert summary["conflicts"] == ["BTCUSDT_binance_2024-01-01_00", "BTCUSDT_binance_2024-01-01_01"]
+    assert sorted(s3_helper.objects) == ["data/BTCUSDT/BTCUSDT_binance_2024-01-01_02.parquet"]
+    assert manifest.rows == {"BTCUSDT_binance_2024-01-01_00": 5, "BTCUSDT_binance_2024-01-01_01": 4,
+                             "BTCUSDT_binance_2024-01-01_02": 3}
+    # The conflicting rows stay in the collection
+    assert [doc["_id"] for doc in collection.documents] == ["0-0", "0-1", "0-2", "1-0", "1-1", "1-2"]
@@ -0,0 +1,38 @@
+from datetime import datetime
+
+import pytest
+
+from data_processing.archive_compaction import ArchiveCompactor
+from data_processing.archive_policy import ArchivePolicy, BIG_TRANSACTIONS_POLICY, STATS_POLICY
+
+
+def test_stats_policy_keeps_the_hourly_layout():
+    start = STATS_POLICY.bucket_start(datetime(2024, 1, 1, 3, 25, 7))
+    group = {"partition": {"symbol": "BTCUSDT", "source": "binance"}, "start_time": start,
+             "end_time": start + STATS_POLICY.bucket_length}
+
+    assert STATS_POLICY.group_key(group["partition"], start) == "BTCUSDT_binance_2024-01-01_03"
+    assert STATS_POLICY.object_prefix(group) == "data/BTCUSDT/"
+    assert STATS_POLICY.cutoff(datetime(2024, 1, 2, 10, 30)) == datetime(2024, 1, 1, 10)
+    assert STATS_POLICY.range_filter(group) == {
+        "symbol": "BTCUSDT", "source": "binance",
+        "timestamp": {"$gte": datetime(2024, 1, 1, 3), "$lt": datetime(2024, 1, 1, 4)},
+    }
+
+
+def test_daily_policy_groups_by_day_under_its_own_prefix():
+    start = BIG_TRANSACTIONS_POLICY.bucket_start(datetime(2024, 1, 1, 3, 25, 7))
+    partition = {"symbol": "ETHUSDT", "source": "kucoin"}
+
+    assert start == datetime(2024, 1, 1)
+    assert BIG_TRANSACTIONS_POLICY.group_key(partition, start) == "ETHUSDT_kucoin_2024-01-01"
+    assert BIG_TRANSACTIONS_POLICY.object_prefix({"partition": partition}) == "archive/big_transactions/ETHUSDT/"
+    assert BIG_TRANSACTIONS_POLICY.manifest_collection == "archive_manifest_big_transactions"
+    assert BIG_TRANSACTIONS_POLICY.cutoff(datetime(2024, 1, 9, 10, 30)) == datetime(2024, 1, 2)
+
+
+def test_compaction_only_accepts_hourly_symbol_source_policies():
+    hourly = ArchivePolicy("trades", schema=BIG_TRANSACTIONS_POLICY.schema)
+    assert ArchiveCompactor(manifest=None, s3_helper=None, policy=hourly).policy is hourly
+    with pytest.raises(ValueError, match="big_transactions"):
+        ArchiveCompactor(manifest=None, s3_helper=None, policy=BIG_TRANSACTIONS_POLICY)
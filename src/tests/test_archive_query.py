@@ -0,0 +1,55 @@
+from datetime import datetime, timedelta
+
+from data_processing.archive_formats import get_archive_format
+from data_processing.archive_policy import BIG_TRANSACTIONS_POLICY
+from data_processing.archive_query import ArchiveQuery, DiskLRUCache
+
+
+def test_get_range_filters_sorts_and_caches(tmp_path, s3_helper, archive_collection):
+    archive_format = get_archive_format("parquet")
+    for key, group in archive_collection(3).iter_groups():
+        s3_helper.upload_bytes(archive_format.serialize(group), f"data/BTCUSDT/{key}.parquet")
+    query = ArchiveQuery(s3_helper=s3_helper, cache=DiskLRUCache(str(tmp_path), max_bytes=10 ** 6))
+
+    result = query.get_range("BTCUSDT", "binance", datetime(2024, 1, 1, 1, 0, 1), datetime(2024, 1, 1, 2, 0, 2),
+                             fields=["buy_count"])
+    assert list(result) == ["timestamp", "buy_count"]
+    assert result["buy_count"].tolist() == [1, 2, 0, 1]
+    assert s3_helper.downloads == 2
+
+    query.get_range("BTCUSDT", "binance", datetime(2024, 1, 1), datetime(2024, 1, 1, 3))
+    assert s3_helper.downloads == 3
+
+
+def test_day_objects_are_found_under_the_policy_prefix(tmp_path, s3_helper):
+    policy = BIG_TRANSACTIONS_POLICY
+    archive_format = get_archive_format("parquet", schema=policy.schema)
+    for day in range(3):
+        start = datetime(2024, 1, 1 + day)
+        documents = [{"_id": f"{day}-{hour}", "timestamp": start + timedelta(hours=hour), "symbol": "BTCUSDT",
+                      "source": "binance", "side": "buy", "price": 42000.0, "quantity": 1.0 + day, "value": 42000.0}
+                     for hour in (0, 12)]
+        group = {"partition": {"symbol": "BTCUSDT", "source": "binance"}, "start_time": start,
+                 "end_time": start + policy.bucket_length, "documents": documents}
+        s3_key = f"{policy.object_prefix(group)}{policy.group_key(group['partition'], start)}.parquet"
+        s3_helper.upload_bytes(archive_format.serialize(group), s3_key)
+    query = ArchiveQuery(s3_helper=s3_helper, cache=DiskLRUCache(str(tmp_path)), policy=policy)
+
+    assert [s3_key for s3_key, _ in query.resolve_objects("BTCUSDT", "binance", datetime(2024, 1, 2, 6),
+                                                          datetime(2024, 1, 3, 6))] == [
+        "archive/big_transactions/BTCUSDT/BTCUSDT_binance_2024-01-02.parquet",
+        "archive/big_transactions/BTCUSDT/BTCUSDT_binance_2024-01-03.parquet"]
+    result = query.get_range("BTCUSDT", "binance", datetime(2024, 1, 2, 6), datetime(2024, 1, 3, 6),
+                             fields=["quantity"])
+    assert result["quantity"].tolist() == [2.0, 3.0]
+
+
+def test_disk_cache_evicts_least_recently_used(tmp_path):
+    cache = DiskLRUCache(str(tmp_path), max_bytes=10)
+    cache.put("a", b"12345")
+    cache.put("b", b"12345")
+    assert cache.get("a") == b"12345"
+    cache.put("c", b"12345")
+    assert cache.get("b") is None
+    assert cache.get("a") == b"12345"
+    assert cache.total_bytes == 10
@@ -0,0 +1,45 @@
+from datetime import datetime
+
+import pytest
+
+import data_processing.archive_restore
+from data_processing.archive_restore import ArchiveRestorer
+
+
+@pytest.fixture
+def archived_ids(monkeypatch, mongo_client, archived_hours):
+    monkeypatch.setattr(data_processing.archive_restore, "MongoClient", lambda uri: mongo_client)
+    return sorted(doc["_id"] for doc in archived_hours(3))
+
+
+def restore(s3_helper):
+    restorer = ArchiveRestorer("bitpulse", "restored", s3_helper=s3_helper, workers=2, connections=2,
+                               insert_batch_size=2)
+    try:
+        return restorer.restore(["BTCUSDT"], datetime(2024, 1, 1), datetime(2024, 1, 1, 3))
+    finally:
+        restorer.close()
+
+
+def test_interrupted_restore_resumes_without_duplicates_or_gaps(archived_ids, mongo_client, s3_helper):
+    target = mongo_client["bitpulse"]["restored"]
+    # The connection drops half way through the first batch of one object
+    target.failures = 1
+
+    first = restore(s3_helper)
+    assert (first["objects"], first["restored_objects"], len(first["failed"])) == (3, 2, 1)
+    assert len(target.documents) == 7
+
+    second = restore(s3_helper)
+    assert (second["already_restored"], second["restored_objects"], second["failed"]) == (2, 1, [])
+    # The document stored before the drop is skipped as a duplicate key
+    assert (second["inserted"], second["duplicates"]) == (2, 1)
+
+    restored_ids = [doc["_id"] for doc in target.documents]
+    assert sorted(restored_ids) == archived_ids
+    assert all(doc["timestamp"].tzinfo is not None for doc in target.documents)
+
+    # Every object is recorded in archive_restores, so a third run has nothing to do
+    third = restore(s3_helper)
+    assert (third["already_restored"], third["restored_objects"], third["inserted"]) == (3, 0, 0)
+    assert len(mongo_client["bitpulse"]["archive_restores"].documents) == 3
@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from coingecko.coingecko_history import HISTORY_COLLECTION, CoinGeckoHistory, series_from_bucket, state_from_bucket
+
+
+@pytest.mark.asyncio
+async def test_only_changed_fields_are_recorded_and_state_is_rebuilt(mongo_helper):
+    history = CoinGeckoHistory(mongo_helper)
+    start = datetime(2024, 5, 1, 23, 57)
+    snapshots = [
+        {"id": "bitcoin", "market_cap_rank": 1, "market_cap": 100, "max_supply": 21000000.0},
+        {"id": "bitcoin", "market_cap_rank": 1, "market_cap": 100, "max_supply": 21000000.0},
+        {"id": "bitcoin", "market_cap_rank": 1, "market_cap": 110, "max_supply": 21000000.0},
+        {"id": "bitcoin", "market_cap_rank": 2, "market_cap": 90, "max_supply": 21000000.0},
+    ]
+    for minute, snapshot in enumerate(snapshots):
+        await history.record([dict(snapshot, timestamp=start + timedelta(minutes=minute),
+                                   last_updated_coingecko=str(minute))])
+    buckets = mongo_helper.keyed(HISTORY_COLLECTION)
+
+    # The unchanged second snapshot wrote nothing; the last one opened the next day
+    assert sorted(buckets) == ["bitcoin:2024-05-01", "bitcoin:2024-05-02"]
+    first, second = buckets["bitcoin:2024-05-01"], buckets["bitcoin:2024-05-02"]
+    # The base holds the first snapshot; only later changes are pushed
+    assert first["base"] == {"market_cap_rank": 1, "market_cap": 100, "max_supply": 21000000.0}
+    assert first["changes"] == {"market_cap": [{"t": start + timedelta(minutes=2), "v": 110}]}
+    assert second["base"] == {"market_cap_rank": 2, "market_cap": 90, "max_supply": 21000000.0}
+    assert "changes" not in second
+
+    assert state_from_bucket(first, start + timedelta(minutes=1))["market_cap"] == 100
+    assert state_from_bucket(first, start + timedelta(minutes=2))["market_cap"] == 110
+    assert series_from_bucket(first, "market_cap") == [(start, 100), (start + timedelta(minutes=2), 110)]
+
+
+@pytest.mark.asyncio
+async def test_changes_of_a_failed_write_are_recorded_with_the_next_snapshot(mongo_helper):
+    history = CoinGeckoHistory(mongo_helper)
+    start = datetime(2024, 5, 1, 12)
+    await history.record([{"id": "bitcoin", "market_cap": 100, "timestamp": start}])
+
+    mongo_helper.failures = 1
+    with pytest.raises(IOError):
+        await history.record([{"id": "bitcoin", "market_cap": 110, "timestamp": start + timedelta(minutes=1)}])
+    # Unchanged since the failed snapshot, but not since the last stored one
+    assert await history.record([{"id": "bitcoin", "market_cap": 110, "timestamp": start + timedelta(minutes=2)}]) == 1
+    assert mongo_helper.keyed(HISTORY_COLLECTION)["bitcoin:2024-05-01"]["changes"]["market_cap"] == [
+        {"t": start + timedelta(minutes=2), "v": 110}]
+
+
+@pytest.mark.asyncio
+async def test_changes_reach_a_bucket_created_by_a_failed_write(mongo_helper):
+    history = CoinGeckoHistory(mongo_helper)
+    start = datetime(2024, 5, 1, 12)
+    real_bulk_write = mongo_helper.bulk_write
+
+    async def bulk_write_then_fail(operations, ordered=True):
+        # The write is applied, but the driver reports an error, e.g. another operation of the batch failed
+        await real_bulk_write(operations, ordered=ordered)
+        raise IOError("write failed")
+
+    mongo_helper.bulk_write = bulk_write_then_fail
+    with pytest.raises(IOError):
+        await history.record([{"id": "bitcoin", "market_cap": 100, "timestamp": start}])
+    mongo_helper.bulk_write = real_bulk_write
+
+    assert await history.record([{"id": "bitcoin", "market_cap": 110, "timestamp": start + timedelta(minutes=1)}]) == 1
+    bucket = mongo_helper.keyed(HISTORY_COLLECTION)["bitcoin:2024-05-01"]
+    assert (bucket["base"], bucket["changes"]) == (
+        {"market_cap": 100}, {"market_cap": [{"t": start + timedelta(minutes=1), "v": 110}]})
+    # The bucket is known now, so the next change is a single push
+    await history.record([{"id": "bitcoin", "market_cap": 120, "timestamp": start + timedelta(minutes=2)}])
+    assert [len(operations) for _, operations in mongo_helper.bulk_writes] == [2, 2, 1]
@@ -0,0 +1,104 @@
+import json
+import os
+
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from coingecko.coingecko_data import CoinGeckoDataFetcher
+from service.rate_limiter import RateLimiter
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "coingecko")
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES, name)) as f:
+        return json.load(f)
+
+
+@pytest.mark.asyncio
+async def test_markets_batch_with_detail_fallback(mongo_helper):
+    requests = []
+
+    async def markets(request):
+        requests.append(("markets", request.query["ids"]))
+        ids = request.query["ids"].split(",")
+        return web.json_response([row for row in load_fixture("markets.json") if row["id"] in ids])
+
+    async def coin(request):
+        requests.append(("coin", request.match_info["id"], request.headers.get("If-None-Match")))
+        if request.headers.get("If-None-Match") == '"v1"':
+            return web.Response(status=304)
+        return web.json_response(load_fixture(f"coin_{request.match_info['id']}.json"), headers={"ETag": '"v1"'})
+
+    app = web.Application()
+    app.router.add_get("/coins/markets", markets)
+    app.router.add_get("/coins/{id}", coin)
+
+    async with TestServer(app) as server:
+        fetcher = CoinGeckoDataFetcher(mongo_helper, "coingecko_data", base_url=str(server.make_url("")).rstrip("/"),
+                                       rate_limiter=RateLimiter())
+        fetcher.active_cryptos = [
+            {"id": "bitcoin", "symbol": "btc", "name": "BTC", "source": ["binance", "kucoin"]},
+            {"id": "ethereum", "symbol": "eth", "name": "ETH", "source": ["binance"]},
+            {"id": "newtoken", "symbol": "new", "name": "NEW", "source": ["kucoin"]},
+        ]
+        async with aiohttp.ClientSession() as session:
+            calls = await fetcher.fetch_all(session)
+
+            # Same data again: the detail call is answered with 304 and nothing is rewritten
+            assert await fetcher.fetch_all(session) == 2
+
+    assert calls == 2
+    assert requests == [("markets", "bitcoin,ethereum,newtoken"), ("coin", "newtoken", None),
+                        ("markets", "bitcoin,ethereum,newtoken"), ("coin", "newtoken", '"v1"')]
+    # Each coin's first snapshot opens its history bucket: an insert, and a push in case the bucket existed
+    assert [(name, len(operations)) for name, operations in mongo_helper.bulk_writes] == [
+        ("coingecko_data", 3), ("coingecko_history", 6)]
+
+    documents = mongo_helper.keyed("coingecko_data", "id")
+    bitcoin = documents["bitcoin"]
+    assert bitcoin["market_cap"] == 1805383220191
+    assert bitcoin["max_supply"] == 21000000.0
+    assert bitcoin["ath_date"] == "2024-11-13T15:30:39.027Z"
+    assert bitcoin["image"].endswith("/large/bitcoin.png?1696501400")
+    assert bitcoin["source"] == ["binance", "kucoin"]
+
+    # Coins missing from the markets response come from /coins/{id} with the same fields
+    newtoken = documents["newtoken"]
+    assert set(newtoken) == set(bitcoin)
+    assert newtoken["total_volume"] == 15234.5
+    assert newtoken["image"].endswith("/large/new.png")
+
+
+@pytest.mark.asyncio
+async def test_failed_markets_call_retries_the_batch_without_detail_calls(mongo_helper):
+    requests = []
+
+    async def markets(request):
+        requests.append("markets")
+        return web.Response(status=503)
+
+    async def coin(request):
+        requests.append("coin")
+        return web.json_response({})
+
+    app = web.Application()
+    app.router.add_get("/coins/markets", markets)
+    app.router.add_get("/coins/{id}", coin)
+
+    async with TestServer(app) as server:
+        fetcher = CoinGeckoDataFetcher(mongo_helper, "coingecko_data",
+                                       base_url=str(server.make_url("")).rstrip("/"),
+                                       rate_limiter=RateLimiter(max_retries=0))
+        batch = [{"id": "bitcoin", "source": ["binance"]}, {"id": "ethereum", "source": ["binance"]}]
+        for crypto in batch:
+            fetcher.scheduler.add(crypto["id"], now=0)
+        assert fetcher.scheduler.next_batch(2) == ["bitcoin", "ethereum"]
+        async with aiohttp.ClientSession() as session:
+            assert await fetcher.refresh_batch(session, batch) == 1
+
+    assert requests == ["markets"]
+    # Both coins are back in the schedule, due after the retry delay
+    assert sorted(fetcher.scheduler.due) == ["bitcoin", "ethereum"]
@@ -0,0 +1,25 @@
+from binance.l2_snapshots import L2SnapshotRecorder, load_l2_snapshots
+from binance.sorted_book import SortedOrderBook
+
+
+def test_ended_hours_are_flushed_with_the_book_precision(tmp_path):
+    recorder = L2SnapshotRecorder(str(tmp_path), depth=2, interval=60)
+    book = SortedOrderBook(price_decimals=2, quantity_decimals=4)
+    book.load_snapshot({"lastUpdateId": 1, "bids": [["100.00", "1.5000"]], "asks": [["100.50", "2.0000"]]})
+
+    hour = 1714561200  # 2024-05-01 11:00 UTC
+    recorder.record("ETHUSDT", book, hour + 60)
+    assert recorder.flush(hour + 3599) == []
+
+    # ETHUSDT is not sampled in the next hour (e.g. its book is resyncing), its hour is flushed regardless
+    finished = recorder.flush(hour + 3600)
+    recorder.record("BTCUSDT", SortedOrderBook(), hour + 3600)
+    assert [symbol for symbol, _ in finished] == ["ETHUSDT"]
+    assert list(recorder.buffers) == ["BTCUSDT"]
+
+    recorder.write(*finished[0])
+    [snapshot] = load_l2_snapshots(str(tmp_path), "ETHUSDT", mmap=False)
+    assert int(snapshot["price_decimals"]) == 2
+    assert int(snapshot["quantity_decimals"]) == 4
+    assert snapshot["bid_prices"].tolist() == [[10000, 0]]
+    assert snapshot["ask_quantities"].tolist() == [[20000, 0]]
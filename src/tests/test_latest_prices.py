@@ -0,0 +1,48 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from service.latest_prices import LatestPriceStore
+
+
+def price(symbol, value, second):
+    return {"timestamp": datetime(2024, 5, 1, 12, 0, second, tzinfo=timezone.utc), "symbol": symbol,
+            "source": "binance", "price": value, "baseCurrency": symbol[:-4], "quoteCurrency": "USDT"}
+
+
+@pytest.mark.asyncio
+async def test_only_changed_prices_are_written_in_one_bulk_write(mongo_helper):
+    # ETHUSDT was stored before a restart at the price it trades at now
+    mongo_helper.seed("latest_prices", [dict(price("ETHUSDT", 3000.0, 0), _id="binance:ETHUSDT")])
+    store = LatestPriceStore(mongo_helper)
+
+    written = await store.update("binance", [price("BTCUSDT", 60000.0, 1), price("ETHUSDT", 3000.0, 1)],
+                                 {"btc": 60000.0, "eth": 3000.0})
+    assert written == 1
+    await store.update("binance", [price("BTCUSDT", 60000.0, 2)], {"btc": 60000.0})
+    await store.update("binance", [price("BTCUSDT", 60100.0, 3), price("SOLUSDT", 150.0, 3)], {"btc": 60100.0})
+
+    # Nothing was written for the unchanged second interval
+    assert [collection for collection, _ in mongo_helper.bulk_writes] == ["latest_prices", "latest_prices"]
+    assert [[operation._filter["_id"] for operation in operations] for _, operations in mongo_helper.bulk_writes] == [
+        ["binance:BTCUSDT"], ["binance:BTCUSDT", "binance:SOLUSDT"]]
+    assert mongo_helper.bulk_writes[1][1][0]._doc["$set"]["price"] == 60100.0
+
+    assert store.get("binance", "BTCUSDT")["price"] == 60100.0
+    assert store.get("binance", "ETHUSDT")["price"] == 3000.0
+    assert store.get("kucoin", "BTCUSDT") is None
+    assert store.get_token_price("binance", "BTC") == 60100.0
+
+
+@pytest.mark.asyncio
+async def test_prices_of_a_failed_write_are_written_again(mongo_helper):
+    store = LatestPriceStore(mongo_helper)
+
+    mongo_helper.failures = 1
+    with pytest.raises(IOError):
+        await store.update("binance", [price("BTCUSDT", 60000.0, 1)])
+    assert store.get("binance", "BTCUSDT") is None
+
+    # Same price next interval, but it was never stored
+    assert await store.update("binance", [price("BTCUSDT", 60000.0, 2)]) == 1
+    assert store.get("binance", "BTCUSDT")["price"] == 60000.0
@@ -0,0 +1,149 @@
+import asyncio
+import datetime
+import json
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+import binance.multi_order_book
+from binance.multi_order_book import MinuteBookStats, MultiOrderBookManager
+from binance.sorted_book import SortedOrderBook
+
+MINUTE = 1_700_000_040  # a minute boundary
+
+
+def spread_book():
+    book = SortedOrderBook()
+    book.load_snapshot({"bids": [["100", "1"], ["97", "5"]], "asks": [["101", "2"]]})
+    return book
+
+
+def test_minute_stats_are_weighted_by_how_long_each_state_lasted():
+    stats = MinuteBookStats("BTCUSDT")
+    book = spread_book()
+    # Spread 1, mid 100.5 from :30; spread 2, mid 101, twice the ask volume from :50
+    stats.sample(book, MINUTE + 30)
+    book.apply_update({"b": [], "a": [["101", "0"], ["102", "4"]]})
+    stats.sample(book, MINUTE + 50)
+    # The next minute starts with the :50 state; the book is then invalid from 1:30
+    stats.sample(book, MINUTE + 70)
+    stats.invalidate(MINUTE + 90)
+    stats.roll(MINUTE + 120)
+
+    first, second = stats.completed
+    assert first["time"] == datetime.datetime.fromtimestamp(MINUTE, tz=datetime.timezone.utc)
+    assert first["covered_seconds"] == 30
+    assert first["avg_spread"] == pytest.approx((1 * 20 + 2 * 10) / 30)
+    assert first["max_spread"] == 2
+    assert first["avg_mid"] == pytest.approx((100.5 * 20 + 101 * 10) / 30)
+    assert first["last_mid"] == 101
+    # Within 2% of mid the 97 bid is out of range; the asks are 2 then 4
+    assert first["bid_volume_2pct"] == pytest.approx(1)
+    assert first["ask_volume_2pct"] == pytest.approx((2 * 20 + 4 * 10) / 30)
+    assert first["imbalance_2pct"] == pytest.approx((-1 / 3 * 20 + -3 / 5 * 10) / 30)
+
+    assert second["covered_seconds"] == 30
+    assert second["avg_spread"] == pytest.approx(2)
+    assert second["max_spread"] == 2
+    assert second["last_mid"] is None
+
+
+@pytest.mark.asyncio
+async def test_minute_stats_are_upserted_on_symbol_and_time(mongo_helper):
+    manager = MultiOrderBookManager(["btcusdt", "ethusdt"], mongo_helper=mongo_helper)
+    for symbol_book in manager.books.values():
+        symbol_book.minute_stats.sample(spread_book(), MINUTE + 10)
+
+    assert await manager.write_minute_stats(MINUTE + 60) == 2
+    [(collection_name, operations)] = mongo_helper.bulk_writes
+    assert collection_name == "order_book_stats"
+    minute = datetime.datetime.fromtimestamp(MINUTE, tz=datetime.timezone.utc)
+    assert [(operation._filter, operation._upsert) for operation in operations] == [
+        ({"symbol": "BTCUSDT", "time": minute}, True), ({"symbol": "ETHUSDT", "time": minute}, True)]
+
+    # Rewriting the same minute replaces its document instead of adding one
+    btc_stats = manager.books["BTCUSDT"].minute_stats
+    btc_stats.completed.append(dict(operations[0]._doc["$set"], covered_seconds=45.0))
+    assert await manager.write_minute_stats(MINUTE + 60) == 1
+    stored = mongo_helper.db["order_book_stats"].documents
+    assert [(document["symbol"], document["covered_seconds"]) for document in stored] == [
+        ("BTCUSDT", 45.0), ("ETHUSDT", 50.0)]
+
+
+class FakeDepthFeed:
+    """Serves each connection the combined-stream messages of the streams in its URL, then stays open."""
+
+    def __init__(self, messages):
+        self.messages = messages
+        self.urls = []
+        self.drained = 0
+
+    def connect(self, url, max_size=None):
+        self.urls.append(url)
+        streams = parse_qs(urlsplit(url).query)["streams"][0].split("/")
+        return FakeWebSocket(self, [message for message in self.messages if message["stream"] in streams])
+
+
+class FakeWebSocket:
+    def __init__(self, feed, messages):
+        self.feed = feed
+        self.messages = messages
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def __aiter__(self):
+        for message in self.messages:
+            await asyncio.sleep(0)
+            yield json.dumps(message)
+        self.feed.drained += 1
+        await asyncio.Event().wait()
+
+
+def depth_update(symbol, first_id, last_id, bids):
+    return {"stream": f"{symbol.lower()}@depth@100ms",
+            "data": {"e": "depthUpdate", "s": symbol, "U": first_id, "u": last_id, "b": bids, "a": []}}
+
+
+@pytest.mark.asyncio
+async def test_combined_streams_are_routed_to_each_book_across_connections(monkeypatch):
+    manager = MultiOrderBookManager(["btcusdt", "ethusdt", "solusdt"], symbols_per_connection=2)
+    manager.reconnect_delay = 0
+    snapshots = []
+
+    async def fetch_depth_snapshot(symbol):
+        snapshots.append(symbol)
+        return {"lastUpdateId": 100, "bids": [["10.00", "1"]], "asks": [["11.00", "1"]]}
+
+    monkeypatch.setattr(manager, "fetch_depth_snapshot", fetch_depth_snapshot)
+    feed = FakeDepthFeed([
+        depth_update("BTCUSDT", 90, 95, [["10.90", "1"]]),  # already in the snapshot
+        depth_update("BTCUSDT", 101, 102, [["10.50", "2"]]),
+        depth_update("ETHUSDT", 101, 101, [["10.60", "3"]]),
+        depth_update("SOLUSDT", 101, 104, [["10.70", "4"]]),
+        depth_update("ETHUSDT", 102, 103, [["10.60", "0"]]),
+    ])
+    monkeypatch.setattr(binance.multi_order_book.websockets, "connect", feed.connect)
+
+    assert manager.shards() == [["BTCUSDT", "ETHUSDT"], ["SOLUSDT"]]
+    tasks = [asyncio.create_task(manager.manage_connection(shard)) for shard in manager.shards()]
+
+    async def all_drained():
+        while feed.drained < len(tasks):
+            await asyncio.sleep(0)
+
+    await asyncio.wait_for(all_drained(), timeout=5)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    assert [parse_qs(urlsplit(url).query)["streams"] for url in feed.urls] == [
+        ["btcusdt@depth@100ms/ethusdt@depth@100ms"], ["solusdt@depth@100ms"]]
+    assert sorted(snapshots) == ["BTCUSDT", "ETHUSDT", "SOLUSDT"]
+    books = manager.books
+    assert [(symbol, book.last_update_id, book.book.best_bid) for symbol, book in books.items()] == [
+        ("BTCUSDT", 102, 10.5), ("ETHUSDT", 103, 10.0), ("SOLUSDT", 104, 10.7)]
+    assert books["ETHUSDT"].book.total_bid_volume == 1
@@ -0,0 +1,57 @@
+import time
+
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from service.rate_limiter import RateLimiter, TokenBucket
+
+
+@pytest.mark.asyncio
+async def test_bucket_runs_within_budget_then_paces():
+    bucket = TokenBucket(capacity=4, period=0.4)
+    started = time.monotonic()
+    for _ in range(4):
+        await bucket.acquire()
+    assert time.monotonic() - started < 0.05
+
+    # Reported usage by other clients leaves no tokens, so the next call waits one refill
+    bucket.observe_used(4)
+    await bucket.acquire()
+    assert time.monotonic() - started >= 0.09
+
+
+@pytest.mark.asyncio
+async def test_get_json_retries_throttled_requests_after_retry_after():
+    responses = [
+        web.json_response({"code": -1003}, status=429, headers={"Retry-After": "0"}),
+        web.Response(status=503),
+        web.json_response({"lastUpdateId": 1}, headers={"X-MBX-USED-WEIGHT-1M": "8"}),
+    ]
+    seen = []
+
+    async def depth(request):
+        seen.append(dict(request.query))
+        return responses[len(seen) - 1]
+
+    async def missing(request):
+        seen.append("missing")
+        return web.Response(status=404)
+
+    app = web.Application()
+    app.router.add_get("/api/v3/depth", depth)
+    app.router.add_get("/missing", missing)
+
+    limiter = RateLimiter(limits={"127.0.0.1": (10, 60.0)}, backoff_base=0.01)
+    async with TestServer(app, host="127.0.0.1") as server, aiohttp.ClientSession() as session:
+        snapshot = await limiter.get_json(session, str(server.make_url("/api/v3/depth")),
+                                          {"symbol": "BTCUSDT", "limit": 1000}, weight=2)
+        assert snapshot == {"lastUpdateId": 1}
+        assert seen == [{"symbol": "BTCUSDT", "limit": "1000"}] * 3
+        # Three attempts at weight 2 leave 4 tokens; the server reports 8 used, leaving 2
+        assert limiter.bucket("127.0.0.1").tokens < 3
+
+        # Client errors other than throttling are not retried
+        assert await limiter.get_json(session, str(server.make_url("/missing"))) is None
+        assert seen[3:] == ["missing"]
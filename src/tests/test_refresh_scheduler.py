@@ -0,0 +1,42 @@
+from coingecko.refresh_scheduler import (MIN_INTERVAL, RETRY_INTERVAL, TOP_UP_AHEAD, RefreshScheduler,
+                                         refresh_interval)
+
+
+def test_refresh_interval_by_rank_and_volatility():
+    assert refresh_interval(1) < refresh_interval(40) < refresh_interval(400) == refresh_interval(None)
+    assert refresh_interval(40, change_24h=-10) == refresh_interval(40) / 2
+    assert refresh_interval(1, change_24h=80) == MIN_INTERVAL
+
+
+def test_most_overdue_assets_come_first():
+    scheduler = RefreshScheduler()
+    scheduler.add("bitcoin", now=0)
+    scheduler.add("smallcap", now=0)
+    # Refreshed just before a restart, so it is not due for a while
+    scheduler.add("ethereum", refreshed_at=-10, rank=2, now=0)
+
+    assert scheduler.next_batch(2, now=0) == ["bitcoin", "smallcap"]
+    scheduler.complete("bitcoin", rank=1, now=5)
+    scheduler.complete("smallcap", rank=400, now=5)
+    assert scheduler.lag("smallcap", now=20) == 15
+
+    assert scheduler.next_batch(5, now=50) == ["ethereum"]
+    scheduler.retry("ethereum", now=50)
+    scheduler.remove("bitcoin")
+    scheduler.complete("bitcoin", rank=1, now=51)  # in flight when removed, stays removed
+    assert scheduler.next_batch(5, now=50 + RETRY_INTERVAL) == ["ethereum"]
+    assert scheduler.lag("ethereum", now=50 + RETRY_INTERVAL) == 60 + RETRY_INTERVAL
+
+
+def test_assets_not_yet_due_are_left_out_unless_taken_ahead():
+    scheduler = RefreshScheduler()
+    for coin_id, rank in (("bitcoin", 1), ("ethereum", 2), ("smallcap", 400)):
+        scheduler.add(coin_id, refreshed_at=0, rank=rank, now=0)
+
+    # Nothing is due before the top tier's interval has passed
+    assert scheduler.next_batch(250, now=30) == []
+    assert scheduler.next_due() == refresh_interval(1)
+    # A call with room takes the coins due within TOP_UP_AHEAD, not the whole universe
+    assert scheduler.next_batch(250, now=40, ahead=TOP_UP_AHEAD) == ["bitcoin", "ethereum"]
+    assert scheduler.next_batch(250, now=40, ahead=TOP_UP_AHEAD) == []
+    assert list(scheduler.due) == ["smallcap"]
@@ -0,0 +1,32 @@
+from service.shard_planner import estimate_rates, plan_shards, shard_loads
+
+
+def test_rates_fall_back_to_volume_at_the_counted_trades_per_dollar():
+    rates = estimate_rates({"BTCUSDT": 1000.0, "ETHUSDT": 500.0, "NEWUSDT": 100.0},
+                           {"BTCUSDT": 86400.0 * 4, "ETHUSDT": 86400.0 * 2})
+    assert rates == {"BTCUSDT": 4.0, "ETHUSDT": 2.0, "NEWUSDT": 0.4}
+
+
+def test_shards_are_balanced_and_replans_move_few_pairs():
+    # A few hot pairs and a long tail, like the hand-made split in SERVERS.md
+    rates = {"BTCUSDT": 40.0, "DOGEUSDT": 25.0, "PEPEUSDT": 20.0, "ETHUSDT": 18.0, "SOLUSDT": 12.0}
+    rates.update({f"TAIL{i}USDT": 1.0 + i % 3 for i in range(40)})
+    mean = sum(rates.values()) / 3
+
+    assignment = plan_shards(rates, 3)
+    assert set(assignment) == set(rates)
+    assert max(shard_loads(assignment, rates, 3)) <= mean * 1.05
+
+    # Volumes shift a little and a pair is listed: only a handful of pairs move
+    shifted = dict(rates, PEPEUSDT=30.0, NEWUSDT=5.0)
+    replanned = plan_shards(shifted, 3, previous=assignment)
+    moved = [pair for pair in assignment if replanned[pair] != assignment[pair]]
+    assert len(moved) <= 3
+    assert max(shard_loads(replanned, shifted, 3)) <= sum(shifted.values()) / 3 * 1.05
+
+    # Fewer shards: pairs of the removed shard are redistributed, the rest stay
+    merged = plan_shards(rates, 2, previous=assignment)
+    kept_moved = [pair for pair, shard in assignment.items() if shard < 2 and merged[pair] != shard]
+    assert len(kept_moved) <= 3
+    assert set(merged.values()) == {0, 1}
+    assert max(shard_loads(merged, rates, 2)) <= sum(rates.values()) / 2 * 1.05
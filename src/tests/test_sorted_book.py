@@ -0,0 +1,97 @@
+import random
+
+from binance.multi_order_book import SymbolBook
+from binance.sorted_book import SortedOrderBook, to_units
+
+
+def test_to_units_pads_and_truncates_decimals():
+    assert to_units("0.01230000", 8) == 1230000
+    assert to_units("42", 2) == 4200
+    assert to_units("1.5", 8) == 150000000
+    assert to_units("0.123456789", 8) == 12345678
+
+
+def test_snapshot_and_updates_maintain_best_prices_and_totals():
+    book = SortedOrderBook()
+    book.load_snapshot({
+        "lastUpdateId": 1,
+        "bids": [["100.00000000", "1.00000000"], ["99.50000000", "2.00000000"]],
+        "asks": [["100.50000000", "3.00000000"], ["101.00000000", "4.00000000"]],
+    })
+    assert book.best_bid == 100.0
+    assert book.best_ask == 100.5
+    assert book.total_bid_volume == 3.0
+    assert book.total_ask_volume == 7.0
+
+    book.apply_update({
+        "b": [["100.00000000", "0.00000000"], ["99.75000000", "0.50000000"]],
+        "a": [["100.25000000", "1.00000000"], ["101.00000000", "2.00000000"]],
+    })
+    assert book.best_bid == 99.75
+    assert book.best_ask == 100.25
+    assert book.total_bid_volume == 2.5
+    assert book.total_ask_volume == 6.0
+    assert len(book.bids) == 2
+    assert len(book.asks) == 3
+
+
+def test_deleting_missing_level_is_a_no_op():
+    book = SortedOrderBook()
+    book.apply_update({"b": [["1.00000000", "0.00000000"]], "a": []})
+    assert book.best_bid is None
+    assert book.total_bid_volume == 0
+
+
+def test_symbol_book_replays_buffered_diffs_after_snapshot():
+    symbol_book = SymbolBook("BTCUSDT")
+    symbol_book.on_diff({"U": 5, "u": 8, "b": [["1.00000000", "1.00000000"]], "a": []})
+    symbol_book.on_diff({"U": 9, "u": 12, "b": [["2.00000000", "1.00000000"]], "a": []})
+
+    assert symbol_book.load_snapshot({"lastUpdateId": 10, "bids": [], "asks": []})
+    assert symbol_book.last_update_id == 12
+    assert symbol_book.book.best_bid == 2.0
+
+
+def test_symbol_book_gap_requires_new_snapshot():
+    symbol_book = SymbolBook("BTCUSDT")
+    assert symbol_book.load_snapshot({"lastUpdateId": 10, "bids": [], "asks": []})
+
+    assert not symbol_book.on_diff({"U": 20, "u": 21, "b": [], "a": []})
+    assert not symbol_book.synced
+    # A snapshot older than the buffered diffs is rejected
+    assert not symbol_book.load_snapshot({"lastUpdateId": 15, "bids": [], "asks": []})
+    assert symbol_book.load_snapshot({"lastUpdateId": 19, "bids": [], "asks": []})
+    assert symbol_book.last_update_id == 21
+
+
+def test_band_volumes_match_a_brute_force_sum():
+    rng = random.Random(7)
+    book = SortedOrderBook()
+    book.load_snapshot({"bids": [["99.00", "1"]], "asks": [["101.00", "1"]]})
+    center = 100.0
+    anchors = set()
+    for step in range(400):
+        if step % 100 == 99:
+            # Lift the asks and drift further than the widest band, so the bucket window is rebuilt
+            book.apply_update({"b": [], "a": [[f"{price / 10 ** 8:.2f}", "0"] for price in list(book.asks.prices)]})
+            center *= 1.03
+        is_bid = rng.random() < 0.5
+        side = book.bids if is_bid else book.asks
+        if rng.random() < 0.2 and side.prices:
+            price, quantity = f"{rng.choice(side.prices) / 10 ** 8:.2f}", "0"
+        else:
+            offset = rng.uniform(0.0001, 0.03) * center
+            price = f"{center - offset if is_bid else center + offset:.2f}"
+            quantity = f"{rng.uniform(0.1, 5):.8f}"
+        book.apply_update({"b": [[price, quantity]], "a": []} if is_bid else {"b": [], "a": [[price, quantity]]})
+        if book.bids.best is None or book.asks.best is None:
+            continue
+
+        mid = (book.bids.best + book.asks.best) // 2
+        for band_pct in (0.1, 0.5, 1.0, 2.0):
+            edge = int(mid * band_pct / 100)
+            expected = (sum(q for p, q in book.bids.quantities.items() if p >= mid - edge),
+                        sum(q for p, q in book.asks.quantities.items() if p <= mid + edge))
+            assert book.bands.volumes(mid, band_pct) == expected
+        anchors.add(book.bands.anchor)
+    assert len(anchors) > 3
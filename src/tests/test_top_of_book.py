@@ -0,0 +1,53 @@
+import math
+
+import pytest
+
+import binance.transactions
+from binance.transactions import BinanceWebSocket
+from service.top_of_book import TopOfBook
+
+
+def test_spread_is_weighted_by_how_long_each_quote_was_live():
+    top_of_book = TopOfBook(["BTCUSDT"])
+    top_of_book.update("BTCUSDT", 100.0, 101.0, now=0.0)
+    top_of_book.update("BTCUSDT", 100.0, 103.0, now=10.0)
+    top_of_book.update("BTCUSDT", 101.0, 102.0, now=15.0)
+
+    assert top_of_book.close_interval(now=20.0) == {
+        "BTCUSDT": {"avg_spread": (1 * 10 + 3 * 5 + 1 * 5) / 20, "max_spread": 3.0, "mid_price": 101.5}}
+    # A quiet interval reports the quote carried over from the last one
+    assert top_of_book.close_interval(now=30.0) == {
+        "BTCUSDT": {"avg_spread": 1.0, "max_spread": 1.0, "mid_price": 101.5}}
+
+
+def test_quote_received_at_the_interval_end_is_its_own_average():
+    top_of_book = TopOfBook(["BTCUSDT"])
+    top_of_book.update("BTCUSDT", 100.0, 100.5, now=5.0)
+    assert top_of_book.close_interval(now=5.0)["BTCUSDT"]["avg_spread"] == 0.5
+
+
+def test_symbols_without_quotes_are_left_out():
+    top_of_book = TopOfBook(["BTCUSDT", "ETHUSDT", "SOLUSDT"])
+    assert top_of_book.close_interval(now=1.0) == {}
+
+    top_of_book.update("ETHUSDT", 3000.0, 3000.5, now=1.0)
+    top_of_book.update("DOGEUSDT", 0.1, 0.2, now=1.0)  # not tracked
+    assert list(top_of_book.close_interval(now=2.0)) == ["ETHUSDT"]
+    assert math.isnan(top_of_book.bid[top_of_book.index["BTCUSDT"]])
+
+
+@pytest.mark.asyncio
+async def test_book_ticker_messages_are_told_apart_by_their_missing_event_type(monkeypatch, mongo_helper):
+    monkeypatch.setattr(binance.transactions, "start_http_server", lambda port: None)
+    websocket = BinanceWebSocket(["BTCUSDT"], mongo_helper, "transactions_stats", "big_transactions",
+                                 book_ticker=True)
+
+    await websocket.handle_message({"u": 400900217, "s": "BTCUSDT", "b": "60000.10", "B": "3.1",
+                                    "a": "60000.30", "A": "4.2"})
+    # Trade events carry buyer and seller order ids in 'b' and 'a'
+    await websocket.handle_message({"e": "trade", "E": 1714564800001, "s": "BTCUSDT", "t": 12345, "p": "60000.20",
+                                    "q": "0.5", "b": 88, "a": 50, "T": 1714564800000, "m": False, "M": True})
+
+    assert websocket.top_of_book.close_interval(now=websocket.top_of_book.updated_at[0]) == {
+        "BTCUSDT": {"avg_spread": pytest.approx(0.2), "max_spread": pytest.approx(0.2), "mid_price": 60000.2}}
+    assert [trade["price"] for trade in websocket.transactions["BTCUSDT"]["buy"]] == [60000.2]
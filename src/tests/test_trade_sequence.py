@@ -0,0 +1,55 @@
+from service.trade_sequence import TradeSequenceTracker
+
+
+def test_duplicates_are_dropped_and_gaps_counted_until_filled():
+    tracker = TradeSequenceTracker(window=8)
+    assert [tracker.observe("BTCUSDT", trade_id) for trade_id in (1, 2, 2, 5)] == [True, True, False, True]
+    assert tracker.missed_total["BTCUSDT"] == 2
+    assert tracker.duplicate_total["BTCUSDT"] == 1
+
+    # A late trade fills part of the gap, replaying it again is a duplicate
+    assert tracker.observe("BTCUSDT", 3)
+    assert not tracker.observe("BTCUSDT", 3)
+    assert tracker.missed_total["BTCUSDT"] == 1
+    assert tracker.pop_interval_counts() == {"BTCUSDT": (1, 2)}
+
+    # Ids that fell out of the window cannot be told apart from replays
+    assert tracker.observe("BTCUSDT", 20)
+    assert not tracker.observe("BTCUSDT", 4)
+    assert tracker.missed_total["BTCUSDT"] == 15
+    assert tracker.pop_interval_counts() == {"BTCUSDT": (14, 1)}
+
+
+def test_interval_counts_are_reset_for_symbols_without_trades():
+    tracker = TradeSequenceTracker()
+    tracker.observe("BTCUSDT", 1)
+    tracker.observe("ETHUSDT", 1)
+    tracker.observe("ETHUSDT", 1)
+    assert tracker.pop_interval_counts() == {"BTCUSDT": (0, 0), "ETHUSDT": (0, 1)}
+
+    # ETHUSDT is quiet in the next interval: its duplicate is not reported again
+    tracker.observe("BTCUSDT", 2)
+    assert tracker.pop_interval_counts() == {"BTCUSDT": (0, 0), "ETHUSDT": (0, 0)}
+    assert tracker.duplicate_total["ETHUSDT"] == 1
+
+
+def test_sequences_without_gap_counting():
+    tracker = TradeSequenceTracker(count_gaps=False)
+    assert [tracker.observe("BTC-USDT", sequence) for sequence in (10, 40, 40, 25)] == [True, True, False, True]
+    assert tracker.pop_interval_counts() == {"BTC-USDT": (0, 1)}
+
+
+def test_aggregated_trades_count_duplicate_fills():
+    tracker = TradeSequenceTracker(window=8)
+    assert tracker.observe("BTCUSDT", 3, first_id=1)
+    assert tracker.observe("BTCUSDT", 9, first_id=7)
+    assert tracker.missed_total["BTCUSDT"] == 3
+
+    # A replay of 7..9 duplicates three fills, the late 4..6 fills the gap
+    assert not tracker.observe("BTCUSDT", 9, first_id=7)
+    assert tracker.observe("BTCUSDT", 6, first_id=4)
+    assert tracker.pop_interval_counts() == {"BTCUSDT": (0, 3)}
+
+    # 1..3 is partly beyond the window of 2..9 now, all three fills count
+    assert not tracker.observe("BTCUSDT", 3, first_id=1)
+    assert tracker.duplicate_total["BTCUSDT"] == 6
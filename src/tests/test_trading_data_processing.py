@@ -0,0 +1,126 @@
+from datetime import datetime
+
+import pytest
+
+from data_processing.archive_policy import ArchivePolicy, STATS_POLICY
+from data_processing.trading_data_processing import TradingDataProcessor
+
+
+@pytest.fixture
+def processor(mongo_client, s3_helper):
+    return TradingDataProcessor("bitpulse", delete_chunk_size=2, client=mongo_client, s3_helper=s3_helper)
+
+
+def archived_groups(mongo_client, archive_collection, hours):
+    """Store `hours` hourly groups with their manifest entries; return them as the delete stage gets them."""
+    database = mongo_client["bitpulse"]
+    collection = archive_collection(hours)
+    database[STATS_POLICY.collection_name].documents.extend(collection.documents)
+    groups = []
+    for key, group in collection.iter_groups():
+        documents = group.pop("documents")
+        groups.append(dict(group, key=key, document_count=len(documents)))
+        database[STATS_POLICY.manifest_collection].documents.append({"_id": key, "deleted": False})
+    return groups
+
+
+def deleted_keys(mongo_client):
+    manifest = mongo_client["bitpulse"][STATS_POLICY.manifest_collection]
+    return sorted(entry["_id"] for entry in manifest.documents if entry["deleted"])
+
+
+def test_failed_chunk_stays_unverified(processor, mongo_client, archive_collection):
+    groups = archived_groups(mongo_client, archive_collection, 4)
+    collection = mongo_client["bitpulse"][STATS_POLICY.collection_name]
+    collection.failures = 1
+
+    assert processor.delete_confirmed_groups(groups) == 6
+    assert [group["key"] for group in processor.unverified_groups] == [group["key"] for group in groups[:2]]
+    assert sorted({doc["_id"].split("-")[0] for doc in collection.documents}) == ["0", "1"]
+    # Only the chunk that was deleted and counted empty is marked in the manifest
+    assert deleted_keys(mongo_client) == [group["key"] for group in groups[2:]]
+    assert not processor.verify_deletion()
+
+
+def test_chunk_with_remaining_documents_stays_unverified(processor, mongo_client, archive_collection):
+    groups = archived_groups(mongo_client, archive_collection, 4)
+    collection = mongo_client["bitpulse"][STATS_POLICY.collection_name]
+
+    def late_insert():
+        # A late write lands in hour 0 right after the first chunk was deleted
+        collection.after_write = None
+        collection.documents.append({"_id": "late", "timestamp": datetime(2024, 1, 1, 0, 30),
+                                     "symbol": "BTCUSDT", "source": "binance"})
+
+    collection.after_write = late_insert
+
+    assert processor.delete_confirmed_groups(groups) == 12
+    assert [group["key"] for group in processor.unverified_groups] == [group["key"] for group in groups[:2]]
+    assert [doc["_id"] for doc in collection.documents] == ["late"]
+    assert deleted_keys(mongo_client) == [group["key"] for group in groups[2:]]
+
+
+def test_verified_chunks_are_marked_deleted(processor, mongo_client, archive_collection):
+    groups = archived_groups(mongo_client, archive_collection, 3)
+
+    assert processor.delete_confirmed_groups(groups) == 9
+    assert processor.unverified_groups == []
+    assert deleted_keys(mongo_client) == [group["key"] for group in groups]
+    assert processor.verify_deletion()
+
+
+def stats_document(symbol, timestamp, buy_count=0):
+    return {"_id": f"{symbol}-{timestamp:%H%M%S}", "timestamp": timestamp, "symbol": symbol, "source": "binance",
+            "buy_count": buy_count}
+
+
+def test_groups_are_yielded_as_the_sort_key_changes(processor, mongo_client):
+    collection = mongo_client["bitpulse"][STATS_POLICY.collection_name]
+    collection.documents.extend([
+        stats_document("ETHUSDT", datetime(2024, 1, 1, 0, 5)),
+        stats_document("BTCUSDT", datetime(2024, 1, 1, 1, 0)),
+        stats_document("BTCUSDT", datetime(2024, 1, 1, 0, 59, 59)),
+        stats_document("BTCUSDT", datetime(2024, 1, 1, 0, 0)),
+        stats_document("ETHUSDT", datetime(2024, 1, 1, 2, 0)),
+        # Not past retention yet
+        stats_document("ETHUSDT", datetime.utcnow()),
+    ])
+
+    groups = list(processor.iter_groups())
+
+    assert [(key, len(group["documents"])) for key, group in groups] == [
+        ("BTCUSDT_binance_2024-01-01_00", 2), ("BTCUSDT_binance_2024-01-01_01", 1),
+        ("ETHUSDT_binance_2024-01-01_00", 1), ("ETHUSDT_binance_2024-01-01_02", 1)]
+    # The last group is yielded once the cursor is exhausted
+    _, last = groups[-1]
+    assert (last["start_time"], last["end_time"]) == (datetime(2024, 1, 1, 2), datetime(2024, 1, 1, 3))
+    assert last["partition"] == {"symbol": "ETHUSDT", "source": "binance"}
+    [cursor] = collection.cursors
+    assert cursor.closed
+
+
+def test_cursor_is_closed_when_the_consumer_stops_early(processor, mongo_client, archive_collection):
+    collection = mongo_client["bitpulse"][STATS_POLICY.collection_name]
+    collection.documents.extend(archive_collection(3).documents)
+
+    groups = processor.iter_groups()
+    assert next(groups)[0] == "BTCUSDT_binance_2024-01-01_00"
+    [cursor] = collection.cursors
+    assert not cursor.closed
+
+    groups.close()
+    assert cursor.closed
+
+
+def test_manifest_is_indexed_and_loaded_by_the_policy_partition_keys(mongo_client, s3_helper):
+    policy = ArchivePolicy("funding_rates", partition_keys=("symbol",), granularity="day")
+    processor = TradingDataProcessor("bitpulse", policy=policy, client=mongo_client, s3_helper=s3_helper)
+    manifest = mongo_client["bitpulse"][policy.manifest_collection]
+
+    assert manifest.indexes == [[("symbol", 1), ("hour", 1)]]
+    manifest.documents.extend([
+        {"_id": "BTCUSDT_2024-01-01", "symbol": "BTCUSDT", "hour": datetime(2024, 1, 1), "rows": 5},
+        {"_id": "ETHUSDT_2024-01-01", "symbol": "ETHUSDT", "hour": datetime(2024, 1, 1), "rows": 7},
+    ])
+    assert processor.manifest.load_rows({"symbol": "BTCUSDT"}, datetime(2024, 1, 1)) == {
+        "BTCUSDT_2024-01-01": {"rows": 5, "deleted": False}}
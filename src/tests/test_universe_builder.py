@@ -0,0 +1,85 @@
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from coingecko.universe_builder import BinanceSource, ExchangeInfoCache, KucoinSource, UniverseBuilder
+from service.rate_limiter import RateLimiter
+
+EXCHANGE_INFO = {"symbols": [
+    {"symbol": "BTCUSDT", "baseAsset": "BTC", "quoteAsset": "USDT", "status": "TRADING"},
+    {"symbol": "ETHUSDT", "baseAsset": "ETH", "quoteAsset": "USDT", "status": "TRADING"},
+    {"symbol": "ETHBTC", "baseAsset": "ETH", "quoteAsset": "BTC", "status": "TRADING"},
+    {"symbol": "LUNAUSDT", "baseAsset": "LUNA", "quoteAsset": "USDT", "status": "BREAK"},
+]}
+BINANCE_TICKERS = [
+    {"symbol": symbol, "quoteVolume": volume, "lastPrice": price, "priceChangePercent": "1.5",
+     "highPrice": price, "lowPrice": price}
+    for symbol, volume, price in [("BTCUSDT", "7000", "90000.5"), ("ETHUSDT", "3000", "3200"),
+                                  ("ETHBTC", "99999", "0.035"), ("LUNAUSDT", "99999", "1")]
+]
+KUCOIN_SYMBOLS = {"data": [
+    {"symbol": "BTC-USDT", "baseCurrency": "BTC", "quoteCurrency": "USDT", "enableTrading": True},
+    {"symbol": "PEPE-USDT", "baseCurrency": "PEPE", "quoteCurrency": "USDT", "enableTrading": True},
+    {"symbol": "NOPE-USDT", "baseCurrency": "NOPE", "quoteCurrency": "USDT", "enableTrading": True},
+]}
+KUCOIN_TICKERS = {"data": {"ticker": [
+    {"symbol": symbol, "volValue": volume, "last": "1", "changeRate": "0.05", "high": "1", "low": "1"}
+    for symbol, volume in [("BTC-USDT", "500"), ("PEPE-USDT", "4000"), ("NOPE-USDT", "1")]
+]}}
+MARKETS = [
+    {"id": "bitcoin", "symbol": "btc", "market_cap": 1800},
+    {"id": "ethereum", "symbol": "eth", "market_cap": 400},
+    {"id": "pepe", "symbol": "pepe", "market_cap": 8},
+    {"id": "pepe-copy", "symbol": "pepe", "market_cap": 1},
+]
+
+
+@pytest.mark.asyncio
+async def test_pairs_are_merged_by_coingecko_id_in_one_bulk_write(tmp_path, mongo_helper):
+    requests = []
+
+    def route(path, body):
+        async def handler(request):
+            requests.append(path)
+            return web.json_response(body)
+        return path, handler
+
+    app = web.Application()
+    for path, body in [("/api/v3/exchangeInfo", EXCHANGE_INFO), ("/api/v3/ticker/24hr", BINANCE_TICKERS),
+                       ("/api/v1/symbols", KUCOIN_SYMBOLS), ("/api/v1/market/allTickers", KUCOIN_TICKERS),
+                       ("/coins/markets", MARKETS)]:
+        app.router.add_get(*route(path, body))
+
+    async with TestServer(app) as server:
+        url = str(server.make_url("")).rstrip("/")
+        builder = UniverseBuilder(mongo_helper, sources=[BinanceSource(url), KucoinSource(url)], top=2,
+                                  coingecko_pages=1, coingecko_url=url, cache=ExchangeInfoCache(str(tmp_path)),
+                                  rate_limiter=RateLimiter())
+        async with aiohttp.ClientSession() as session:
+            documents = await builder.build(session)
+            # Symbol lists come from the cache on the next run
+            await builder.build(session)
+        # A pair that dropped out of the universe since the last run
+        mongo_helper.seed("target_pairs", [{"id": "dogecoin", "source": ["binance"]}])
+        summary = await builder.write(documents, prune=True)
+
+    assert requests.count("/api/v3/exchangeInfo") == requests.count("/api/v1/symbols") == 1
+    assert requests.count("/api/v3/ticker/24hr") == requests.count("/coins/markets") == 2
+
+    assert [document["id"] for document in documents] == ["bitcoin", "pepe"]
+    bitcoin, pepe = documents
+    assert bitcoin["source"] == ["binance", "kucoin"]
+    assert bitcoin["volume_usd"] == 7500.0
+    assert bitcoin["price"] == 90000.5
+    assert bitcoin["exchanges"]["kucoin"]["symbol"] == "BTC-USDT"
+    assert pepe["source"] == ["kucoin"]
+    assert pepe["price_change_pct"] == 5.0
+    assert (bitcoin["rank"], pepe["rank"]) == (1, 2)
+
+    [(collection_name, operations)] = mongo_helper.bulk_writes
+    assert collection_name == "target_pairs"
+    assert [operation._filter for operation in operations] == [
+        {"id": "bitcoin"}, {"id": "pepe"}, {"id": {"$nin": ["bitcoin", "pepe"]}}]
+    assert summary == {"upserted": 2, "modified": 0, "deleted": 1}
+    assert sorted(mongo_helper.keyed("target_pairs", "id")) == ["bitcoin", "pepe"]